@@ -11,7 +11,27 @@ pro-128k
 lite
 """
 max_thread_num = 8
-""" Maximum number of threads for parallel processing """
+""" 对话请求的最大并发数（所有模块共用一个请求池） """
+max_embedding_concurrency = 2
+""" 嵌入请求的最大并发数，讯飞的嵌入接口超过2时返回code=11202 """
+rate_limits = {
+    # "Pro/deepseek-ai/DeepSeek-V3": {"rpm": 1000, "tpm": 50000},
+}
+""" 每个模型的限额（每分钟请求数rpm、每分钟token数tpm），按服务商的配额填写；None表示不限 """
+default_rate_limit = {"rpm": None, "tpm": None}
+""" 不在rate_limits中的模型使用的限额 """
+throttle_retries = 5
+""" 遇到429/503时在同一模型上退避重试的次数，超过后换用extra_models """
+prefix_scheduling = True
+""" 按系统提示词分组发送请求，每组先发一条预热请求，以便复用服务商的提示词缓存 """
+prompt_cache_min_prefix = 1024
+""" 估算节省量时，共同前缀至少这么长（字符数，约等于token数）才算命中提示词缓存 """
+batch_poll_interval = 10
+""" 批处理任务的初始轮询间隔（秒），每次轮询后乘以1.5 """
+batch_poll_max_interval = 300
+""" 批处理轮询间隔的上限（秒） """
+batch_timeout = 24 * 3600
+""" 批处理任务等待超过这么多秒后放弃 """
 # extra_models = ["generalv3.5", "max-32k", "generalv3", "pro-128k", "lite"]
 
 extra_models = [
@@ -46,6 +66,18 @@ silicon_api_key = os.getenv("silicon_api_key","") # SiliconFlow API key, if appl
 openai_api_key = os.getenv("openai_api_key","") # OpenAI API key, if applicable
 glm_api_key = os.getenv("chatglm_api_key","") # ChatGLM API key, if applicable
 model_provider = "silicon"  # 'openai', 'chatglm', 'silicon', 'spark'
+model_base_url = os.getenv("model_base_url","")
+""" 覆盖服务商的base_url，例如指向本地的utils/mock_server.py """
+embedding_url = os.getenv("embedding_url","https://emb-cn-huabei-1.xf-yun.com/")
+""" 讯飞嵌入接口的地址 """
+embedding_provider = "xfyun"
+""" 'xfyun' 一次请求一条文本；'openai' 使用model_provider的OpenAI兼容/embeddings接口，一次请求多条 """
+embedding_model = "embedding-3"
+""" embedding_provider='openai'时使用的模型，向量维度需为embedding_dim """
+embedding_batch_size = 16
+""" embedding_provider='openai'时每个请求包含的文本数 """
+embedding_dim = 2048
+""" 嵌入向量的维度，也用于区分EmbeddingStore中的向量文件 """
 num_dims=2560
 qa_temp = 1.3
 # APP configs
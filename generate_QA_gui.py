@@ -84,7 +84,7 @@ class QAWindow(QWidget):
         self.kg.load_knowledge_graph(self.graph_path)
 
         # 用户选择知识点
-        concepts = list(self.kg.graph.nodes)
+        concepts = self.kg.concepts()
         if not concepts:
             QMessageBox.warning(self, "错误", "知识图谱为空")
             self.close()
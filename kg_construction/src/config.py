@@ -18,14 +18,53 @@ if not openai_api_key is None:
     base_url="https://api.openai.com/v1",
     )
     
-max_thread_num = 20
+# 请求的并发数由根目录config.py的max_thread_num/max_embedding_concurrency统一控制（共享请求池）
 if 'meta_path' in os.environ:
     metadata_path = os.environ['meta_path'] # 路径地址
 if 'raw_path' in os.environ:
     raw_path = os.environ['raw_path'] # 原始数据路径
 graph_structure_path = os.path.join(metadata_path, "graph")
+# 图结构的读取方式："columnar"读取graph/.columnar下的列式副本（JSON改动后自动重建），"json"每次解析JSON
+graph_storage_backend = "columnar"
+# save_json/load_json的序列化后端："auto"有orjson时使用orjson，"json"使用标准库
+json_backend = "auto"
+json_pretty = False  # True时缩进输出，便于调试时阅读
+# realloc_id默认保持已有id不变（删除留下空洞），空洞占id范围的比例超过该阈值时才整体重新编号
+id_compaction_threshold = 0.3
 engine_cache_path = os.path.join(metadata_path, "engine")
+# 向量检索的索引类型："flat"精确检索；"hnsw"、"ivfpq"、"opq"(OPQ+IVF-PQ)为近似检索，向量多时内存和查询耗时更低；
+# "auto"按向量数选择；也可以直接写faiss.index_factory的描述串
+engine_index = "flat"
+engine_min_train_size = 10000  # 需要训练的索引(IVF/PQ)至少要有这么多向量，否则退回flat
+engine_nprobe = 16  # IVF每次查询的聚类数
+engine_ef_search = 64  # HNSW查询时的候选集大小
+# 插入时把向量归一化为单位长度并使用内积索引：L2距离与余弦相似度一一对应(d² = 2 - 2cos)
+engine_normalize = True
+engine_pca_dim = None  # 例如256：先用PCA降维（2048→256）以节省内存，需要至少这么多向量来训练
+# 共享向量区：实体/章节/标题的向量只保存一次，各类节点是其上的子索引（见utils/vector_arena.py）
+vector_arena_path = os.path.join(engine_cache_path, "arena")
 request_cache_path = os.path.join(metadata_path, "cache")
+# 长阶段(identical_predict/connection_predict)的预写日志，中断后从日志恢复
+wal_path = os.path.join(metadata_path, "wal")
+wal_snapshot_every = 200  # 每多少条日志记录做一次快照
+# 关系预测的候选实体对：每个实体取向量最近的candidate_knn_k个实体，
+# 以及图上得分最高的candidate_graph_k个实体（共同邻居的AA得分、同一章节下的实体）
+candidate_knn_k = 20
+candidate_graph_k = 10
+# identical_predict/identical_merge只检查余弦相似度不低于这个值的实体对，与engine_normalize无关；
+# 0.85 约等于原来单位向量上的L2距离阈值0.55（cos = 1 - 0.55²/2）
+identical_threshold = 0.85
+# connection_predict每一轮同时请求的候选边数（每条连接两个不同的分量）
+connection_batch_size = 64
+# 嵌入向量缓存，键为hash(text, model)，向量存放在内存映射文件中
+embedding_store_enabled = True
+embedding_store_path = os.path.join(metadata_path, "embeddings")
+# 请求级缓存(cache/requests.sqlite)，键为hash(model, prompt, input, temperature, response_format)
+request_cache_enabled = True
+request_cache_max_entries = None  # 最多保留的条数，None表示不限
+request_cache_max_age = None  # 条目存活时间(秒)，None表示不过期
+# 离线阶段(augmented_generation)的请求方式："online"逐条并发请求，"batch"使用服务商的批处理接口
+offline_request_mode = "online"
 extra_models = [
     "Pro/THUDM/glm-4-9b-chat",
     "THUDM/glm-4-9b-chat",
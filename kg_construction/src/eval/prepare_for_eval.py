@@ -2,7 +2,7 @@ import json
 import os
 from src.utils.id_operation import graph_structure, GraphStructureType
 from src.config import metadata_path
-from src.utils.engine import initial_engine_with_str
+from src.utils.engine import embed_strings, initial_engine_with_str
 from src.utils.file_operation import load_json
 from src.model.entity import Entity
 def internal2uniform(data_root: str = metadata_path):
@@ -52,16 +52,17 @@ def internal2uniform(data_root: str = metadata_path):
     engine_path = os.path.join(eval_root, "engine")
     if not os.path.exists(engine_path):
         os.makedirs(engine_path)
-    engine = initial_engine_with_str(
+    initial_engine_with_str(
         titles,
         os.path.join(engine_path, "engine.ann"),
         os.path.join(engine_path, "table.json"),
     )
-    # meta
+    # meta：写出嵌入模型的原始向量，而不是引擎中归一化/降维后的向量
+    embeddings = embed_strings(titles, os.path.join(engine_path, "engine.json"))
     for ent in data_uniform_node:
         if "title" not in ent.keys():
             ent["title"] = ent["name"]
-        embedding = engine.get_vector_by_id(ent["id"])
+        embedding = embeddings[ent["id"]]
         ent["embedding"] = embedding
         ent["embedding"] = [float(e) for e in ent["embedding"]]
     with open(os.path.join(eval_root, "nodes.json"), "w", encoding="utf-8") as f:
@@ -78,10 +79,11 @@ def external2uniform(data_root: str):
         os.path.join(data_root, "engine", "table.json"),
     )
     engine.save_state(os.path.join(data_root, "engine"))
+    embeddings = embed_strings(node_names, os.path.join(data_root, "engine", "engine.json"))
     for ent in nodes:
         if "title" not in ent.keys():
             ent["title"] = ent["name"]
-        embedding = engine.get_vector_by_id(ent["id"])
+        embedding = embeddings[ent["id"]]
         ent["embedding"] = embedding
         ent["embedding"] = [float(e) for e in ent["embedding"]]
     with open(os.path.join(data_root, "nodes.json"), "w", encoding="utf-8") as f:
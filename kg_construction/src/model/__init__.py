@@ -3,4 +3,5 @@ from .relation import Relation
 from .section import Section
 from .chunk import Chunk
 from .example import Example
-all = ['Entity', 'Relation','Section','Chunk','Counter','BatchRequest','BatchRequestManager']
\ No newline at end of file
+from .table import EntityTable, RelationTable
+all = ['Entity', 'Relation','Section','EntityTable','RelationTable','Chunk','Counter','BatchRequest','BatchRequestManager']
\ No newline at end of file
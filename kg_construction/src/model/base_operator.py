@@ -3,6 +3,7 @@ import json
 from ...src.model import Section, Relation, Entity
 import os
 from ...src.config import final_prompt_path
+from config import embedding_dim
 from ...src.utils.id_operation import get_adjacency_matrix
 
 Max_len = 800
@@ -424,7 +425,7 @@ class EmbeddingEntityoperation(KGoperator):
             if len(self.user_input[i]) > Max_len:
                 self.user_input[i] = self.user_input[i][:Max_len]
         self.return_type = "raw"
-        self.default = [0.0] * 2048
+        self.default = [0.0] * embedding_dim
 
 
 class Embeddingstroperation(KGoperator):
@@ -437,7 +438,7 @@ class Embeddingstroperation(KGoperator):
             if len(self.user_input[i]) > Max_len:
                 self.user_input[i] = self.user_input[i][:Max_len]
         self.return_type = "raw"
-        self.default = [0.0] * 2048
+        self.default = [0.0] * embedding_dim
 
 
 class EmbeddingSectionoperation(KGoperator):
@@ -452,7 +453,7 @@ class EmbeddingSectionoperation(KGoperator):
             if len(self.user_input[i]) > Max_len:
                 self.user_input[i] = self.user_input[i][:Max_len]
         self.return_type = "raw"
-        self.default = [0.0] * 2048
+        self.default = [0.0] * embedding_dim
 
 
 class RelationExtractionoperation(KGoperator):
@@ -1,12 +1,22 @@
 import json
+import os
 from zhipuai import ZhipuAI
 import time
 import logging as log
 class BatchRequest:
-    def __init__(self, custom_id: str, model: str, system_prompt: str, user_input: str):
+    def __init__(
+        self,
+        custom_id: str,
+        model: str,
+        system_prompt: str,
+        user_input: str,
+        url: str = "/v4/chat/completions",
+        temperature: float = 0.1,
+        response_format: dict | None = None,
+    ):
         self.custom_id = custom_id
         self.method = "POST"
-        self.url = "/v4/chat/completions"
+        self.url = url
         self.body = {
             "model": model,
             "messages": [
@@ -19,9 +29,11 @@ class BatchRequest:
                     "content": user_input
                 }
             ],
-            "temperature": 0.1
+            "temperature": temperature
         }
-        
+        if response_format is not None:
+            self.body["response_format"] = response_format
+
 
     def to_dict(self) -> dict:
         """将结构体转换为字典格式"""
@@ -32,99 +44,166 @@ class BatchRequest:
             "body": self.body
         }
 class BatchRequestManager:
-    def __init__(self, system_prompt: str, user_input: list,model: str,file_path: str,api_key:str):
+    def __init__(
+        self,
+        system_prompt: str | list[str],
+        user_input: list,
+        model: str,
+        file_path: str,
+        api_key: str = None,
+        client=None,
+        endpoint: str = "/v4/chat/completions",
+    ):
+        """
+        system_prompt可以是所有请求共用的一个，也可以与user_input一一对应
+        client为None时使用api_key创建ZhipuAI客户端；也可以传入OpenAI兼容的客户端，
+        此时endpoint应为"/v1/chat/completions"
+        """
+        if isinstance(system_prompt, str):
+            system_prompt = [system_prompt] * len(user_input)
         self.system_prompt = system_prompt
         self.user_input = user_input
         self.model = model
         self.file_path=file_path
-        self.client=ZhipuAI(api_key=api_key)
+        self.endpoint = endpoint
+        self.client=client if client is not None else ZhipuAI(api_key=api_key)
+        self.requests = [
+            BatchRequest(f"{model}_{i}", model, prompt, user, url=endpoint)
+            for i, (prompt, user) in enumerate(zip(system_prompt, user_input))
+        ]
+    @classmethod
+    def from_requests(
+        cls,
+        requests: list[BatchRequest],
+        file_path: str,
+        client,
+        endpoint: str = "/v4/chat/completions",
+    ) -> "BatchRequestManager":
+        """由任意的BatchRequest列表构造，每个请求可以有不同的提示词和参数"""
+        manager = cls.__new__(cls)
+        manager.system_prompt = [req.body["messages"][0]["content"] for req in requests]
+        manager.user_input = [req.body["messages"][1]["content"] for req in requests]
+        manager.model = requests[0].body["model"] if requests else ""
+        manager.file_path = file_path
+        manager.endpoint = endpoint
+        manager.client = client
+        manager.requests = requests
+        return manager
     def create_batch_requests_file(self):
-        batchlist = []
-        for i,user_input in enumerate(self.user_input):
-            custom_id = f"{self.model}_{i}"
-            batchlist.append(BatchRequest(custom_id, self.model, self.system_prompt, user_input).to_dict())
+        os.makedirs(os.path.dirname(os.path.abspath(self.file_path)), exist_ok=True)
         with open(self.file_path, 'w', encoding='utf-8') as file:
-            for batch_request in batchlist:
+            for batch_request in self.requests:
                 # 每行写入一个 JSON 对象，不需要缩进
-                file.write(json.dumps(batch_request, ensure_ascii=False) + '\n')
+                file.write(json.dumps(batch_request.to_dict(), ensure_ascii=False) + '\n')
     def upload_batch_requests_file(self):
-        result=self.client.files.create(file=open(self.file_path,'rb'),purpose="batch")
+        with open(self.file_path,'rb') as file:
+            result=self.client.files.create(file=file,purpose="batch")
         return result
     def batch_request(self,file_id: str):
         log.info(f"开始创建批处理任务:{file_id}")
+        kwargs = {}
+        if isinstance(self.client, ZhipuAI):
+            kwargs["auto_delete_input_file"] = False
+        else:
+            kwargs["completion_window"] = "24h"
         create = self.client.batches.create(
             input_file_id=file_id,
-            endpoint="/v4/chat/completions", 
-            auto_delete_input_file=False,
+            endpoint=self.endpoint,
+            **kwargs,
         )
         log.info(f"批处理任务创建成功，任务ID: {create.id}")
         return create
-    
-    def get_batch_result(self, batch_id: str, max_retries: int = 60, interval: int = 60):
+
+    def get_batch_result(
+        self,
+        batch_id: str,
+        max_retries: int = 60,
+        interval: float = 60,
+        max_interval: float | None = None,
+        timeout: float | None = None,
+    ):
         """
         获取批处理任务结果，包含自动轮询逻辑
-        
+
         Args:
             batch_id: 批处理任务ID
-            max_retries: 最大重试次数，默认60次
-            interval: 轮询间隔（秒），默认60秒
-            
+            max_retries: 最大轮询次数，默认60次
+            interval: 首次轮询间隔（秒），默认60秒
+            max_interval: 轮询间隔上限（秒）；设置后每次等待时间乘1.5，直到该上限
+            timeout: 总等待时间上限（秒），None表示只受max_retries限制
+
         Returns:
             批处理任务结果
-            
+
         Raises:
             Exception: 当任务最终失败或超出重试次数时抛出
         """
-        retry_count = 0
-        
-        while retry_count < max_retries:
+        start = time.monotonic()
+        for _ in range(max_retries):
             try:
                 batch_job = self.client.batches.retrieve(batch_id)
-                status = batch_job.status
-                
-                if status == "completed":
-                    
-                    return batch_job
-                    
-                elif status in ["failed", "expired", "cancelled"]:
-                    raise Exception(f"批处理任务异常终止，状态: {status}")
-                    
-                elif status in ["validating", "in_progress", "finalizing", "cancelling"]:
-                    print(f"任务进行中，当前状态: {status}，等待{interval}秒后重试...")
-                    time.sleep(interval)
-                    retry_count += 1
-                    continue
-                    
-                else:
-                    raise Exception(f"未知的任务状态: {status}")
-                    
             except Exception as e:
-                if "任务进行中" not in str(e):
-                    raise Exception(f"获取批处理结果失败: {str(e)}")
-                if retry_count >= max_retries - 1:
-                    raise Exception(f"获取批处理结果超时，已重试{max_retries}次")
-                retry_count += 1
-                
+                # 网络抖动不终止轮询
+                log.error(f"获取批处理状态失败: {e}")
+                batch_job = None
+            status = None if batch_job is None else batch_job.status
+            if status == "completed":
+                return batch_job
+            elif status in ["failed", "expired", "cancelled"]:
+                raise Exception(f"批处理任务异常终止，状态: {status}")
+            elif status is not None and status not in [
+                "validating", "in_progress", "finalizing", "cancelling"
+            ]:
+                raise Exception(f"未知的任务状态: {status}")
+            if timeout is not None and time.monotonic() - start + interval > timeout:
+                raise Exception(f"获取批处理结果超时，已等待{timeout}秒")
+            log.info(f"任务进行中，当前状态: {status}，等待{interval:.0f}秒后重试...")
+            time.sleep(interval)
+            if max_interval is not None:
+                interval = min(max_interval, interval * 1.5)
         raise Exception(f"获取批处理结果超时，已重试{max_retries}次")
-    def download_and_transform(self,file_id: str):
+    def download_results(self, file_id: str) -> dict[str, str]:
+        """下载结果文件，返回 custom_id -> 回复内容；失败的请求不在结果中"""
         content=self.client.files.content(file_id)
-        result_file_path=self.file_path.split(".")[0]+"_result.jsonl"
+        result_file_path=os.path.splitext(self.file_path)[0]+"_result.jsonl"
         content.write_to_file(result_file_path)
-        response_data=[]
+        response_data={}
         with open(result_file_path,'r',encoding='utf-8') as file:
             for line in file:
+                if line.strip() == "":
+                    continue
                 data=json.loads(line)
-                response_content = data['response']['body']['choices'][0]['message']['content']
-                response_data.append(response_content)
+                response = data.get('response') or {}
+                if response.get('status_code', 200) != 200:
+                    log.error(f"批处理请求 {data.get('custom_id')} 失败: {response}")
+                    continue
+                try:
+                    response_data[data['custom_id']] = response['body']['choices'][0]['message']['content']
+                except (KeyError, IndexError, TypeError):
+                    log.error(f"批处理结果格式错误: {line}")
         return response_data
-    def work_whole_step(self):
+    def download_and_transform(self,file_id: str):
+        """按请求顺序返回回复内容，失败的位置为None"""
+        results = self.download_results(file_id)
+        return [results.get(req.custom_id) for req in self.requests]
+    def work_whole_step(
+        self,
+        interval: float = 60,
+        max_interval: float | None = None,
+        max_retries: int = 60,
+        timeout: float | None = None,
+    ):
         self.create_batch_requests_file()
-        with open(self.file_path.split('.')[0]+"_batch_info.txt","w",encoding="utf-8") as file:
+        with open(os.path.splitext(self.file_path)[0]+"_batch_info.txt","w",encoding="utf-8") as file:
             file_id=self.upload_batch_requests_file().id
             file.write(file_id+"\n")
             batch_id=self.batch_request(file_id).id
             file.write(batch_id+"\n")
-            file_id=self.get_batch_result(batch_id).output_file_id
-            file.write(file_id+"\n")
+            batch_job=self.get_batch_result(batch_id, max_retries, interval, max_interval, timeout)
+            file_id=batch_job.output_file_id
+            file.write(str(file_id)+"\n")
+        if file_id is None:
+            # 所有请求都失败时没有输出文件
+            return [None] * len(self.requests)
         return self.download_and_transform(file_id)
 
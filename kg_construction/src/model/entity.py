@@ -1,6 +1,6 @@
 from dataclasses import dataclass, field
 
-@dataclass
+@dataclass(slots=True)
 class Entity:
     id: int = 0
     title: str = ""
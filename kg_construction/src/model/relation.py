@@ -1,6 +1,6 @@
 from dataclasses import dataclass,field
 
-@dataclass
+@dataclass(slots=True)
 class Relation:
     id: int=0
     summary: str=""
@@ -1,6 +1,6 @@
 from dataclasses import dataclass,field
 
-@dataclass
+@dataclass(slots=True)
 class Section:
     # The section class is a dataclass to restore a section according to raw document
     id: int=0
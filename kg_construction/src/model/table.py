@@ -0,0 +1,133 @@
+"""实体和关系的列式（struct-of-arrays）视图
+
+graph_structure(return_type="table") 返回这两种表，不再为每条记录创建对象：
+id、source_id、target_id 等整数字段为 int32 数组，类型字符串去重后存为编码数组 + 词表。
+需要逐条访问完整字段时仍使用 Entity/Relation 对象。
+"""
+
+from dataclasses import dataclass, field
+
+import numpy as np
+
+
+def intern_strings(strings: list[str]) -> tuple[np.ndarray, list[str]]:
+    """返回 (每个字符串在词表中的编码, 按首次出现顺序排列的词表)"""
+    vocab: dict[str, int] = {}
+    codes = np.fromiter(
+        (vocab.setdefault(s, len(vocab)) for s in strings), dtype=np.int32, count=len(strings)
+    )
+    return codes, list(vocab)
+
+
+@dataclass(slots=True)
+class _Table:
+    id: np.ndarray
+    type_codes: np.ndarray
+    types: list[str]
+    _row_of: dict | None = field(default=None, repr=False)
+
+    def __len__(self) -> int:
+        return len(self.id)
+
+    def type_mask(self, *names: str) -> np.ndarray:
+        """类型属于names之一的行"""
+        codes = [self.types.index(name) for name in names if name in self.types]
+        return np.isin(self.type_codes, codes)
+
+    def type_of(self, row: int) -> str:
+        return self.types[self.type_codes[row]]
+
+    def row_of(self, id: int) -> int | None:
+        """id 所在的行号"""
+        if self._row_of is None:
+            self._row_of = {value: row for row, value in enumerate(self.id.tolist())}
+        return self._row_of.get(id)
+
+
+@dataclass(slots=True)
+class EntityTable(_Table):
+    title: list[str] = field(default_factory=list)
+    degree: np.ndarray = None  # len(to_relation) + len(from_relation)
+    is_core_entity: np.ndarray = None
+
+    @classmethod
+    def from_columns(cls, columns: dict) -> "EntityTable":
+        """columns: 字段名 -> 值列表（或数组），to_relation/from_relation 只需要长度"""
+        size = len(columns["id"])
+        type_codes, types = intern_strings(
+            columns["type"] if "type" in columns else [""] * size
+        )
+        return cls(
+            id=np.asarray(columns["id"], dtype=np.int32),
+            type_codes=type_codes,
+            types=types,
+            title=list(columns["title"]),
+            degree=np.asarray(columns["degree"], dtype=np.int32),
+            is_core_entity=np.asarray(
+                columns.get("is_core_entity", [True] * size), dtype=bool
+            ),
+        )
+
+    @classmethod
+    def from_records(cls, records: list[dict]) -> "EntityTable":
+        return cls.from_columns(
+            {
+                "id": [r["id"] for r in records],
+                "title": [r["title"] for r in records],
+                "type": [r.get("type", "") for r in records],
+                "degree": [
+                    len(r.get("to_relation", [])) + len(r.get("from_relation", []))
+                    for r in records
+                ],
+                "is_core_entity": [r.get("is_core_entity", True) for r in records],
+            }
+        )
+
+
+@dataclass(slots=True)
+class RelationTable(_Table):
+    source_id: np.ndarray = None
+    target_id: np.ndarray = None
+    is_tree: np.ndarray = None
+
+    @classmethod
+    def from_columns(cls, columns: dict) -> "RelationTable":
+        type_codes, types = intern_strings(columns["type"])
+        size = len(columns["id"])
+        return cls(
+            id=np.asarray(columns["id"], dtype=np.int32),
+            type_codes=type_codes,
+            types=types,
+            source_id=np.asarray(columns["source_id"], dtype=np.int32),
+            target_id=np.asarray(columns["target_id"], dtype=np.int32),
+            is_tree=np.asarray(columns.get("is_tree", [False] * size), dtype=bool),
+        )
+
+    @classmethod
+    def from_records(cls, records: list[dict]) -> "RelationTable":
+        return cls.from_columns(
+            {
+                "id": [r["id"] for r in records],
+                "type": [r["type"] for r in records],
+                "source_id": [r["source_id"] for r in records],
+                "target_id": [r["target_id"] for r in records],
+                "is_tree": [r.get("is_tree", False) for r in records],
+            }
+        )
+
+    def concat(self, other: "RelationTable") -> "RelationTable":
+        types = list(self.types)
+        remap = []
+        for name in other.types:
+            if name not in types:
+                types.append(name)
+            remap.append(types.index(name))
+        remap = np.array(remap, dtype=np.int32)
+        return RelationTable(
+            id=np.concatenate([self.id, other.id]),
+            type_codes=np.concatenate([self.type_codes, remap[other.type_codes]]),
+            types=types,
+            source_id=np.concatenate([self.source_id, other.source_id]),
+            target_id=np.concatenate([self.target_id, other.target_id]),
+            is_tree=np.concatenate([self.is_tree, other.is_tree]),
+        )
@@ -1,3 +1,3 @@
-from .communication import communicate_with_agent,batch_execute_ops,execute_operator
+from .communication import communicate_with_agent,batch_execute_ops,execute_operator,iter_communicate_with_agent,iter_execute_operator,execute_operator_stream
 from .file_operation import load_json, save_json, attach_json,jsonalize
 from .engine import *
\ No newline at end of file
@@ -0,0 +1,144 @@
+"""共享的稀疏邻接索引
+
+get_adjacency_matrix、graph_structure(adjacency_matrix) 和 score 中的各种相似度原来各自用
+元组集合或 dict[set] 重建邻接关系。这里按关系文件构建一次无向的 scipy CSR 矩阵：
+- "entity": entity_related，"section": has_subsection + section_related，"all": all_relations
+- 行号与节点 id 的对应关系保存在有序的 ids 数组中
+- 以关系文件的 (mtime, size) 以及图会话的修改次数作为版本，图被修改后自动重建
+"""
+
+import os
+
+import numpy as np
+import scipy.sparse as sp
+
+from ...src.config import graph_structure_path
+from ...src.utils.graph_session import active_session
+
+_RELATION_FILES = {
+    "all": ["all_relations"],
+    "entity": ["entity_related"],
+    "section": ["has_subsection", "section_related"],
+}
+_NODE_FILES = {
+    "all": ["all_node"],
+    "entity": ["entity_nodes"],
+    "section": ["section_nodes"],
+}
+
+
+class AdjacencyIndex:
+    """无向邻接矩阵，支持 (a, b) in index 的成员判断"""
+
+    def __init__(self, ids: np.ndarray, matrix: sp.csr_matrix):
+        """
+        ids: 升序排列的节点id，第i行/列对应ids[i]
+        matrix: 对称的0/1 CSR矩阵
+        """
+        self.ids = ids
+        self.matrix = matrix
+        self.degree = np.diff(matrix.indptr)
+
+    @classmethod
+    def from_edges(cls, node_ids, source_ids, target_ids) -> "AdjacencyIndex":
+        source_ids = np.asarray(source_ids, dtype=np.int64)
+        target_ids = np.asarray(target_ids, dtype=np.int64)
+        ids = np.union1d(np.asarray(node_ids, dtype=np.int64), np.concatenate([source_ids, target_ids]))
+        rows = np.searchsorted(ids, source_ids)
+        cols = np.searchsorted(ids, target_ids)
+        n = len(ids)
+        matrix = sp.csr_matrix(
+            (np.ones(2 * len(rows), dtype=np.int8), (np.concatenate([rows, cols]), np.concatenate([cols, rows]))),
+            shape=(n, n),
+        )
+        matrix.sum_duplicates()
+        matrix.data[:] = 1
+        matrix.sort_indices()
+        return cls(ids, matrix)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def row_of(self, id: int) -> int:
+        """节点id对应的行号，不存在时为-1"""
+        row = int(np.searchsorted(self.ids, id))
+        return row if row < len(self.ids) and self.ids[row] == id else -1
+
+    def rows_of(self, ids) -> np.ndarray:
+        ids = np.asarray(ids, dtype=np.int64)
+        rows = np.searchsorted(self.ids, ids)
+        rows[rows >= len(self.ids)] = 0
+        return np.where(self.ids[rows] == ids, rows, -1) if len(self.ids) else np.full(len(ids), -1)
+
+    def __contains__(self, pair) -> bool:
+        a, b = self.row_of(pair[0]), self.row_of(pair[1])
+        if a < 0 or b < 0:
+            return False
+        start, end = self.matrix.indptr[a], self.matrix.indptr[a + 1]
+        position = np.searchsorted(self.matrix.indices[start:end], b)
+        return position < end - start and self.matrix.indices[start + position] == b
+
+    def neighbors(self, id: int) -> np.ndarray:
+        row = self.row_of(id)
+        if row < 0:
+            return np.empty(0, dtype=self.ids.dtype)
+        return self.ids[self.matrix.indices[self.matrix.indptr[row] : self.matrix.indptr[row + 1]]]
+
+    def degree_of(self, id: int) -> int:
+        row = self.row_of(id)
+        return int(self.degree[row]) if row >= 0 else 0
+
+    def __iter__(self):
+        """按 (id, id) 元组遍历所有相邻对（两个方向都有）"""
+        coo = self.matrix.tocoo()
+        return zip(self.ids[coo.row].tolist(), self.ids[coo.col].tolist())
+
+    def pairs(self) -> set[tuple[int, int]]:
+        return set(self)
+
+
+_indexes: dict[tuple, tuple] = {}
+
+
+def graph_version(paths: list[str]) -> tuple:
+    stats = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stats.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            stats.append(None)
+    session = active_session()
+    return tuple(stats), None if session is None else (id(session), session.revision)
+
+
+def get_adjacency_index(kind: str = "all", cache_path: str = graph_structure_path) -> AdjacencyIndex:
+    """
+    返回缓存的邻接索引，图文件或会话中的图被修改后重建
+    kind: "all" / "entity" / "section"
+    """
+    from ...src.utils.id_operation import load_graph_table, graph_file_exists
+
+    relation_paths = [os.path.join(cache_path, f"{name}.json") for name in _RELATION_FILES[kind]]
+    node_paths = [os.path.join(cache_path, f"{name}.json") for name in _NODE_FILES[kind]]
+    key = (os.path.abspath(cache_path), kind)
+    version = graph_version(relation_paths + node_paths)
+    cached = _indexes.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    node_ids, sources, targets = [], [], []
+    for path in node_paths:
+        if graph_file_exists(path):
+            node_ids.append(load_graph_table(path, True).id)
+    for path in relation_paths:
+        if graph_file_exists(path):
+            table = load_graph_table(path, False)
+            sources.append(table.source_id)
+            targets.append(table.target_id)
+    index = AdjacencyIndex.from_edges(
+        np.concatenate(node_ids) if node_ids else [],
+        np.concatenate(sources) if sources else [],
+        np.concatenate(targets) if targets else [],
+    )
+    _indexes[key] = (version, index)
+    return index
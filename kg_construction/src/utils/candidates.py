@@ -0,0 +1,133 @@
+"""关系预测的候选实体对
+
+relation_predict / continue_predict / connection_predict 原来枚举全部 O(N²) 个实体对，
+每一对都调用 engine.get_distance（两次 reconstruct），排序后只保留很少一部分。
+这里只生成有限的候选集合：
+- 向量近邻：所有实体的向量一次批量 k-NN 查询，每个实体取最近的 candidate_knn_k 个实体
+- 图上的邻居：共同邻居得分（如AA）最高的、以及同一章节下的 candidate_graph_k 个实体
+候选对去重后用 SearchEngine.paired_distance 计算距离，总量约为 N·(knn_k + 2·graph_k)。
+"""
+
+import os
+
+import numpy as np
+import scipy.sparse as sp
+
+from ...src.config import candidate_graph_k, candidate_knn_k, graph_structure_path
+from ...src.utils.adjacency import AdjacencyIndex
+from ...src.utils.id_operation import graph_file_exists, load_graph_table
+from ...src.utils.score import LinkScores
+
+_CHUNK = 8192
+
+
+def _knn_rows(engine, vectors: np.ndarray, entity_ids: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """在引擎中批量查询每个实体最近的k个实体，返回行号对"""
+    _, labels = engine.id_index.search(vectors, k + 1)
+    # 不是候选实体的结果行号为-1
+    rows = _rows_of(entity_ids, labels.ravel()).reshape(labels.shape)
+    a = np.repeat(np.arange(len(entity_ids)), rows.shape[1])
+    b = rows.ravel()
+    keep = (b >= 0) & (b != a)
+    return a[keep], b[keep]
+
+
+def _graph_rows(entity_ids: np.ndarray, graph_scores, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """graph_scores（LinkScores）中每个实体得分最高的k个实体，返回行号对"""
+    a, b = [], []
+    for i, candidates in graph_scores.top_k(k).items():
+        a.extend([i] * len(candidates))
+        b.extend(j for j, _ in candidates)
+    return _rows_of(entity_ids, a), _rows_of(entity_ids, b)
+
+
+def _sibling_rows(entity_ids: np.ndarray, k: int, cache_path: str) -> tuple[np.ndarray, np.ndarray]:
+    """同一章节下的实体，每个实体取共同章节最多的k个"""
+    path = os.path.join(cache_path, "has_entity.json")
+    if not graph_file_exists(path):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    table = load_graph_table(path, False)
+    rows = _rows_of(entity_ids, table.target_id)
+    keep = rows >= 0
+    sections, columns = np.unique(table.source_id[keep], return_inverse=True)
+    membership = sp.csr_matrix(
+        (np.ones(keep.sum(), dtype=np.float32), (columns, rows[keep])),
+        shape=(len(sections), len(entity_ids)),
+    )
+    siblings = membership.T @ membership
+    siblings = sp.csr_matrix(siblings - sp.diags(siblings.diagonal()))
+    siblings.eliminate_zeros()
+    siblings.sort_indices()
+    index = AdjacencyIndex(entity_ids, siblings)
+    return _graph_rows(entity_ids, LinkScores(index, siblings), k)
+
+
+def _rows_of(entity_ids: np.ndarray, ids) -> np.ndarray:
+    ids = np.asarray(ids, dtype=np.int64)
+    if len(entity_ids) == 0:
+        return np.full(len(ids), -1)
+    rows = np.searchsorted(entity_ids, ids)
+    rows[rows >= len(entity_ids)] = 0
+    return np.where(entity_ids[rows] == ids, rows, -1)
+
+
+def candidate_pairs(
+    engine,
+    entity_ids,
+    graph_scores=None,
+    knn_k: int = candidate_knn_k,
+    graph_k: int = candidate_graph_k,
+    cache_path: str = graph_structure_path,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    返回候选实体对 (a, b, distance)：a < b，去重，distance为两者向量的L2距离
+    engine: SearchEngine，不在引擎中的实体不参与
+    graph_scores: 图上的链接预测得分（LinkScores），None时只使用同一章节的实体
+    """
+    entity_ids = np.asarray(sorted(i for i in entity_ids if i in engine), dtype=np.int64)
+    if len(entity_ids) < 2:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0, dtype=np.float32)
+    parts = [_knn_rows(engine, engine.index_matrix(entity_ids), entity_ids, knn_k)]
+    if graph_k > 0:
+        if graph_scores is not None:
+            parts.append(_graph_rows(entity_ids, graph_scores, graph_k))
+        parts.append(_sibling_rows(entity_ids, graph_k, cache_path))
+    a, b = _unique_pairs(
+        np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts]), len(entity_ids)
+    )
+    return entity_ids[a], entity_ids[b], engine.paired_distance(entity_ids[a], entity_ids[b])
+
+
+def _unique_pairs(a: np.ndarray, b: np.ndarray, n: int) -> tuple[np.ndarray, np.ndarray]:
+    """去掉无效的行号和自身，统一为 a < b 后去重"""
+    keep = (a >= 0) & (b >= 0) & (a != b)
+    a, b = np.minimum(a[keep], b[keep]), np.maximum(a[keep], b[keep])
+    codes = np.unique(a * n + b)
+    return codes // n, codes % n
+
+
+def component_bridges(
+    engine, entity_ids, labels, sources=None
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    为实体找不在同一连通分量中的最近实体，返回 (a, b, distance)，a < b，去重
+    labels: 与entity_ids对应的连通分量编号
+    sources: 只为这些位置（布尔数组）上的实体查找，None表示全部
+    用于补充候选集合中没有跨分量实体对的分量
+    """
+    entity_ids = np.asarray(entity_ids, dtype=np.int64)
+    labels = np.asarray(labels)
+    rows = np.arange(len(entity_ids)) if sources is None else np.flatnonzero(sources)
+    if len(rows) == 0 or len(np.unique(labels)) < 2:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0, dtype=np.float32)
+    nearest = np.empty(len(rows), dtype=np.int64)
+    step = max(1, _CHUNK * 512 // len(entity_ids))
+    for start in range(0, len(rows), step):
+        block = rows[start : start + step]
+        distance = engine.pairwise_distance(entity_ids[block], entity_ids)
+        distance[labels[block, None] == labels[None, :]] = np.inf
+        nearest[start : start + step] = np.argmin(distance, axis=1)
+    a, b = _unique_pairs(rows, nearest, len(entity_ids))
+    return entity_ids[a], entity_ids[b], engine.paired_distance(entity_ids[a], entity_ids[b])
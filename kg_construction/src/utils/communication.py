@@ -1,9 +1,17 @@
-from utils.api import multi_conservation, multi_embedding
+from typing import AsyncIterator, Iterator
+from utils.api import (
+    astream_conservation,
+    multi_conservation,
+    multi_embedding_array,
+    stream_conservation,
+)
 import logging as log
 import logging
 import os
 import json
 import time
+import uuid
+import numpy as np
 
 log = logging.getLogger(__name__)
 from ...src.model.base_operator import (
@@ -12,20 +20,56 @@ from ...src.model.base_operator import (
     EmbeddingSectionoperation,
     Embeddingstroperation,
 )
+from ...src.model.batchrequest import BatchRequest, BatchRequestManager
 from ...src.utils.file_operation import jsonalize, load_json
+from ...src.utils.serializer import dump_file
+from ...src.utils.request_cache import get_request_cache, request_key
+from ...src.utils.embedding_store import (
+    embedding_key,
+    embedding_model_id,
+    get_embedding_store,
+)
+from ...src.config import (
+    request_cache_enabled,
+    request_cache_path,
+    embedding_store_enabled,
+)
+from config import (
+    model_name,
+    qa_temp,
+    json_feature,
+    model_provider,
+    batch_poll_interval,
+    batch_poll_max_interval,
+    batch_timeout,
+)
+from utils.llm_pool import get_provider_settings
+from zhipuai import ZhipuAI
+from openai import OpenAI
+from utils.rate_limit import (
+    backoff_delay,
+    call_with_limit,
+    get_limiter,
+    is_throttle_error,
+)
 
 
 # 同步调用
 def chat_completion(client, system_prompt: str, user_input: str) -> dict:
     """使用聊天完成模型获取响应。"""
     log.info("ask for api...")
-    response = client.chat.completions.create(
-        model=model_name,  # 可以根据需要替换为其他模型
-        messages=[
-            {"role": "user", "content": system_prompt},
-            {"role": "user", "content": user_input},
-        ],
-        temperature=0.3,  # 较低的温度以获得更确定的输出
+    response = call_with_limit(
+        model_provider,
+        model_name,
+        len(system_prompt) + len(user_input),
+        lambda: client.chat.completions.create(
+            model=model_name,  # 可以根据需要替换为其他模型
+            messages=[
+                {"role": "user", "content": system_prompt},
+                {"role": "user", "content": user_input},
+            ],
+            temperature=0.3,  # 较低的温度以获得更确定的输出
+        ),
     )
     return response
 
@@ -34,7 +78,9 @@ def chat_completion(client, system_prompt: str, user_input: str) -> dict:
 def request(client, system_prompt, user_input, id):
     log.info(f"请求 API for input: {id}...")
     # 发起请求
-    for _ in range(2):  # 尝试三次
+    limiter = get_limiter(model_provider, model_name)
+    for attempt in range(2):  # 尝试两次
+        limiter.acquire_sync()
         try:
             if system_prompt is not None:
                 response = client.chat.asyncCompletions.create(
@@ -55,7 +101,9 @@ def request(client, system_prompt, user_input, id):
         except Exception as e:
             log.error(f"Error while requesting API for input {id}: {e}")
             log.error(f"user_input: {user_input}")
-            time.sleep(5)
+            if is_throttle_error(e):
+                limiter.on_throttle()
+            time.sleep(backoff_delay(attempt + 2))
             continue
     return None
 
@@ -114,6 +162,195 @@ def batch_chat_completion(
     return final_result
 
 
+def get_request_key(system_prompt: str, user_input: str, need_json: bool) -> str:
+    """单个对话请求在缓存中的键"""
+    response_format = (
+        {"type": "json_object"}
+        if need_json and json_feature.get(model_name, False)
+        else None
+    )
+    return request_key(model_name, system_prompt, user_input, qa_temp, response_format)
+
+
+def cached_conservation(
+    system_prompt: list[str],
+    user_input: list[str],
+    need_json: list[bool],
+    show_progress: bool = False,
+) -> list[str]:
+    """带请求级缓存的multi_conservation，只请求缓存中没有的部分"""
+    if not request_cache_enabled:
+        return multi_conservation(system_prompt, user_input, need_json, show_progress)
+    cache = get_request_cache()
+    keys, cached, missing = _split_cached(system_prompt, user_input, need_json)
+    if len(missing) != 0:
+        responses = multi_conservation(
+            [system_prompt[i] for i in missing],
+            [user_input[i] for i in missing],
+            [need_json[i] for i in missing],
+            show_progress,
+        )
+        # 失败的请求返回空字符串，不写入缓存，下次重试
+        cache.put_many(
+            {keys[i]: res for i, res in zip(missing, responses) if res != ""}
+        )
+        for i, res in zip(missing, responses):
+            cached[keys[i]] = res
+    return [cached[key] for key in keys]
+
+
+def _split_cached(
+    system_prompt: list[str], user_input: list[str], need_json: list[bool]
+) -> tuple[list[str], dict[str, str], list[int]]:
+    """返回 (每个请求的缓存键, 命中的结果, 未命中的下标)；关闭请求缓存时全部未命中"""
+    if not request_cache_enabled:
+        return [None] * len(user_input), {}, list(range(len(user_input)))
+    keys = [
+        get_request_key(prompt, user, nj)
+        for prompt, user, nj in zip(system_prompt, user_input, need_json)
+    ]
+    cached = get_request_cache().get_many(keys)
+    missing = [i for i, key in enumerate(keys) if key not in cached]
+    log.info(f"request cache hit {len(keys) - len(missing)}/{len(keys)}")
+    return keys, cached, missing
+
+
+def _cached_stream(
+    system_prompt: list[str], user_input: list[str], need_json: list[bool]
+):
+    """
+    流式接口共用的缓存逻辑，返回 (命中的 (下标, 回复) 列表, 未命中的请求参数, record)。
+    record(j, res) 把第j个未命中请求的回复写入请求缓存（失败的空字符串不写入），返回 (原下标, 回复)。
+    """
+    keys, cached, missing = _split_cached(system_prompt, user_input, need_json)
+    hits = [(i, cached[key]) for i, key in enumerate(keys) if key in cached]
+    requests = (
+        [system_prompt[i] for i in missing],
+        [user_input[i] for i in missing],
+        [need_json[i] for i in missing],
+    )
+    cache = get_request_cache() if request_cache_enabled and missing else None
+
+    def record(j: int, res: str) -> tuple[int, str]:
+        i = missing[j]
+        if cache is not None and res != "":
+            cache.put(keys[i], res)
+        return i, res
+
+    return hits, requests, record
+
+
+def iter_cached_conservation(
+    system_prompt: list[str],
+    user_input: list[str],
+    need_json: list[bool],
+    show_progress: bool = False,
+) -> Iterator[tuple[int, str]]:
+    """
+    流式的cached_conservation，按完成顺序产出 (下标, 回复)。
+    缓存命中的先产出；新回复到达后立即写入请求缓存，中途崩溃也不会丢失已完成的结果。
+    """
+    hits, requests, record = _cached_stream(system_prompt, user_input, need_json)
+    yield from hits
+    if len(requests[0]) == 0:
+        return
+    for j, res in stream_conservation(*requests, show_progress):
+        yield record(j, res)
+
+
+async def astream_cached_conservation(
+    system_prompt: list[str],
+    user_input: list[str],
+    need_json: list[bool],
+) -> AsyncIterator[tuple[int, str]]:
+    """iter_cached_conservation 的异步生成器版本"""
+    hits, requests, record = _cached_stream(system_prompt, user_input, need_json)
+    for hit in hits:
+        yield hit
+    if len(requests[0]) == 0:
+        return
+    async for j, res in astream_conservation(*requests):
+        yield record(j, res)
+
+
+def get_batch_client():
+    """返回 (批处理客户端, endpoint)"""
+    provider, base_url, api_key = get_provider_settings()
+    if provider == "chatglm":
+        return ZhipuAI(api_key=api_key, base_url=base_url), "/v4/chat/completions"
+    return OpenAI(api_key=api_key, base_url=base_url), "/v1/chat/completions"
+
+
+def batch_conservation(
+    system_prompt: list[str],
+    user_input: list[str],
+    need_json: list[bool],
+) -> list[str]:
+    """
+    使用服务商的批处理接口执行一组对话，提示词可以各不相同。
+    请求参数与在线请求一致，因此与cached_conservation共用请求缓存。
+    失败的位置为空字符串。
+    """
+    keys, cached, missing = _split_cached(system_prompt, user_input, need_json)
+    results = [cached.get(key, "") for key in keys]
+    if len(missing) == 0:
+        return results
+    client, endpoint = get_batch_client()
+    requests = [
+        BatchRequest(
+            f"request-{i}",
+            model_name,
+            system_prompt[i],
+            user_input[i],
+            url=endpoint,
+            temperature=qa_temp,
+            response_format=(
+                {"type": "json_object"}
+                if need_json[i] and json_feature.get(model_name, False)
+                else None
+            ),
+        )
+        for i in missing
+    ]
+    # 同一秒内可能提交多个批处理任务，文件名用uuid区分
+    file_path = os.path.join(request_cache_path, "batch", f"batch_{uuid.uuid4().hex}.jsonl")
+    manager = BatchRequestManager.from_requests(requests, file_path, client, endpoint)
+    try:
+        responses = manager.work_whole_step(
+            interval=batch_poll_interval,
+            max_interval=batch_poll_max_interval,
+            max_retries=int(batch_timeout // batch_poll_interval) + 1,
+            timeout=batch_timeout,
+        )
+    except Exception as e:
+        log.error(f"批处理任务失败: {e}")
+        responses = [None] * len(missing)
+    log.info(f"batch finished, {sum(res is not None for res in responses)}/{len(missing)} succeeded")
+    finished = {}
+    for i, res in zip(missing, responses):
+        if res is None:
+            continue
+        results[i] = res
+        if request_cache_enabled:
+            finished[keys[i]] = res
+    if request_cache_enabled:
+        get_request_cache().put_many(finished)
+    return results
+
+
+def dump_cache_file(cached_file_path: str, result: list):
+    """
+    保存整批结果，仅作为本次运行的记录；每次execute_operator只在整批完成后写一次
+    （流式接口不写），先写临时文件再替换，中断时不会留下写了一半的文件
+    """
+    if cached_file_path == "":
+        return
+    os.makedirs(os.path.dirname(cached_file_path), exist_ok=True)
+    temp_path = f"{cached_file_path}.{uuid.uuid4().hex}.tmp"
+    dump_file(temp_path, result)
+    os.replace(temp_path, cached_file_path)
+
+
 # 用于单一输入
 def communicate_with_agent(
     system_prompt: str,
@@ -121,24 +358,52 @@ def communicate_with_agent(
     need_json: bool,
     cached_file_path: str = "",
     need_read_from_cache: bool = False,
+    mode: str = "online",
 ):
-    if need_read_from_cache:
+    """
+    同一系统提示词的批量请求。
+    开启request_cache_enabled时按请求缓存，need_read_from_cache只在关闭时生效，
+    表示直接读取cached_file_path中整批的旧结果。
+    mode为"batch"时使用服务商的批处理接口（见batch_conservation）。
+    """
+    if need_read_from_cache and not request_cache_enabled:
         if cached_file_path != "" and os.path.exists(cached_file_path):
             return load_json(cached_file_path)
         else:
             print("cached file not found:", cached_file_path)
-    result = multi_conservation(
+    conservation = batch_conservation if mode == "batch" else cached_conservation
+    result = conservation(
         [system_prompt] * len(user_input), user_input, [need_json] * len(user_input)
     )
     result = [jsonalize(res) if need_json else res for res in result]
-    if cached_file_path != "":
-        if not os.path.exists(cached_file_path):
-            os.makedirs(os.path.dirname(cached_file_path), exist_ok=True)
-            with open(cached_file_path, "w", encoding="utf-8") as f:
-                json.dump(result, f, ensure_ascii=False, indent=4)
+    dump_cache_file(cached_file_path, result)
     return result
 
 
+def iter_communicate_with_agent(
+    system_prompt: str,
+    user_input: list[str],
+    need_json: bool,
+    cached_file_path: str = "",
+    need_read_from_cache: bool = False,
+) -> Iterator[tuple[int, object]]:
+    """
+    communicate_with_agent的流式版本，按完成顺序产出 (下标, 解析后的结果)。
+    关闭request_cache_enabled时退化为整批请求。
+    """
+    if not request_cache_enabled:
+        yield from enumerate(
+            communicate_with_agent(
+                system_prompt, user_input, need_json, cached_file_path, need_read_from_cache
+            )
+        )
+        return
+    for i, res in iter_cached_conservation(
+        [system_prompt] * len(user_input), user_input, [need_json] * len(user_input)
+    ):
+        yield i, jsonalize(res) if need_json else res
+
+
 def batch_execute_ops(client, ops: list[KGoperator]) -> list[dict]:
     """批量处理多个消息，异步调用API并返回响应。"""
     log.info("Entering batch_chat_completion...")
@@ -185,43 +450,165 @@ def batch_execute_ops(client, ops: list[KGoperator]) -> list[dict]:
     return final_result
 
 
+def is_embedding_operator(op: KGoperator) -> bool:
+    return (
+        isinstance(op, EmbeddingEntityoperation)
+        or isinstance(op, EmbeddingSectionoperation)
+        or isinstance(op, Embeddingstroperation)
+    )
+
+
+def load_operator_prompts(ops: list[KGoperator]) -> list[str]:
+    """读取每个op对应的系统提示词，同一个文件只读一次"""
+    prompts = {}
+    for op in ops:
+        if op.prompt_path not in prompts and op.prompt_path is not None:
+            prompts[op.prompt_path] = open(op.prompt_path, "r", encoding="utf-8").read()
+    return [prompts[op.prompt_path] for op in ops]
+
+
+def iter_execute_operator(
+    ops: list[KGoperator],
+    cached_file_path: str = "",
+    need_read_from_cache: bool = False,
+    need_show_progress: bool = True,
+) -> Iterator[tuple[int, object]]:
+    """
+    execute_operator的流式版本，按完成顺序产出 (op下标, 解析后的结果)。
+    每个结果到达后立即写入请求缓存；调用方边收边处理，不需要持有整批回复。
+    嵌入类op或关闭request_cache_enabled时退化为整批执行。
+    """
+    if len(ops) == 0:
+        return
+    if is_embedding_operator(ops[0]) or not request_cache_enabled:
+        yield from enumerate(
+            execute_operator(ops, cached_file_path, need_read_from_cache, need_show_progress)
+        )
+        return
+    for i, res in iter_cached_conservation(
+        load_operator_prompts(ops),
+        [op.user_input for op in ops],
+        [op.return_type == "json" for op in ops],
+        need_show_progress,
+    ):
+        yield i, jsonalize(res) if ops[i].return_type == "json" else res
+
+
+async def execute_operator_stream(
+    ops: list[KGoperator],
+) -> AsyncIterator[tuple[int, object]]:
+    """iter_execute_operator 的异步生成器版本，只支持对话类op"""
+    if len(ops) == 0:
+        return
+    if is_embedding_operator(ops[0]):
+        raise ValueError("execute_operator_stream 不支持嵌入类op")
+    async for i, res in astream_cached_conservation(
+        load_operator_prompts(ops),
+        [op.user_input for op in ops],
+        [op.return_type == "json" for op in ops],
+    ):
+        yield i, jsonalize(res) if ops[i].return_type == "json" else res
+
+
+def embed_texts(texts: list[str], show_progress: bool = True) -> tuple[np.ndarray, np.ndarray]:
+    """
+    嵌入一组文本，返回 (float32矩阵, 是否成功的bool掩码)，失败的行为全0。
+    开启embedding_store_enabled时按文本内容缓存向量，只请求新的文本；失败的向量不写入存储，下次重试
+    """
+    if not embedding_store_enabled:
+        return multi_embedding_array(texts, show_progress)
+    store = get_embedding_store()
+    model = embedding_model_id()
+    keys = [embedding_key(text, model) for text in texts]
+    result, ok = store.get_many(keys)
+    missing = np.flatnonzero(~ok)
+    log.info(f"embedding store hit {len(keys) - len(missing)}/{len(keys)}")
+    if len(missing) != 0:
+        vectors, success = multi_embedding_array(
+            [texts[i] for i in missing], show_progress
+        )
+        result[missing] = vectors
+        ok[missing] = success
+        store.put_many([keys[i] for i in missing[success]], vectors[success])
+    return result, ok
+
+
+def execute_embedding_operator(
+    ops: list[KGoperator],
+    cached_file_path: str = "",
+    need_read_from_cache: bool = False,
+    need_show_progress: bool = True,
+) -> np.ndarray:
+    """
+    执行嵌入类op，返回float32矩阵，每行对应一条展开后的文本。
+    开启embedding_store_enabled时见embed_texts，不再读写cached_file_path中的JSON。
+    """
+    texts = [text for op in ops for text in op.user_input]
+    if (
+        not embedding_store_enabled
+        and need_read_from_cache
+        and cached_file_path != ""
+        and os.path.exists(cached_file_path)
+    ):
+        return np.asarray(load_json(cached_file_path), dtype=np.float32)
+    result, ok = embed_texts(texts, need_show_progress)
+    # 请求失败的行保持全0（即嵌入op的默认值），维度以返回的矩阵为准，保证与输入一一对应
+    result[~ok] = 0
+    if not embedding_store_enabled and cached_file_path != "":
+        if not os.path.exists(cached_file_path):
+            os.makedirs(os.path.dirname(cached_file_path), exist_ok=True)
+        with open(cached_file_path, "w", encoding="utf-8") as f:
+            json.dump(result.tolist(), f, ensure_ascii=False, indent=4)
+    return result
+
+
 def execute_operator(
     ops: list[KGoperator],
     cached_file_path: str = "",
     need_read_from_cache: bool = False,
     need_show_progress: bool = True,
+    mode: str = "online",
 ):
-    # 存在缓存
-    if need_read_from_cache:
-        if cached_file_path != "":
-            if os.path.exists(cached_file_path):
-                return load_json(cached_file_path)
+    """
+    执行一组KGoperator。
+    对话请求经过请求级缓存（见cached_conservation），所有KGoperator子类自动复用。
+    need_read_from_cache只在关闭request_cache_enabled时生效，表示直接读取整批的旧结果。
+    mode为"batch"时把所有op（提示词可以不同）放进一个批处理任务，失败的op使用其默认值。
+    嵌入类op见execute_embedding_operator。
+    """
     # 长度为0
     if len(ops) == 0:
         return []
     # 要求向量
-    if (
-        isinstance(ops[0], EmbeddingEntityoperation)
-        or isinstance(ops[0], EmbeddingSectionoperation)
-        or isinstance(ops[0], Embeddingstroperation)
-    ):
-        result = multi_embedding([op.user_input for op in ops], need_show_progress)
-        if cached_file_path != "":
-            if not os.path.exists(cached_file_path):
-                os.makedirs(os.path.dirname(cached_file_path), exist_ok=True)
-            with open(cached_file_path, "w", encoding="utf-8") as f:
-                json.dump(result, f, ensure_ascii=False, indent=4)
+    if is_embedding_operator(ops[0]):
+        return execute_embedding_operator(
+            ops, cached_file_path, need_read_from_cache, need_show_progress
+        )
+    # 存在缓存：只有文件确实存在时才直接返回，否则照常请求
+    if need_read_from_cache and not request_cache_enabled:
+        if cached_file_path != "" and os.path.exists(cached_file_path):
+            return load_json(cached_file_path)
+    # 批处理
+    if mode == "batch":
+        result = batch_conservation(
+            load_operator_prompts(ops),
+            [op.user_input for op in ops],
+            [op.return_type == "json" for op in ops],
+        )
+        result = [
+            res if res != "" else op.default_response()
+            for (op, res) in zip(ops, result)
+        ]
+        result = [
+            jsonalize(res) if op.return_type == "json" and isinstance(res, str) else res
+            for (op, res) in zip(ops, result)
+        ]
+        dump_cache_file(cached_file_path, result)
         return result
     # 要求补全
     else:
-        prompts = {}
-        for op in ops:
-            if op.prompt_path not in prompts and op.prompt_path is not None:
-                prompts[op.prompt_path] = open(
-                    op.prompt_path, "r", encoding="utf-8"
-                ).read()
-        result = multi_conservation(
-            [prompts[op.prompt_path] for op in ops],
+        result = cached_conservation(
+            load_operator_prompts(ops),
             [op.user_input for op in ops],
             [op.return_type == "json" for op in ops],
             need_show_progress,
@@ -230,9 +617,5 @@ def execute_operator(
             jsonalize(res) if op.return_type == "json" else res
             for (op, res) in zip(ops, result)
         ]
-        if cached_file_path != "":
-            if not os.path.exists(cached_file_path):
-                os.makedirs(os.path.dirname(cached_file_path), exist_ok=True)
-                with open(cached_file_path, "w", encoding="utf-8") as f:
-                    json.dump(result, f, ensure_ascii=False, indent=4)
+        dump_cache_file(cached_file_path, result)
         return result
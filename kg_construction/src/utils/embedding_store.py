@@ -0,0 +1,164 @@
+"""按文本内容缓存嵌入向量
+
+键为 hash(text, model)，向量按行追加写入一个 float32 的二进制文件（内存映射读取），
+SQLite 中保存键到行号的索引。描述没有变化的实体不会被重新嵌入，
+构建索引时直接从映射文件中取出向量，不再解析 JSON。
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+def embedding_key(text: str, model: str) -> str:
+    """计算单条文本的内容地址"""
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """追加写入的向量文件 + SQLite 行号索引，支持多进程写入"""
+
+    def __init__(self, path: str, dim: int):
+        """
+        path: 存储目录
+        dim: 向量维度，不同维度使用不同的向量文件
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.dim = dim
+        self.vector_path = os.path.join(path, f"vectors_{dim}.f32")
+        self._lock = threading.Lock()
+        # 自动提交模式，写入时显式开启事务，事务同时充当跨进程的写锁
+        self._conn = sqlite3.connect(
+            os.path.join(path, f"index_{dim}.sqlite"),
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, row INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+        )
+        self._conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('rows', 0)")
+        self._matrix: np.ndarray | None = None
+
+    def _rows(self) -> int:
+        """已提交的行数；崩溃时写了一半的行不计入，会被下次写入覆盖"""
+        return self._conn.execute("SELECT value FROM meta WHERE name='rows'").fetchone()[0]
+
+    def matrix(self) -> np.ndarray:
+        """所有已提交向量的只读内存映射视图"""
+        rows = self._rows()
+        if self._matrix is None or len(self._matrix) != rows:
+            if rows == 0:
+                self._matrix = np.empty((0, self.dim), dtype=np.float32)
+            else:
+                self._matrix = np.memmap(
+                    self.vector_path, dtype=np.float32, mode="r", shape=(rows, self.dim)
+                )
+        return self._matrix
+
+    def _find(self, keys: list[str]) -> dict[str, int]:
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        # SQLite 单条语句的参数个数有限制，分批查询
+        for i in range(0, len(unique), 500):
+            batch = unique[i : i + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT key, row FROM vectors WHERE key IN ({placeholders})", batch
+            ).fetchall()
+            found.update(rows)
+        return found
+
+    def lookup(self, keys: list[str]) -> np.ndarray:
+        """返回每个键对应的行号，不存在的为-1"""
+        with self._lock:
+            found = self._find(keys)
+        return np.array([found.get(key, -1) for key in keys], dtype=np.int64)
+
+    def get_many(self, keys: list[str]) -> tuple[np.ndarray, np.ndarray]:
+        """返回 (向量矩阵[len(keys), dim], 是否命中的掩码)，未命中的行为全0"""
+        rows = self.lookup(keys)
+        hit = rows >= 0
+        vectors = np.zeros((len(keys), self.dim), dtype=np.float32)
+        if hit.any():
+            with self._lock:
+                vectors[hit] = self.matrix()[rows[hit]]
+        return vectors, hit
+
+    def put_many(self, keys: list[str], vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if len(keys) == 0:
+            return
+        if vectors.shape != (len(keys), self.dim):
+            raise ValueError(f"向量形状 {vectors.shape} 与 ({len(keys)}, {self.dim}) 不一致")
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # 其他进程可能已经写入了相同的文本
+                existing = self._find(keys)
+                new = {}
+                for i, key in enumerate(keys):
+                    if key not in existing and key not in new:
+                        new[key] = i
+                if len(new) == 0:
+                    self._conn.execute("ROLLBACK")
+                    return
+                start = self._rows()
+                mode = "r+b" if os.path.exists(self.vector_path) else "wb"
+                with open(self.vector_path, mode) as f:
+                    f.seek(start * self.dim * 4)
+                    f.write(vectors[list(new.values())].tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._conn.executemany(
+                    "INSERT INTO vectors (key, row) VALUES (?, ?)",
+                    [(key, start + j) for j, key in enumerate(new)],
+                )
+                self._conn.execute(
+                    "UPDATE meta SET value=? WHERE name='rows'", (start + len(new),)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._rows()
+
+    def close(self):
+        with self._lock:
+            self._matrix = None
+            self._conn.close()
+
+
+_stores: dict[str, EmbeddingStore] = {}
+
+
+def get_embedding_store() -> EmbeddingStore:
+    """返回当前 embedding_store_path 下共享的向量存储"""
+    from ...src.config import embedding_store_path
+    from config import embedding_dim
+
+    key = os.path.join(embedding_store_path, str(embedding_dim))
+    if key not in _stores:
+        _stores[key] = EmbeddingStore(embedding_store_path, embedding_dim)
+    return _stores[key]
+
+
+def embedding_model_id() -> str:
+    """当前嵌入模型的标识，模型变化时缓存自动失效"""
+    from config import embedding_provider, embedding_model, embedding_dim
+
+    model = embedding_model if embedding_provider != "xfyun" else "para"
+    return f"{embedding_provider}:{model}:{embedding_dim}"
@@ -12,36 +12,384 @@ import faiss
 from ...src.utils.file_operation import save_json, load_json
 from ...src.utils.id_operation import graph_structure
 import numpy as np
-import os
+import logging
+import time
+from ...src.config import (
+    engine_index,
+    engine_min_train_size,
+    engine_nprobe,
+    engine_ef_search,
+    engine_normalize,
+    engine_pca_dim,
+)
 
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
+log = logging.getLogger(__name__)
+_BLOCK = 8192  # 分块计算距离时每块的行数
+
+# engine_index 的预设，{nlist} 和 {m} 按向量数和维度填入
+_INDEX_PRESETS = {
+    "flat": "Flat",
+    "hnsw": "HNSW32",
+    "ivfpq": "IVF{nlist},PQ{m}",
+    "opq": "OPQ{m},IVF{nlist},PQ{m}",
+}
+
+
+def index_spec(n: int, d: int, name: str = None) -> str:
+    """n个d维向量使用的 faiss.index_factory 描述串"""
+    if name is None:
+        name = engine_index
+    if name == "auto":
+        name = "flat" if n < 20000 else "hnsw" if n < 200000 else "opq"
+    spec = _INDEX_PRESETS.get(name, name)
+    # IVF的每个聚类至少需要约39个训练向量
+    nlist = max(1, min(int(4 * np.sqrt(n)), n // 39))
+    # PQ的子向量至少16维，最多64段
+    m = max(i for i in range(1, min(d // 16, 64) + 1) if d % i == 0) if d >= 16 else 1
+    return spec.format(nlist=nlist, m=m)
+
+
+def _tune(index):
+    """设置近似索引的查询参数"""
+    try:
+        faiss.extract_index_ivf(index).nprobe = engine_nprobe
+    except RuntimeError:
+        pass
+    hnsw = getattr(faiss.downcast_index(index), "hnsw", None)
+    if hnsw is not None:
+        hnsw.efSearch = engine_ef_search
+
+
+def _search_params(index, selector):
+    """带IDSelector的查询参数，近似索引需要对应类型的参数，同时带上_tune中的设置"""
+    try:
+        faiss.extract_index_ivf(index)
+        return faiss.SearchParametersIVF(sel=selector, nprobe=engine_nprobe)
+    except RuntimeError:
+        pass
+    if getattr(faiss.downcast_index(index), "hnsw", None) is not None:
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=engine_ef_search)
+    return faiss.SearchParameters(sel=selector)
+
+
+def _transforms(vectors: np.ndarray) -> list:
+    """插入索引前对向量做的变换：可选的PCA降维，以及归一化为单位长度"""
+    n, d = vectors.shape
+    chain = []
+    if engine_pca_dim is not None and engine_pca_dim < d:
+        if n < engine_pca_dim:
+            log.info(f"{n} vectors are not enough to train PCA{engine_pca_dim}, keep {d} dims")
+        else:
+            pca = faiss.PCAMatrix(d, engine_pca_dim)
+            pca.train(vectors)
+            chain.append(pca)
+            d = engine_pca_dim
+    if engine_normalize:
+        chain.append(faiss.NormalizationTransform(d))
+    return chain
+
+
+def _apply(chain: list, vectors: np.ndarray) -> np.ndarray:
+    for transform in chain:
+        vectors = transform.apply(vectors)
+    return vectors
+
+
+def build_index(vectors: np.ndarray, name: str = None, ids=None):
+    """
+    按engine_index的配置建立索引并加入vectors，ids为向量的外部id（默认0..n-1）。
+    结构为 [IndexPreTransform(PCA/归一化) ->] IndexIDMap2 -> 核心索引；
+    engine_normalize时核心索引使用内积(METRIC_INNER_PRODUCT)，对单位向量即余弦相似度。
+    需要训练的索引在向量数少于engine_min_train_size时退回精确检索(Flat)。
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, d = vectors.shape
+    ids = np.arange(n, dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64)
+    chain = _transforms(vectors)
+    space = _apply(chain, vectors)
+    metric = faiss.METRIC_INNER_PRODUCT if engine_normalize else faiss.METRIC_L2
+    spec = index_spec(n, space.shape[1], name)
+    index = faiss.index_factory(space.shape[1], spec, metric)
+    if not index.is_trained:
+        if n < engine_min_train_size:
+            log.info(f"{n} vectors are not enough to train {spec}, use Flat instead")
+            spec, index = "Flat", faiss.index_factory(space.shape[1], "Flat", metric)
+        else:
+            index.train(space)
+    _tune(index)
+    try:
+        # IVF索引按位置取回向量需要direct map
+        faiss.extract_index_ivf(index).make_direct_map()
+    except RuntimeError:
+        pass
+    index = faiss.IndexIDMap2(index)
+    if chain:
+        index = faiss.IndexPreTransform(chain[-1], index)
+        for transform in reversed(chain[:-1]):
+            index.prepend_transform(transform)
+    index.add_with_ids(vectors, ids)
+    if spec != "Flat" or engine_pca_dim is not None:
+        log.info(f"build {spec} index, recall@10={recall_at_k(index, vectors, ids=ids):.3f}")
+    return index
+
+
+def recall_at_k(index, vectors: np.ndarray, k: int = 10, queries: int = 256, ids=None) -> float:
+    """
+    随机取queries个向量查询，index的top-k结果与精确检索top-k的平均重合比例
+    精确检索在原始维度上进行（engine_normalize时先归一化），因此也包含了PCA降维的损失
+    ids: vectors在index中的外部id，默认0..n-1
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    ids = np.arange(len(vectors), dtype=np.int64) if ids is None else np.asarray(ids, dtype=np.int64)
+    k = min(k, len(vectors))
+    if k == 0:
+        return 1.0
+    sample = vectors[np.random.default_rng(0).choice(len(vectors), min(queries, len(vectors)), replace=False)]
+    flat = faiss.IndexFlatL2(vectors.shape[1])
+    if engine_normalize:
+        flat = faiss.IndexPreTransform(faiss.NormalizationTransform(vectors.shape[1]), flat)
+    flat.add(vectors)
+    _, truth = flat.search(sample, k)
+    truth = ids[truth]
+    _, found = index.search(sample, k)
+    return float(np.mean([len(set(t) & set(f)) / k for t, f in zip(truth.tolist(), found.tolist())]))
+
+
+def evaluate_index(vectors: np.ndarray, names: list[str] = None, k: int = 10) -> list[dict]:
+    """比较不同索引的建立耗时、查询耗时(每条，秒)、内存(序列化后的字节数)和recall@k"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    results = []
+    for name in names or list(_INDEX_PRESETS):
+        start = time.perf_counter()
+        index = build_index(vectors, name)
+        build = time.perf_counter() - start
+        queries = vectors[: min(1000, len(vectors))]
+        start = time.perf_counter()
+        index.search(queries, k)
+        query = (time.perf_counter() - start) / max(1, len(queries))
+        results.append(
+            {
+                "index": index_spec(*vectors.shape, name),
+                "build": build,
+                "query": query,
+                "bytes": len(faiss.serialize_index(index)),
+                f"recall@{k}": recall_at_k(index, vectors, k),
+            }
+        )
+    return results
+
 
 class SearchEngine:
-    def __init__(self, engine, table):
+    """
+    以实体id为外部id的向量检索引擎（faiss.IndexIDMap2），增删改都直接使用实体id，不再维护位置映射。
+    table 为只读的 实体id -> 内部位置，保留给只需要判断实体是否存在的旧代码。
+    索引带有PCA/归一化变换时（见build_index）有两种向量空间：
+    - 输入空间：insert_many/search_by_vector 的向量，与嵌入模型的输出相同；
+      get_vector_by_id 只能返回逆变换后的近似（单位长度/PCA重建）
+    - 索引空间：变换后的向量，index_vectors()/index_matrix() 和所有距离、相似度计算都在索引空间进行
+    """
+
+    def __init__(self, engine, table: dict = None):
+        """
+        engine: IndexIDMap2；旧格式的索引（按位置存放）需要同时传入table（实体id -> 位置），会转换为IndexIDMap2
+        """
+        if self._id_index_of(engine) is None:
+            engine = self._from_positions(engine, {int(k): int(v) for k, v in table.items()})
+        self._set_engine(engine)
+
+    @staticmethod
+    def _id_index_of(engine):
+        if isinstance(engine, faiss.IndexIDMap2):
+            return engine
+        if isinstance(engine, faiss.IndexPreTransform):
+            inner = faiss.downcast_index(engine.index)
+            return inner if isinstance(inner, faiss.IndexIDMap2) else None
+        return None
+
+    def _set_engine(self, engine):
         self.engine = engine
-        self.table = table
-        self.table = {int(k): int(v) for k, v in table.items()}
-        self.reverse_table = {int(v): int(k) for k, v in table.items()}
+        self.id_index = self._id_index_of(engine)
+        self._invalidate()
+
+    def _invalidate(self):
+        self._table = None
+        self._vectors = None
+        self._sq_norms = None
+
+    @staticmethod
+    def _from_positions(index, table: dict):
+        ids = np.fromiter(table.keys(), dtype=np.int64, count=len(table))
+        positions = np.fromiter(table.values(), dtype=np.int64, count=len(table))
+        valid = positions < index.ntotal
+        vectors = index.reconstruct_n(0, index.ntotal)
+        return build_index(vectors[positions[valid]], ids=ids[valid])
+
+    @property
+    def ids(self) -> np.ndarray:
+        return faiss.vector_to_array(self.id_index.id_map)
+
+    @property
+    def table(self) -> dict[int, int]:
+        if self._table is None:
+            self._table = {id: i for i, id in enumerate(self.ids.tolist())}
+        return self._table
+
+    def rows_of(self, entity_ids) -> np.ndarray:
+        """实体id在 index_vectors() 中的行号"""
+        return np.array([self.table[i] for i in np.asarray(entity_ids).tolist()], dtype=np.int64)
+
+    def index_vectors(self) -> np.ndarray:
+        """
+        全部向量（索引空间，即PCA/归一化之后，不是嵌入模型的原始向量）组成的连续矩阵（只读），第i行对应ids[i]。
+        返回的是副本并缓存到引擎被修改为止，之后的插入/删除不会使已经取得的矩阵失效
+        """
+        if self._vectors is None:
+            inner = faiss.downcast_index(self.id_index.index)
+            n, d = self.id_index.ntotal, self.id_index.d
+            if isinstance(inner, faiss.IndexFlat) and n > 0:
+                vectors = faiss.rev_swig_ptr(inner.get_xb(), n * d).reshape(n, d).copy()
+            else:
+                vectors = inner.reconstruct_n(0, n) if n > 0 else np.empty((0, d), dtype=np.float32)
+            vectors.flags.writeable = False
+            self._vectors = vectors
+            self._sq_norms = np.einsum("ij,ij->i", vectors, vectors)
+        return self._vectors
+
+    def transform(self, vectors) -> np.ndarray:
+        """把输入空间的向量变换到索引空间"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if isinstance(self.engine, faiss.IndexPreTransform):
+            for i in range(self.engine.chain.size()):
+                vectors = faiss.downcast_VectorTransform(self.engine.chain.at(i)).apply(vectors)
+        return vectors
+
+    def index_matrix(self, entity_ids) -> np.ndarray:
+        """entity_ids对应的索引空间向量矩阵（复制）"""
+        return self.index_vectors()[self.rows_of(entity_ids)]
+
+    def pairwise_similarity(self, ids_a, ids_b=None) -> np.ndarray:
+        """ids_a × ids_b 的余弦相似度矩阵（一次矩阵乘法），ids_b默认为全部实体（按ids的顺序）"""
+        vectors = self.index_vectors()
+        a = self.rows_of(ids_a)
+        b = np.arange(len(vectors)) if ids_b is None else self.rows_of(ids_b)
+        norms = np.sqrt(self._sq_norms)
+        return (vectors[a] @ vectors[b].T) / np.maximum(norms[a, None] * norms[None, b], 1e-12)
+
+    def paired_similarity(self, ids_a, ids_b) -> np.ndarray:
+        """逐对计算 ids_a[k] 与 ids_b[k] 之间的余弦相似度（pairwise_similarity的对角线，不计算整个矩阵）"""
+        vectors = self.index_vectors()
+        a, b = self.rows_of(ids_a), self.rows_of(ids_b)
+        norms = np.sqrt(self._sq_norms)
+        similarity = np.empty(len(a), dtype=np.float32)
+        for start in range(0, len(a), _BLOCK):
+            va = vectors[a[start : start + _BLOCK]]
+            vb = vectors[b[start : start + _BLOCK]]
+            similarity[start : start + _BLOCK] = np.einsum("ij,ij->i", va, vb)
+        return similarity / np.maximum(norms[a] * norms[b], 1e-12)
+
+    def paired_distance(self, ids_a, ids_b) -> np.ndarray:
+        """逐对计算 ids_a[k] 与 ids_b[k] 之间的L2距离"""
+        vectors = self.index_vectors()
+        a, b = self.rows_of(ids_a), self.rows_of(ids_b)
+        distance = np.empty(len(a), dtype=np.float32)
+        for start in range(0, len(a), _BLOCK):
+            va = vectors[a[start : start + _BLOCK]]
+            vb = vectors[b[start : start + _BLOCK]]
+            distance[start : start + _BLOCK] = np.linalg.norm(va - vb, axis=1)
+        return distance
+
+    def pairwise_distance(self, ids_a, ids_b=None) -> np.ndarray:
+        """ids_a × ids_b 的L2距离矩阵，ids_b默认为全部实体（按ids的顺序），用矩阵乘法计算"""
+        vectors = self.index_vectors()
+        a = self.rows_of(ids_a)
+        b = np.arange(len(vectors)) if ids_b is None else self.rows_of(ids_b)
+        squared = (
+            self._sq_norms[a, None] + self._sq_norms[None, b] - 2 * vectors[a] @ vectors[b].T
+        )
+        return np.sqrt(np.maximum(squared, 0))
+
+    def knn_all(self, k: int, entity_ids=None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        精确计算每个实体最近的k个实体（不包括本身），分块做矩阵乘法。
+        返回 (近邻id, 距离)，形状均为 len(entity_ids) × k，按距离升序
+        """
+        ids = self.ids
+        entity_ids = ids if entity_ids is None else np.asarray(entity_ids, dtype=np.int64)
+        rows = self.rows_of(entity_ids)
+        k = min(k, len(ids) - 1)
+        neighbours = np.empty((len(rows), max(k, 0)), dtype=np.int64)
+        distances = np.empty((len(rows), max(k, 0)), dtype=np.float32)
+        if k <= 0:
+            return neighbours, distances
+        step = max(1, _BLOCK * 512 // len(ids))
+        for start in range(0, len(rows), step):
+            block = rows[start : start + step]
+            distance = self.pairwise_distance(entity_ids[start : start + step])
+            distance[np.arange(len(block)), block] = np.inf
+            top = np.argpartition(distance, k - 1, axis=1)[:, :k]
+            top_distance = np.take_along_axis(distance, top, axis=1)
+            order = np.argsort(top_distance, axis=1, kind="stable")
+            neighbours[start : start + step] = ids[np.take_along_axis(top, order, axis=1)]
+            distances[start : start + step] = np.take_along_axis(top_distance, order, axis=1)
+        return neighbours, distances
+
+    def search_by_ids(self, entity_ids, top_k: int = 10) -> tuple[np.ndarray, np.ndarray]:
+        """
+        用索引批量搜索每个实体相似的top_k个实体（不包括本身）。
+        返回 (近邻id, L2距离)，形状均为 len(entity_ids) × top_k；结果不足时id为-1、距离为inf
+        """
+        entity_ids = np.asarray(entity_ids, dtype=np.int64)
+        _, labels = self.id_index.search(self.index_matrix(entity_ids), top_k + 1)
+        # 把本身移到最后再截掉，其余结果保持原来的顺序
+        order = np.argsort(labels == entity_ids[:, None], axis=1, kind="stable")
+        labels = np.take_along_axis(labels, order, axis=1)[:, :top_k]
+        found = labels >= 0
+        distances = np.full(labels.shape, np.inf, dtype=np.float32)
+        distances[found] = self.paired_distance(
+            np.broadcast_to(entity_ids[:, None], labels.shape)[found], labels[found]
+        )
+        return labels, distances
+
+    def search_in(self, queries: np.ndarray, top_k: int, allowed_ids) -> np.ndarray:
+        """
+        用索引空间的向量queries搜索，只返回allowed_ids中的实体（IDSelectorBatch过滤，不建新索引）
+        返回近邻id，形状为 len(queries) × top_k，结果不足时为-1
+        """
+        allowed_ids = np.ascontiguousarray(allowed_ids, dtype=np.int64)
+        selector = faiss.IDSelectorBatch(len(allowed_ids), faiss.swig_ptr(allowed_ids))
+        _, labels = self.id_index.search(
+            np.ascontiguousarray(queries, dtype=np.float32),
+            top_k,
+            params=_search_params(self.id_index.index, selector),
+        )
+        return labels
+
+    @property
+    def reverse_table(self) -> dict[int, int]:
+        return {i: id for id, i in self.table.items()}
+
+    def __contains__(self, entity_id: int) -> bool:
+        return entity_id in self.table
+
+    def __len__(self) -> int:
+        return self.id_index.ntotal
 
     def search_by_id(self, entity_id: int, top_k: int = 10) -> list[int]:
         """根据实体id搜索相似top_k节点，不包括本身"""
-        res = self.engine.search(
-            self.get_vector_by_id(entity_id)[np.newaxis, :], top_k + 1
-        )
-        ids = [self.reverse_table[i] for i in res[1][0] if i!=-1][1:]
-        return ids
+        labels, _ = self.search_by_ids([entity_id], top_k)
+        return [i for i in labels[0].tolist() if i != -1]
 
     def search_by_vector(self, vector: list[float], top_k: int = 10) -> list[int]:
         """根据向量搜索相似top_k节点"""
         res = self.engine.search(np.array([vector], dtype=np.float32), top_k)
-        ids = [self.reverse_table[i] for i in res[1][0]]
+        ids = [i for i in res[1][0].tolist() if i != -1]
         return ids
 
     def search_by_vector_raw(self, vector: list[float], top_k: int = 10) -> list[int]:
-        """根据向量搜索相似top_k节点"""
+        """根据向量搜索相似top_k节点，不足top_k个时用-1补齐"""
         res = self.engine.search(np.array([vector], dtype=np.float32), top_k)
-        ids = [i for i in res[1][0]]
-        return ids
+        return res[1][0].tolist()
 
     @staticmethod
     def L2_distance(
@@ -50,53 +398,98 @@ class SearchEngine:
         return np.linalg.norm(np.array(v1) - np.array(v2))
 
     def get_distance(self, entity_id1: int, entity_id2: int) -> float:
-        return np.linalg.norm(
-            self.get_vector_by_id(entity_id1) - self.get_vector_by_id(entity_id2)
-        )
+        """两个实体在索引空间中的L2距离，与search_by_ids等返回的距离一致"""
+        return float(self.paired_distance([entity_id1], [entity_id2])[0])
+
+    def get_vector_by_id(self, entity_id: int):
+        """
+        实体的向量经过逆变换回到输入空间的近似：归一化不可逆，结果是单位向量；
+        使用PCA时是降维后的向量的重建，不等于插入时的原始向量
+        """
+        return self.engine.reconstruct(entity_id)
+
+    def get_vectors_by_ids(self, entity_ids: list[int]) -> np.ndarray:
+        """一次取出多个实体的向量（与get_vector_by_id相同的近似），第i行对应entity_ids[i]"""
+        return self.engine.reconstruct_batch(np.asarray(entity_ids, dtype=np.int64))
+
+    def insert_many(self, entity_ids: list[int], vectors):
+        """插入一批新的实体id和向量，id已经存在时抛出ValueError"""
+        entity_ids = np.asarray(entity_ids, dtype=np.int64)
+        if len(entity_ids) == 0:
+            return
+        if len(np.unique(entity_ids)) != len(entity_ids) or any(i in self.table for i in entity_ids.tolist()):
+            raise ValueError("entity id already exists in the search engine")
+        self.engine.add_with_ids(np.asarray(vectors, dtype=np.float32).reshape(len(entity_ids), -1), entity_ids)
+        self._invalidate()
+
+    def delete_many(self, entity_ids: list[int]):
+        """删除一批实体id，不存在的id忽略"""
+        entity_ids = np.array([i for i in set(entity_ids) if i in self.table], dtype=np.int64)
+        if len(entity_ids) == 0:
+            return
+        if isinstance(faiss.downcast_index(self.id_index.index), faiss.IndexFlat):
+            self.id_index.remove_ids(entity_ids)
+        else:
+            # 近似索引删除后位置不会前移（或不支持删除），保留训练结果重新加入剩下的向量
+            keep = ~np.isin(self.ids, entity_ids)
+            self._rebuild(self.ids[keep], self.index_vectors()[keep])
+        self._invalidate()
+
+    def update_many(self, entity_ids: list[int], vectors):
+        """修改一批实体id的向量，不存在的id直接插入"""
+        self.delete_many(entity_ids)
+        self.insert_many(entity_ids, vectors)
+
+    def remap_ids(self, id_map: dict[int, int], drop_missing: bool = True):
+        """
+        按id_map（旧id -> 新id，如realloc_id的返回值）修改实体id
+        drop_missing: 不在id_map中的实体是否删除，否则保持原id
+        """
+        ids = self.ids.tolist()
+        if drop_missing:
+            self.delete_many([i for i in ids if i not in id_map])
+            ids = self.ids.tolist()
+        new_ids = np.array([id_map.get(i, i) for i in ids], dtype=np.int64)
+        if len(np.unique(new_ids)) != len(new_ids):
+            raise ValueError("id_map maps two entities to the same id")
+        faiss.copy_array_to_vector(new_ids, self.id_index.id_map)
+        self.id_index.construct_rev_map()
+        self._invalidate()
+
+    def with_vectors(self, ids, vectors: np.ndarray) -> "SearchEngine":
+        """
+        与本引擎使用同样变换链和训练结果的新引擎，只包含 ids/vectors。
+        vectors为索引空间的向量，直接加入，不会再经过一次变换
+        """
+        engine = SearchEngine(faiss.deserialize_index(faiss.serialize_index(self.engine)))
+        engine._rebuild(np.asarray(ids, dtype=np.int64), vectors)
+        return engine
+
+    def _rebuild(self, ids: np.ndarray, vectors: np.ndarray):
+        """vectors为索引空间的向量（需要是副本），直接加入IndexIDMap2，不再经过变换"""
+        # reset保留训练结果和变换链（NormalizationTransform不支持clone_index）
+        self.id_index.reset()
+        self._invalidate()
+        self.id_index.add_with_ids(np.ascontiguousarray(vectors, dtype=np.float32), ids)
 
     def insert_entity(self, entity_id: int, vector: list[float]):
         """插入实体id和向量"""
-        vector_np = np.array([vector], dtype=np.float32)  # FAISS 需要 float32 类型
-        self.engine.add(vector_np)
-        self.table[entity_id] = self.search_by_vector_raw(vector, 1)[0]
-
-    def get_vector_by_id(self, entity_id: int):
-        return self.engine.reconstruct(self.table[entity_id])
+        self.insert_many([entity_id], [vector])
 
     def delete_entity(self, entity_id: int):
         """删除实体id"""
-        self.engine.remove_ids([self.table[entity_id]])
-        self.table.pop(entity_id)
+        self.delete_many([entity_id])
 
     def change_entity(self, entity_id: int, vector: list[float]):
         """修改实体id的向量"""
-        # FAISS 需要 int64 类型的 ID
-        entity_index = np.array([self.table[entity_id]], dtype=np.int64)
-
-        # 移除旧的向量
-        self.engine.remove_ids(entity_index)
-
-        # 添加新的向量（确保是 2D 数组）
-        vector_np = np.array([vector], dtype=np.float32)  # FAISS 需要 float32 类型
-        self.engine.add(vector_np)
-
-        # 更新索引表，新的 ID 是 `ntotal - 1`
-        self.table[entity_id] = self.search_by_vector_raw(vector, 1)[0]
+        self.update_many([entity_id], [vector])
 
     def merge_to_one(self, new_id: int, entity_ids: list[int], vector: list[float]):
         """合并多个实体id为一个实体id"""
-        # 删除旧的向量
-        self.engine.remove_ids(entity_ids)
-        # 添加新的向量
-        self.engine.add(vector)
-        # 删除旧的实体id
-        for entity_id in entity_ids:
-            self.table.pop(entity_id)
-        # 更新新的实体id
-        self.table[new_id] = self.search_by_vector_raw(vector, 1)[0]
+        self.delete_many(list(entity_ids) + [new_id])
+        self.insert_many([new_id], [vector])
 
     def save_state(self, folder_path: str):
-        self.table = {int(k): int(v) for k, v in self.table.items()}
         save_json(os.path.join(folder_path, "table.json"), self.table)
         faiss.write_index(self.engine, os.path.join(folder_path, "engine.ann"))
 
@@ -113,7 +506,10 @@ def initialize_entity_engine(
     如果engine_path和table_path都不为None，且文件存在，则直接读取文件,不用重新初始化。
     如果engine_path和table_path都不为None，但文件不存在，则重新初始化，保存到engine_path和table_path。
     level代表使用的文本描述的编号，-1代表最后一个描述。
+    level为-1时从共享向量区（见vector_arena.py）的 "entity" 子索引复制出引擎，已经嵌入过的文本不会再次请求。
     """
+    from ...src.utils.vector_arena import initialize_vector_arena
+
     if (
         engine_path is not None
         and table_path is not None
@@ -123,27 +519,37 @@ def initialize_entity_engine(
         entity_engine = faiss.read_index(engine_path)
         entity_table = load_json(table_path)
         return SearchEngine(entity_engine, entity_table)
-    entitis = graph_structure(
-        type=[GraphStructureType.entity_node], return_type="object"
-    )[0]
-    all_op = []
-    for i in range(0, len(entitis), 16):
-        vectorization_op = EmbeddingEntityoperation(entitis[i : i + 16], level=level)
-        all_op.append(vectorization_op)
-    results = execute_operator(
-        all_op,
-        cached_file_path=engine_path.replace(".ann", ".json"),
-        need_read_from_cache=True,
-    )
-    vector_np = np.array(results, dtype=np.float32)
-    entity_engine = faiss.IndexFlatL2(2048)
-    entity_engine.add(vector_np)
-    entity_table = {entity.id: i for i, entity in enumerate(entitis)}
+    if level == -1:
+        engine = initialize_vector_arena(rebuild=True).view("entity").to_engine()
+    else:
+        entitis = graph_structure(
+            type=[GraphStructureType.entity_node], return_type="object"
+        )[0]
+        all_op = []
+        for i in range(0, len(entitis), 16):
+            vectorization_op = EmbeddingEntityoperation(entitis[i : i + 16], level=level)
+            all_op.append(vectorization_op)
+        results = execute_operator(
+            all_op,
+            cached_file_path=engine_path.replace(".ann", ".json"),
+            need_read_from_cache=True,
+        )
+        vector_np = np.asarray(results, dtype=np.float32)
+        engine = SearchEngine(build_index(vector_np, ids=[entity.id for entity in entitis]))
     if engine_path is not None:
-        faiss.write_index(entity_engine, engine_path)
+        faiss.write_index(engine.engine, engine_path)
     if table_path is not None:
-        save_json(table_path, entity_table)
-    return SearchEngine(entity_engine, entity_table)
+        save_json(table_path, engine.table)
+    return engine
+
+
+def clean_title(title: str) -> str:
+    """去掉标题中的章节编号、空白和#，剩下的文本用于标题向量"""
+    re_expression = [r"(# 第\d+部分)", r"(## 第\d+章)", r"(## \d+\.\d+)"]
+    # re_expression=[r"(## 第\d+章)", r"(### \d+\.\d+节)",r"(#### \d+\.\d+\.\d+节)"]
+    for re_exp in re_expression:
+        title = re.sub(re_exp, "", title)
+    return title.replace(" ", "").replace("#", "").replace("\n", "")
 
 
 def initialize_with_title(
@@ -164,14 +570,7 @@ def initialize_with_title(
         entitis = graph_structure(
             type=[GraphStructureType.entity_node], return_type="object"
         )[0]
-    entity_titles = [entity.title for entity in entitis]
-    
-    re_expression = [r"(# 第\d+部分)", r"(## 第\d+章)", r"(## \d+\.\d+)"]
-    # re_expression=[r"(## 第\d+章)", r"(### \d+\.\d+节)",r"(#### \d+\.\d+\.\d+节)"]
-    
-    for re_exp in re_expression:
-        entity_titles = [re.sub(re_exp, "", entity) for entity in entity_titles]
-    entity_titles = [entity.replace(" ","").replace("#","").replace("\n","") for entity in entity_titles]
+    entity_titles = [clean_title(entity.title) for entity in entitis]
     table=[]
     for title,ent  in zip(entity_titles,entitis):
         if title=="":
@@ -198,9 +597,8 @@ def initialize_with_title(
         cached_file_path=engine_path.replace(".ann", ".json"),
         # need_read_from_cache=True,
     )
-    vector_np = np.array(results, dtype=np.float32)
-    entity_engine = faiss.IndexFlatL2(2048)
-    entity_engine.add(vector_np)
+    vector_np = np.asarray(results, dtype=np.float32)
+    entity_engine = build_index(vector_np)
     entity_table = {i:i for i in range(len(entitis))}
     if engine_path is not None:
         faiss.write_index(entity_engine, engine_path)
@@ -213,6 +611,12 @@ def initialize_with_title(
 def initialize_section_engine(
     sections: list[Section] = None, engine_path: str = None, table_path: str = None
 ):
+    """
+    章节（标题和概括）的引擎，文件存在时直接读取；
+    否则从共享向量区的 "section" 子索引复制出引擎（sections不为None时只包括这些章节）
+    """
+    from ...src.utils.vector_arena import initialize_vector_arena
+
     if (
         engine_path is not None
         and table_path is not None
@@ -222,27 +626,29 @@ def initialize_section_engine(
         entity_engine = faiss.read_index(engine_path)
         entity_table = load_json(table_path)
         return SearchEngine(entity_engine, entity_table)
-    sections = graph_structure(
-        type=[GraphStructureType.section_node], return_type="object"
-    )[0]
+    view = initialize_vector_arena(rebuild=True).view("section")
+    if sections is not None:
+        view = view.filter([section.id for section in sections])
+    section_engine = view.to_engine()
+    if engine_path is not None:
+        faiss.write_index(section_engine.engine, engine_path)
+    if table_path is not None:
+        save_json(table_path, section_engine.table)
+    return section_engine
+
+
+def embed_strings(texts: list[str], cached_file_path: str = "") -> np.ndarray:
+    """字符串的原始嵌入向量（输入空间，与嵌入模型的输出相同），第i行对应texts[i]"""
     all_op = []
-    for i in range(0, len(sections), 16):
-        vectorization_op = EmbeddingSectionoperation(sections[i : i + 16])
+    for i in range(0, len(texts), 16):
+        vectorization_op = Embeddingstroperation(texts[i : i + 16])
         all_op.append(vectorization_op)
     results = execute_operator(
         all_op,
-        cached_file_path=engine_path.replace(".ann", ".json"),
+        cached_file_path=cached_file_path,
         need_read_from_cache=True,
     )
-    vector_np = np.array(results, dtype=np.float32)
-    section_engine = faiss.IndexFlatL2(2048)
-    section_engine.add(vector_np)
-    section_table = {section.id: i for i, section in enumerate(sections)}
-    if engine_path is not None:
-        faiss.write_index(section_engine, engine_path)
-    if table_path is not None:
-        save_json(table_path, section_table)
-    return SearchEngine(section_engine, section_table)
+    return np.asarray(results, dtype=np.float32)
 
 
 def initial_engine_with_str(entities: list[Entity], engine_path: str, table_path: str):
@@ -255,20 +661,8 @@ def initial_engine_with_str(entities: list[Entity], engine_path: str, table_path
         entity_engine = faiss.read_index(engine_path)
         entity_table = load_json(table_path)
         return SearchEngine(entity_engine, entity_table)
-    all_op = []
-    for i in range(0, len(entities), 16):
-        vectorization_op = Embeddingstroperation(entities[i : i + 16])
-        all_op.append(vectorization_op)
-    print("all_op", len(all_op))    
-    results = execute_operator(
-        all_op,
-        cached_file_path=engine_path.replace(".ann", ".json"),
-        need_read_from_cache=True,
-    )
-    print("results",len(results))
-    vector_np = np.array(results, dtype=np.float32)
-    entity_engine = faiss.IndexFlatL2(2048)
-    entity_engine.add(vector_np)
+    vector_np = embed_strings(entities, engine_path.replace(".ann", ".json"))
+    entity_engine = build_index(vector_np)
     entity_table = {i:i for i in range(len(entities))}
     if engine_path is not None:
         faiss.write_index(entity_engine, engine_path)
@@ -279,7 +673,6 @@ def initial_with_meta(meta_path:str):
     entities=load_json(meta_path)
     embeds = [ent['embedding'] for ent in entities]
     vector_np = np.array(embeds, dtype=np.float32)
-    entity_engine = faiss.IndexFlatL2(2048)
-    entity_engine.add(vector_np)
+    entity_engine = build_index(vector_np)
     entity_table = {i:i for i in range(len(entities))}
     return SearchEngine(entity_engine, entity_table)
\ No newline at end of file
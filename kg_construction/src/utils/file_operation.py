@@ -1,10 +1,14 @@
 import json
 import logging as log
 import io
+from ...src.utils.graph_session import active_session
+from ...src.utils.serializer import dump_file, load_file
 
 def load_json(file_path: str):
-    with open(file_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    session = active_session(file_path)
+    if session is not None:
+        return session.read(file_path)
+    return load_file(file_path)
 
 
 def attach_json(file_path: str, data):
@@ -13,18 +17,21 @@ def attach_json(file_path: str, data):
 
 
 def save_json(file_path: str, data: list):
+    """数据类对象由序列化后端直接编码，格式（紧凑/缩进）由json_pretty决定"""
+    session = active_session(file_path)
+    if session is None:
+        dump_file(file_path, data)
+        return
     if len(data) == 0:
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump([], f, ensure_ascii=False, indent=4)
-            return
+        session.write(file_path, [])
+        return
     if isinstance(data,dict):
         data_to_save = data
     elif not isinstance(data[0],dict) and not isinstance(data[0],list):
         data_to_save = [item.to_dict() if not isinstance(item,str)  else item for item in data ]
     else:
         data_to_save = data
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(data_to_save, f, ensure_ascii=False, indent=4)
+    session.write(file_path, data_to_save)
 
 
 def jsonalize(data):
@@ -0,0 +1,157 @@
+"""进程内的图会话
+
+流水线的每个阶段都会多次读取、改写 graph/ 下的文件（realloc_id 读6个文件写8个文件，
+deduplicate_relation 之后又会再做一次）。会话生效期间：
+- load_json/save_json/load_graph_file 对 graph/ 下文件的读写都在内存中完成
+- 被写过的文件记为脏文件，阶段结束时一次性写回磁盘
+- 写回时先写入所有临时文件再逐个替换，阶段中途失败时不写回，磁盘上保持上一阶段的结果
+
+会话在多个阶段之间保留内存中的数据，文件在会话外被修改时（按 mtime/size 判断）重新读取。
+"""
+
+import contextlib
+import logging
+import os
+
+from ...src.utils.serializer import dump_file, load_file
+
+log = logging.getLogger(__name__)
+
+_active: "GraphSession | None" = None
+
+
+def _clone(value):
+    """复制JSON结构，调用方修改返回值不会影响会话中的数据"""
+    if isinstance(value, dict):
+        return {key: _clone(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_clone(item) for item in value]
+    return value
+
+
+def _version(path: str) -> list | None:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+class GraphSession:
+    """在内存中保存一个图目录下的文件，按阶段写回"""
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.files: dict[str, list | dict] = {}
+        self.versions: dict[str, list | None] = {}
+        self.dirty: set[str] = set()
+        # 每次写入或丢弃修改时加1，派生的缓存（如邻接索引）据此失效
+        self.revision = 0
+        # 写回磁盘之后执行的回调，例如删除阶段的预写日志
+        self.after_flush: list = []
+
+    def owns(self, path: str) -> bool:
+        path = os.path.abspath(path)
+        return os.path.dirname(path) == self.root and path.endswith(".json")
+
+    def _load(self, path: str):
+        from ...src.config import graph_storage_backend
+        from ...src.utils.graph_store import load_records
+
+        if graph_storage_backend == "columnar":
+            data = load_records(path)
+        else:
+            data = load_file(path)
+        self.files[path] = data
+        self.versions[path] = _version(path)
+        return data
+
+    def peek(self, path: str):
+        """只读访问会话中的数据，不复制；调用方不能修改返回值"""
+        path = os.path.abspath(path)
+        if path in self.files:
+            return self.files[path]
+        return self._load(path)
+
+    def read(self, path: str):
+        return _clone(self.peek(path))
+
+    def write(self, path: str, data):
+        path = os.path.abspath(path)
+        self.files[path] = _clone(data)
+        self.dirty.add(path)
+        self.revision += 1
+
+    def exists(self, path: str) -> bool:
+        return os.path.abspath(path) in self.files or os.path.exists(path)
+
+    def refresh(self):
+        """丢弃在会话外被修改过的文件"""
+        for path in list(self.files):
+            if path not in self.dirty and _version(path) != self.versions[path]:
+                del self.files[path]
+                del self.versions[path]
+
+    def discard(self):
+        """丢弃尚未写回的修改"""
+        for path in self.dirty:
+            self.files.pop(path, None)
+            self.versions.pop(path, None)
+        self.dirty.clear()
+        self.after_flush.clear()
+        self.revision += 1
+
+    def flush(self):
+        """将脏文件写回磁盘：先写入全部临时文件，再逐个替换"""
+        if not self.dirty:
+            self._run_after_flush()
+            return
+        paths = sorted(self.dirty)
+        tmp_paths = []
+        try:
+            for path in paths:
+                tmp = f"{path}.tmp{os.getpid()}"
+                dump_file(tmp, self.files[path])
+                with open(tmp, "rb") as f:
+                    os.fsync(f.fileno())
+                tmp_paths.append(tmp)
+        except Exception:
+            for tmp in tmp_paths:
+                with contextlib.suppress(OSError):
+                    os.remove(tmp)
+            raise
+        for path, tmp in zip(paths, tmp_paths):
+            os.replace(tmp, path)
+            self.versions[path] = _version(path)
+        log.info(f"graph session flushed {len(paths)} files")
+        self.dirty.clear()
+        self._run_after_flush()
+
+    def _run_after_flush(self):
+        callbacks, self.after_flush = self.after_flush, []
+        for callback in callbacks:
+            callback()
+
+    @contextlib.contextmanager
+    def stage(self):
+        """一个阶段：期间的读写都在内存中，正常结束时写回，异常时丢弃修改"""
+        global _active
+        previous = _active
+        self.refresh()
+        _active = self
+        try:
+            yield self
+        except BaseException:
+            self.discard()
+            raise
+        else:
+            self.flush()
+        finally:
+            _active = previous
+
+
+def active_session(path: str | None = None) -> GraphSession | None:
+    """当前生效的会话；给出path时只在该文件属于会话目录时返回"""
+    if _active is None or (path is not None and not _active.owns(path)):
+        return None
+    return _active
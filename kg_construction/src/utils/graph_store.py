@@ -0,0 +1,243 @@
+"""图结构文件的列式存储
+
+graph/ 目录下的 JSON 文件仍然是唯一的数据来源，本模块为每个文件维护一份列式副本：
+- 整数/布尔字段存为 NumPy 数组，字符串字段存为一个字符串堆加偏移量，
+  列表字段存为展开后的值加偏移量，其它结构（如 Section.example）存为 JSON 字符串
+- 副本保存在 graph/.columnar/<文件名>/ 下，数组以内存映射方式读取
+- 以 JSON 文件的 (mtime, size) 作为版本，文件被改写后自动重建
+
+同一进程内重复读取同一个文件时直接复用已加载的列，不再解析 JSON；
+只需要部分字段时（如邻接关系、最大id）直接读取对应的列。
+"""
+
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+COLUMNAR_DIR = ".columnar"
+
+
+def _infer_kind(values: list) -> str:
+    if all(isinstance(v, bool) for v in values):
+        return "bool"
+    if all(type(v) is int for v in values):
+        return "int"
+    if all(isinstance(v, str) for v in values):
+        return "str"
+    if all(isinstance(v, list) for v in values):
+        items = [item for v in values for item in v]
+        if all(type(item) is int for item in items):
+            return "int_list"
+        if all(isinstance(item, str) for item in items):
+            return "str_list"
+    return "json"
+
+
+class ColumnTable:
+    """一组结构相同的记录（节点或关系）的列式表示"""
+
+    def __init__(self, size: int, schema: list, columns: dict, text: str):
+        """
+        size: 记录条数
+        schema: [(字段名, 类型)]，类型为 bool/int/str/int_list/str_list/json
+        columns: 列名 -> 数组
+        text: 所有字符串拼接成的字符串堆
+        """
+        self.size = size
+        self.schema = schema
+        self.columns = columns
+        self.text = text
+        self._edge_pairs: frozenset | None = None
+
+    def __len__(self) -> int:
+        return self.size
+
+    @classmethod
+    def from_records(cls, records: list[dict]) -> "ColumnTable":
+        fields = list(dict.fromkeys(key for record in records for key in record))
+        pieces, position = [], 0
+        columns, schema = {}, []
+
+        def add_strings(strings) -> np.ndarray:
+            nonlocal position
+            offsets = np.empty(len(strings) + 1, dtype=np.int64)
+            offsets[0] = position
+            for i, string in enumerate(strings):
+                pieces.append(string)
+                position += len(string)
+                offsets[i + 1] = position
+            return offsets
+
+        for name in fields:
+            present = [name in record for record in records]
+            values = [record[name] for record in records if name in record]
+            kind = _infer_kind(values)
+            if not all(present):
+                columns[f"{name}.present"] = np.array(present, dtype=bool)
+            # 缺失的字段用空值占位，读取时按 present 跳过
+            full = [record.get(name) for record in records]
+            if kind == "bool":
+                columns[f"{name}.values"] = np.array([bool(v) for v in full], dtype=bool)
+            elif kind == "int":
+                columns[f"{name}.values"] = np.array(
+                    [v if v is not None else 0 for v in full], dtype=np.int64
+                )
+            elif kind == "str":
+                columns[f"{name}.offsets"] = add_strings([v or "" for v in full])
+            elif kind == "json":
+                columns[f"{name}.offsets"] = add_strings(
+                    [json.dumps(v, ensure_ascii=False) for v in full]
+                )
+            else:
+                lists = [v or [] for v in full]
+                columns[f"{name}.offsets"] = np.cumsum(
+                    [0] + [len(v) for v in lists], dtype=np.int64
+                )
+                items = [item for v in lists for item in v]
+                if kind == "int_list":
+                    columns[f"{name}.values"] = np.array(items, dtype=np.int64)
+                else:
+                    columns[f"{name}.items"] = add_strings(items)
+            schema.append((name, kind))
+        return cls(len(records), schema, columns, "".join(pieces))
+
+    def has(self, name: str) -> bool:
+        return any(field == name for field, _ in self.schema)
+
+    def column(self, name: str) -> np.ndarray:
+        """整数/布尔字段的数组（缺失的位置为0）"""
+        return self.columns[f"{name}.values"]
+
+    def _strings(self, offsets: np.ndarray) -> list[str]:
+        text, bounds = self.text, offsets.tolist()
+        return [text[bounds[i] : bounds[i + 1]] for i in range(len(bounds) - 1)]
+
+    def values(self, name: str, kind: str) -> list:
+        """某个字段所有记录的Python值"""
+        if kind in ("bool", "int"):
+            return self.column(name).tolist()
+        if kind == "str":
+            return self._strings(self.columns[f"{name}.offsets"])
+        if kind == "json":
+            return [json.loads(v) for v in self._strings(self.columns[f"{name}.offsets"])]
+        bounds = self.columns[f"{name}.offsets"].tolist()
+        if kind == "int_list":
+            items = self.columns[f"{name}.values"].tolist()
+        else:
+            items = self._strings(self.columns[f"{name}.items"])
+        return [items[bounds[i] : bounds[i + 1]] for i in range(self.size)]
+
+    def records(self) -> list[dict]:
+        """还原为与JSON文件内容相同的字典列表，每次调用都返回新的对象"""
+        rows = [{} for _ in range(self.size)]
+        for name, kind in self.schema:
+            values = self.values(name, kind)
+            present = self.columns.get(f"{name}.present")
+            if present is None:
+                for row, value in zip(rows, values):
+                    row[name] = value
+            else:
+                for row, has, value in zip(rows, present.tolist(), values):
+                    if has:
+                        row[name] = value
+        return rows
+
+    def edge_pairs(self) -> set[tuple[int, int]]:
+        """关系表的双向邻接对，只读取source_id/target_id两列"""
+        if self.size == 0:
+            return set()
+        if self._edge_pairs is None:
+            source = self.column("source_id").tolist()
+            target = self.column("target_id").tolist()
+            self._edge_pairs = frozenset(zip(source, target)) | frozenset(
+                zip(target, source)
+            )
+        return set(self._edge_pairs)
+
+    def save(self, folder: str, version: list):
+        """先写入临时目录再替换，避免其他进程读到写了一半的文件"""
+        tmp = f"{folder}.tmp{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for name, array in self.columns.items():
+            np.save(os.path.join(tmp, f"{name}.npy"), array)
+        # newline=""保证换行符不被转换，偏移量才能对上
+        with open(os.path.join(tmp, "text.txt"), "w", encoding="utf-8", newline="") as f:
+            f.write(self.text)
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": version,
+                    "size": self.size,
+                    "schema": self.schema,
+                    "columns": list(self.columns),
+                },
+                f,
+            )
+        shutil.rmtree(folder, ignore_errors=True)
+        try:
+            os.rename(tmp, folder)
+        except OSError:
+            # 其他进程已经写入了同一版本
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    @classmethod
+    def load(cls, folder: str, version: list) -> "ColumnTable | None":
+        """读取与version一致的副本，不存在或版本不一致时返回None"""
+        try:
+            with open(os.path.join(folder, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["version"] != version:
+                return None
+            columns = {
+                name: np.load(os.path.join(folder, f"{name}.npy"), mmap_mode="r")
+                for name in meta["columns"]
+            }
+            with open(os.path.join(folder, "text.txt"), "r", encoding="utf-8", newline="") as f:
+                text = f.read()
+        except (OSError, ValueError, KeyError):
+            return None
+        schema = [tuple(field) for field in meta["schema"]]
+        return cls(meta["size"], schema, columns, text)
+
+
+_tables: dict[str, tuple[list, ColumnTable]] = {}
+
+
+def _version(path: str) -> list:
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def load_table(path: str) -> ColumnTable:
+    """读取JSON文件对应的列式表，文件未变化时复用内存中或磁盘上的副本"""
+    path = os.path.abspath(path)
+    version = _version(path)
+    cached = _tables.get(path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    folder = os.path.join(
+        os.path.dirname(path),
+        COLUMNAR_DIR,
+        os.path.splitext(os.path.basename(path))[0],
+    )
+    table = ColumnTable.load(folder, version)
+    if table is None:
+        with open(path, "r", encoding="utf-8") as f:
+            table = ColumnTable.from_records(json.load(f))
+        try:
+            table.save(folder, version)
+        except OSError as e:
+            log.warning(f"failed to save columnar copy of {path}: {e}")
+    _tables[path] = (version, table)
+    return table
+
+
+def load_records(path: str) -> list[dict]:
+    """与load_json相同，返回可以随意修改的新字典"""
+    return load_table(path).records()
@@ -1,41 +1,141 @@
 import os
-from ...src.model import Section, Relation, Entity
+from collections import Counter
+import numpy as np
+from ...src.model import Section, Relation, Entity, EntityTable, RelationTable
 from ...src.utils.file_operation import load_json, save_json
-from ...src.config import graph_structure_path
+from ...src.utils.graph_store import load_records, load_table
+from ...src.utils.graph_session import active_session
+from ...src.utils.adjacency import get_adjacency_index
+from ...src.config import graph_structure_path, graph_storage_backend, id_compaction_threshold
 from ...src.model.graph_structure import GraphStructureType
+def load_graph_file(path: str) -> list[dict]:
+    """读取graph目录下的JSON文件，按graph_storage_backend选择读取方式"""
+    session = active_session(path)
+    if session is not None:
+        return session.read(path)
+    if graph_storage_backend == "columnar":
+        return load_records(path)
+    return load_json(path)
+
+
+_TABLE_FILES = {
+    GraphStructureType.all_node: ["all_node"],
+    GraphStructureType.section_node: ["section_nodes"],
+    GraphStructureType.entity_node: ["entity_nodes"],
+    GraphStructureType.all_relation: ["all_relations"],
+    GraphStructureType.section_belong_connection: ["has_subsection"],
+    GraphStructureType.section_related_connection: ["section_related"],
+    GraphStructureType.section_all_relation: ["has_subsection", "section_related"],
+    GraphStructureType.has_entity_relation: ["has_entity"],
+    GraphStructureType.entity_related_relation: ["entity_related"],
+}
+_NODE_TYPES = {
+    GraphStructureType.all_node,
+    GraphStructureType.section_node,
+    GraphStructureType.entity_node,
+}
+
+
+def _list_lengths(table, name: str) -> np.ndarray:
+    if not table.has(name):
+        return np.zeros(len(table), dtype=np.int64)
+    kind = dict(table.schema)[name]
+    if kind in ("int_list", "str_list"):
+        return np.diff(table.columns[f"{name}.offsets"])
+    return np.array([len(v or []) for v in table.values(name, kind)], dtype=np.int64)
+
+
+_TABLE_COLUMNS = {
+    True: {"id": "int", "title": "str", "type": "str", "is_core_entity": "bool"},
+    False: {"id": "int", "type": "str", "source_id": "int", "target_id": "int", "is_tree": "bool"},
+}
+
+
+def _table_columns(table, expected: dict) -> dict | None:
+    """从列式存储中取出需要的列；字段部分缺失或类型不统一时返回None"""
+    kinds = dict(table.schema)
+    columns = {}
+    for name, kind in expected.items():
+        if name not in kinds:
+            continue
+        if kinds[name] != kind or f"{name}.present" in table.columns:
+            return None
+        columns[name] = table.values(name, kind)
+    return columns if "id" in columns else None
+
+
+def load_graph_table(path: str, node: bool) -> EntityTable | RelationTable:
+    """读取一个图文件的列式视图；列式存储可用时直接取列，不还原为记录"""
+    session = active_session(path)
+    if session is None and graph_storage_backend == "columnar":
+        table = load_table(path)
+        columns = _table_columns(table, _TABLE_COLUMNS[node])
+        if columns is not None and node:
+            columns["degree"] = _list_lengths(table, "to_relation") + _list_lengths(table, "from_relation")
+            return EntityTable.from_columns(columns)
+        if columns is not None:
+            return RelationTable.from_columns(columns)
+    records = session.peek(path) if session is not None else load_graph_file(path)
+    return EntityTable.from_records(records) if node else RelationTable.from_records(records)
+
+
 def get_adjacency_matrix():
-    relations=graph_structure([GraphStructureType.all_relation],return_type="object")[0]
-    adjacency_matrix_to = {(rel.source_id, rel.target_id) for rel in relations}
-    adjacency_matrix_from = {(rel.target_id, rel.source_id) for rel in relations}
-    return adjacency_matrix_to | adjacency_matrix_from
+    """所有关系的邻接索引，支持 (a, b) in 判断"""
+    return get_adjacency_index("all")
+def graph_file_exists(path: str) -> bool:
+    session = active_session(path)
+    if session is not None:
+        return session.exists(path)
+    return os.path.exists(path)
+
+
+def _max_id(path: str) -> int:
+    session = active_session(path)
+    if session is not None:
+        return max(item["id"] for item in session.peek(path))
+    return int(load_table(path).column("id").max())
+
+
+RELATION_FILES = ["has_subsection", "section_related", "has_entity", "entity_related"]
+
+
+def classify_relations(all_relations: list[dict | Relation], entity_ids) -> dict[str, list]:
+    """
+    按类型和两端节点把关系分到四个文件中，返回 文件名 -> 关系列表。
+    entity_ids代表的是实体id的集合
+    """
+    entity_ids = set(entity_ids)
+    if len(all_relations) != 0 and isinstance(all_relations[0], dict):
+        fields = [(rel["type"], rel["source_id"], rel["target_id"]) for rel in all_relations]
+    else:
+        fields = [(rel.type, rel.source_id, rel.target_id) for rel in all_relations]
+    groups = {name: [] for name in RELATION_FILES}
+    for rel, (rel_type, source_id, target_id) in zip(all_relations, fields):
+        source_is_entity = source_id in entity_ids
+        target_is_entity = target_id in entity_ids
+        if rel_type == "has_subsection":
+            groups["has_subsection"].append(rel)
+        if rel_type == "has_entity":
+            groups["has_entity"].append(rel)
+        if (
+            not source_is_entity
+            and not target_is_entity
+            and rel_type != "has_entity"
+            and rel_type != "has_subsection"
+        ):
+            groups["section_related"].append(rel)
+        if source_is_entity and target_is_entity:
+            groups["entity_related"].append(rel)
+    return groups
+
+
 def from_prev_to_new():
     
     all_relations=load_json(os.path.join(graph_structure_path,"all_relations.json"))
     all_nodes=load_json(os.path.join(graph_structure_path,"all_node.json"))
     entity_ids={node['id'] for node in all_nodes if "is_elemental" not in node.keys()}
-    has_subsection_relations = [
-        rel for rel in all_relations if rel["type"] == "has_subsection"
-    ]
-    has_entity_relations = [rel for rel in all_relations if rel["type"] == "has_entity"]
-    section_related_relations = [
-        rel
-        for rel in all_relations
-        if rel["source_id"] not in entity_ids
-        and rel["target_id"] not in entity_ids
-        and rel["type"] != "has_entity"
-        and rel["type"] != "has_subsection"
-    ]
-    entity_related_relations = [
-        rel
-        for rel in all_relations
-        if rel["source_id"] in entity_ids and rel["target_id"] in entity_ids
-    ]
-    save_json(os.path.join(graph_structure_path, "has_subsection.json"), has_subsection_relations)
-    save_json(
-        os.path.join(graph_structure_path, "section_related.json"), section_related_relations
-    )
-    save_json(os.path.join(graph_structure_path, "has_entity.json"), has_entity_relations)
-    save_json(os.path.join(graph_structure_path, "entity_related.json"), entity_related_relations)
+    for name, relations in classify_relations(all_relations, entity_ids).items():
+        save_json(os.path.join(graph_structure_path, f"{name}.json"), relations)
 
     
 def save_relation(all_relations: list[dict | Relation], entity_ids: set):
@@ -44,140 +144,103 @@ def save_relation(all_relations: list[dict | Relation], entity_ids: set):
     entity_ids代表的是实体id的集合
     用于区分relation的种类
     """
-    if isinstance(all_relations[0], dict):
-        has_subsection_relations = [
-        rel for rel in all_relations if rel["type"] == "has_subsection"
-    ]
-        has_entity_relations = [rel for rel in all_relations if rel["type"] == "has_entity"]
-        section_related_relations = [
-            rel
-            for rel in all_relations
-            if rel["source_id"] not in entity_ids
-            and rel["target_id"] not in entity_ids
-            and rel["type"] != "has_entity"
-            and rel["type"] != "has_subsection"
-        ]
-        entity_related_relations = [
-            rel
-            for rel in all_relations
-            if rel["source_id"] in entity_ids and rel["target_id"] in entity_ids
-        ]
-        if len(has_subsection_relations) != 0:
-            save_json(os.path.join(graph_structure_path, "has_subsection.json"), has_subsection_relations)
-        if len(section_related_relations) != 0:
-            save_json(
-            os.path.join(graph_structure_path, "section_related.json"), section_related_relations
-        )
-        if len(has_entity_relations) != 0:
-            save_json(os.path.join(graph_structure_path, "has_entity.json"), has_entity_relations)
-        if len(entity_related_relations) != 0:
-            save_json(os.path.join(graph_structure_path, "entity_related.json"), entity_related_relations)
-    else:
-        has_subsection_relations = [
-        rel for rel in all_relations if rel.type == "has_subsection"
-    ]
-        has_entity_relations = [rel for rel in all_relations if rel.type == "has_entity"]
-        section_related_relations = [
-            rel
-            for rel in all_relations
-            if rel.source_id not in entity_ids
-            and rel.target_id not in entity_ids
-            and rel.type != "has_entity"
-            and rel.type != "has_subsection"
-        ]
-        entity_related_relations = [
-            rel
-            for rel in all_relations
-            if rel.source_id in entity_ids and rel.target_id in entity_ids
-        ]
-        if len(has_subsection_relations) != 0:
-            save_json(os.path.join(graph_structure_path, "has_subsection.json"), has_subsection_relations)
-        if len(section_related_relations) != 0:
-            save_json(
-            os.path.join(graph_structure_path, "section_related.json"), section_related_relations
-        )
-        if len(has_entity_relations) != 0:
-            save_json(os.path.join(graph_structure_path, "has_entity.json"), has_entity_relations)
-        if len(entity_related_relations) != 0:
-            save_json(os.path.join(graph_structure_path, "entity_related.json"), entity_related_relations)
+    for name, relations in classify_relations(all_relations, entity_ids).items():
+        if len(relations) != 0:
+            save_json(os.path.join(graph_structure_path, f"{name}.json"), relations)
+
+
+def _fragmentation(ids: list[int]) -> float:
+    """id范围中空洞所占的比例；id重复或为负时返回1，必须重新编号"""
+    if len(ids) == 0:
+        return 0.0
+    unique = set(ids)
+    if len(unique) != len(ids) or min(unique) < 0:
+        return 1.0
+    return 1 - len(unique) / (max(unique) + 1)
+
 
+def _remap_ids(records: list[dict], id_dict: dict, fields: list[str], list_fields: list[str]) -> set[int]:
+    """按id_dict改写记录中的id字段，列表字段中不存在的id被丢弃；返回内容有变化的记录"""
+    changed = set()
+    for record in records:
+        before = [record[field] for field in fields] + [record[field] for field in list_fields]
+        for field in fields:
+            record[field] = id_dict[record[field]]
+        for field in list_fields:
+            record[field] = [id_dict[i] for i in record[field] if i in id_dict]
+        if before != [record[field] for field in fields] + [record[field] for field in list_fields]:
+            changed.add(id(record))
+    return changed
 
-def realloc_id(cache_path: str = graph_structure_path):
+
+def realloc_id(cache_path: str = graph_structure_path, compact: bool | None = None):
     """
     常用函数。
-    效果是将当前存储的图结构进行分配id。使得id连续
+    效果是将当前存储的图结构进行分配id，并重新生成all_node/all_relations和各个分类文件。
+    默认保持已有的id不变：删除的节点和关系只留下空洞，返回的映射是恒等映射，
+    只有内容变化了的文件才会被重新写入。
+    当空洞比例超过id_compaction_threshold（或compact=True）时整体重新编号，使得id连续，
     例如实体id:0 1 3 5，分配后变为0 1 2 3。对应的关系也会进行修改
+    重新编号按文件顺序（先章节后实体），只有这时才保证章节id在前、id连续；
+    新分配id的代码应从get_node_id()/get_relation_id()之后开始，或者沿用已有的id
+    节点或关系的id有重复时抛出ValueError
     关系的id也会进行重新分配，关联的实体的对应字段也会修改
+    返回 (旧节点id -> 新节点id, 旧关系id -> 新关系id)
     """
-    node_path = [
-        os.path.join(cache_path, "section_nodes.json"),
-        os.path.join(cache_path, "entity_nodes.json"),
-    ]
-    relation = [
-        os.path.join(cache_path, "has_subsection.json"),
-        os.path.join(cache_path, "section_related.json"),
-        os.path.join(cache_path, "has_entity.json"),
-        os.path.join(cache_path, "entity_related.json"),
-    ]
-    all_nodes = []
-    all_relations = []
-    for node in node_path:
-        if os.path.exists(node):
-            all_nodes.extend(load_json(node))
-    for rel in relation:
-        if os.path.exists(rel):
-            all_relations.extend(load_json(rel))
-    node_id_dict = {}
-    rel_id_dict = {}
-    
-    for i, node in enumerate(all_nodes):
-        node_id_dict[node["id"]] = int(i)
-    
-    for i, rel in enumerate(all_relations):
-        rel_id_dict[rel["id"]] = int(i)
-    for node in all_nodes:
-        node["id"] = node_id_dict[node["id"]]
-        node["to_relation"] = [rel_id_dict[rel_id] for rel_id in node["to_relation"] if rel_id in rel_id_dict.keys()]
-        node["from_relation"] = [
-            rel_id_dict[rel_id] for rel_id in node["from_relation"] if rel_id in rel_id_dict.keys()
-        ]
-    for rel in all_relations:
-        rel["id"] = rel_id_dict[rel["id"]]
-        rel["source_id"] = node_id_dict[rel["source_id"]]
-        rel["target_id"] = node_id_dict[rel["target_id"]]
-    
-    save_json(os.path.join(cache_path, "all_node.json"), all_nodes)
-    save_json(os.path.join(cache_path, "all_relations.json"), all_relations)
-    all_section_nodes = [node for node in all_nodes if "is_elemental" in node]
-    all_entity_nodes = [node for node in all_nodes if "is_elemental" not in node]
-    entity_ids = [node["id"] for node in all_entity_nodes]
+    node_files = {
+        name: os.path.join(cache_path, f"{name}.json")
+        for name in ["section_nodes", "entity_nodes"]
+    }
+    relation_files = {
+        name: os.path.join(cache_path, f"{name}.json") for name in RELATION_FILES
+    }
+    loaded = {}
+    for name, path in {**node_files, **relation_files}.items():
+        if graph_file_exists(path):
+            loaded[name] = load_graph_file(path)
+    all_nodes = [node for name in node_files for node in loaded.get(name, [])]
+    all_relations = [rel for name in relation_files for rel in loaded.get(name, [])]
 
-    has_subsection_relations = [
-        rel for rel in all_relations if rel["type"] == "has_subsection"
-    ]
-    has_entity_relations = [rel for rel in all_relations if rel["type"] == "has_entity"]
-    section_related_relations = [
-        rel
-        for rel in all_relations
-        if rel["source_id"] not in entity_ids
-        and rel["target_id"] not in entity_ids
-        and rel["type"] != "has_entity"
-        and rel["type"] != "has_subsection"
-    ]
-    entity_related_relations = [
-        rel
-        for rel in all_relations
-        if rel["source_id"] in entity_ids and rel["target_id"] in entity_ids
-    ]
-    
-    save_json(os.path.join(cache_path, "section_nodes.json"), all_section_nodes)
-    save_json(os.path.join(cache_path, "entity_nodes.json"), all_entity_nodes)
-    save_json(os.path.join(cache_path, "has_subsection.json"), has_subsection_relations)
-    save_json(
-        os.path.join(cache_path, "section_related.json"), section_related_relations
-    )
-    save_json(os.path.join(cache_path, "has_entity.json"), has_entity_relations)
-    save_json(os.path.join(cache_path, "entity_related.json"), entity_related_relations)
+    node_ids = [node["id"] for node in all_nodes]
+    rel_ids = [rel["id"] for rel in all_relations]
+    # 关系按id引用节点，重复的id无法区分，按id编号会把它们合并成一个
+    for kind, ids in (("节点", node_ids), ("关系", rel_ids)):
+        duplicated = sorted(i for i, count in Counter(ids).items() if count > 1)
+        if duplicated:
+            raise ValueError(f"图文件中存在重复的{kind}id: {duplicated[:10]}")
+    if compact is None:
+        compact = max(_fragmentation(node_ids), _fragmentation(rel_ids)) > id_compaction_threshold
+    if compact:
+        node_id_dict = {node_id: i for i, node_id in enumerate(node_ids)}
+        rel_id_dict = {rel_id: i for i, rel_id in enumerate(rel_ids)}
+    else:
+        node_id_dict = {node_id: node_id for node_id in node_ids}
+        rel_id_dict = {rel_id: rel_id for rel_id in rel_ids}
+    changed = _remap_ids(all_nodes, rel_id_dict, [], ["to_relation", "from_relation"])
+    changed |= _remap_ids(all_nodes, node_id_dict, ["id"], [])
+    changed |= _remap_ids(all_relations, rel_id_dict, ["id"], [])
+    changed |= _remap_ids(all_relations, node_id_dict, ["source_id", "target_id"], [])
+
+    entity_ids = {node["id"] for node in all_nodes if "is_elemental" not in node}
+    outputs = {
+        "section_nodes": [node for node in all_nodes if "is_elemental" in node],
+        "entity_nodes": [node for node in all_nodes if "is_elemental" not in node],
+        **classify_relations(all_relations, entity_ids),
+    }
+    for name, records in outputs.items():
+        previous = loaded.get(name)
+        if (
+            previous is not None
+            and len(previous) == len(records)
+            and all(a is b and id(a) not in changed for a, b in zip(previous, records))
+        ):
+            continue
+        save_json(os.path.join(cache_path, f"{name}.json"), records)
+    for name, records in [("all_node", all_nodes), ("all_relations", all_relations)]:
+        path = os.path.join(cache_path, f"{name}.json")
+        if graph_file_exists(path) and load_graph_file(path) == records:
+            continue
+        save_json(path, records)
     return node_id_dict, rel_id_dict
 
 
@@ -185,9 +248,19 @@ def graph_structure(type: list, return_type: str = "dict",cache_path:str=graph_s
     """返回图结构的节点和关系"""
     return_list = []
     for ttype in type:
+        if return_type == "table" and ttype in _TABLE_FILES:
+            """在这种情况下，返回列式的EntityTable/RelationTable"""
+            tables = [
+                load_graph_table(os.path.join(cache_path, f"{name}.json"), ttype in _NODE_TYPES)
+                for name in _TABLE_FILES[ttype]
+            ]
+            for table in tables[1:]:
+                tables[0] = tables[0].concat(table)
+            return_list.append(tables[0])
+            continue
         if ttype == GraphStructureType.all_node:
             """ "在这种情况下，返回字典，包含所有的点"""
-            nodes = load_json(os.path.join(cache_path, "all_node.json"))
+            nodes = load_graph_file(os.path.join(cache_path, "all_node.json"))
             if return_type != "dict":
                 nodes = [
                     (
@@ -200,68 +273,65 @@ def graph_structure(type: list, return_type: str = "dict",cache_path:str=graph_s
             return_list.append(nodes)
         if ttype == GraphStructureType.all_relation:
             """在这种情况下，返回所有的章节节点和关系"""
-            relations = load_json(os.path.join(cache_path, "all_relations.json"))
+            relations = load_graph_file(os.path.join(cache_path, "all_relations.json"))
             if return_type != "dict":
                 relations = [Relation(**relation) for relation in relations]
             return_list.append(relations)
         if ttype == GraphStructureType.section_node:
             """在这种情况下，返回所有的章节节点"""
-            nodes = load_json(os.path.join(cache_path, "section_nodes.json"))
+            nodes = load_graph_file(os.path.join(cache_path, "section_nodes.json"))
             if return_type != "dict":
                 nodes = [Section(**node) for node in nodes]
             return_list.append(nodes)
         if ttype == GraphStructureType.entity_node:
             """在这种情况下，返回所有的实体节点"""
-            nodes = load_json(os.path.join(cache_path, "entity_nodes.json"))
+            nodes = load_graph_file(os.path.join(cache_path, "entity_nodes.json"))
             if return_type != "dict":
                 nodes = [Entity(**node) for node in nodes]
             return_list.append(nodes)
         if ttype == GraphStructureType.section_belong_connection:
             """在这种情况下，返回所有的章节关系"""
-            relations = load_json(os.path.join(cache_path, "has_subsection.json"))
+            relations = load_graph_file(os.path.join(cache_path, "has_subsection.json"))
             if return_type != "dict":
                 relations = [Relation(**relation) for relation in relations]
             return_list.append(relations)
         if ttype == GraphStructureType.section_related_connection:
             """在这种情况下，返回所有的章节关系"""
-            relations = load_json(os.path.join(cache_path, "section_related.json"))
+            relations = load_graph_file(os.path.join(cache_path, "section_related.json"))
             if return_type != "dict":
                 relations = [Relation(**relation) for relation in relations]
             return_list.append(relations)
         if ttype == GraphStructureType.section_all_relation:
-            relations = load_json(
+            relations = load_graph_file(
                 os.path.join(cache_path, "has_subsection.json")
-            ) + load_json(os.path.join(cache_path, "section_related.json"))
+            ) + load_graph_file(os.path.join(cache_path, "section_related.json"))
             if return_type != "dict":
                 relations = [Relation(**relation) for relation in relations]
             return_list.append(relations)
         if ttype == GraphStructureType.has_entity_relation:
-            relations = load_json(os.path.join(cache_path, "has_entity.json"))
+            relations = load_graph_file(os.path.join(cache_path, "has_entity.json"))
             if return_type != "dict":
                 relations = [Relation(**relation) for relation in relations]
             return_list.append(relations)
         if ttype == GraphStructureType.entity_related_relation:
-            relations = load_json(os.path.join(cache_path, "entity_related.json"))
+            relations = load_graph_file(os.path.join(cache_path, "entity_related.json"))
             if return_type != "dict":
                 relations = [Relation(**relation) for relation in relations]
             return_list.append(relations)
         if ttype == GraphStructureType.adjacency_matrix:
-            if return_type=='all':
-                relations = load_json(os.path.join(cache_path, "all_relations.json"))
-            if return_type=='entity':
-                relations = load_json(os.path.join(cache_path, "entity_related.json"))
-            if return_type=='section':
-                relations = load_json(os.path.join(cache_path, "section_related.json"))+load_json(os.path.join(cache_path, "has_subsection.json"))
-            adjacency_matrix_to = {(rel["source_id"], rel["target_id"]) for rel in relations}
-            adjacency_matrix_from = {(rel["target_id"], rel["source_id"]) for rel in relations}
-            return_list.append(adjacency_matrix_to | adjacency_matrix_from)
+            """在这种情况下，返回邻接索引，return_type为all/entity/section"""
+            return_list.append(get_adjacency_index(return_type, cache_path))
             
     return return_list
 def get_relation_id()->int:
+    if graph_storage_backend == "columnar":
+        return _max_id(os.path.join(graph_structure_path, "all_relations.json"))
     relations=graph_structure([GraphStructureType.all_relation],return_type="object")[0]
     id = max([relation.id for relation in relations])
     return id
 def get_node_id()->int:
+    if graph_storage_backend == "columnar":
+        return _max_id(os.path.join(graph_structure_path, "all_node.json"))
     nodes=graph_structure([GraphStructureType.all_node],return_type="object")[0]
     id = max([node.id for node in nodes])
     return id
@@ -278,10 +348,11 @@ def deduplicate_relation():
     save_relation(list(relation_dict.values()),entity_ids)
     realloc_id()
 def get_parent():
-    relations=graph_structure([GraphStructureType.section_belong_connection],return_type="object")[0]+graph_structure([GraphStructureType.has_entity_relation],return_type="object")[0]
+    relations=graph_structure([GraphStructureType.section_belong_connection,GraphStructureType.has_entity_relation],return_type="table")
     parent={}
-    for rel in relations:
-        parent[rel.target_id]=parent.get(rel.target_id,[])+[rel.source_id]
+    for table in relations:
+        for source_id, target_id in zip(table.source_id.tolist(), table.target_id.tolist()):
+            parent.setdefault(target_id, []).append(source_id)
     return parent
 def get_sons():
     relations=graph_structure([GraphStructureType.section_belong_connection],return_type="object")[0]+graph_structure([GraphStructureType.has_entity_relation],return_type="object")[0]
@@ -0,0 +1,185 @@
+"""章节树上的最近公共祖先索引
+
+get_common_score 原来对每一对实体、每一种父节点组合都沿祖先链走到根，再对两条链求交集，
+复杂度 O(N²·depth)。这里预先在"每个节点取第一个父节点"形成的森林上建立二进制提升（binary lifting）表：
+- 两个节点祖先链（含自身）的交集大小 = 最近公共祖先的深度 + 1（根深度为0），不在同一棵树时为0
+- 单次查询 O(log depth)，章节树很浅，相当于常数；common_depth 对整批节点对用 NumPy 一次算完
+- 实体可以属于多个章节，实体对的得分是所有父节点组合中的最大值，与原来的定义相同
+"""
+
+import os
+
+import numpy as np
+
+from ...src.config import graph_structure_path
+from ...src.utils.adjacency import graph_version
+
+
+class AncestorIndex:
+    """沿第一个父节点形成的森林，支持批量查询公共祖先的个数"""
+
+    def __init__(self, ids: np.ndarray, parent_rows: np.ndarray):
+        """
+        ids: 升序排列的节点id，第i行对应ids[i]
+        parent_rows: 第一个父节点所在的行，根节点为自身
+        """
+        n = len(ids)
+        self.ids = ids
+        depth = np.zeros(n, dtype=np.int32)
+        root = np.arange(n)
+        for _ in range(n + 1):
+            moving = parent_rows[root] != root
+            if not moving.any():
+                break
+            depth += moving
+            root = parent_rows[root]
+        else:
+            raise ValueError("section tree contains a cycle")
+        self.depth = depth
+        self.root = root
+        levels = max(1, int(depth.max(initial=0)).bit_length())
+        self.up = [parent_rows]
+        for _ in range(1, levels):
+            self.up.append(self.up[-1][self.up[-1]])
+
+    @classmethod
+    def from_parent(cls, parent: dict[int, list[int]]) -> "AncestorIndex":
+        """parent: 节点id -> 父节点id列表（get_parent 的返回值）"""
+        children = np.fromiter(parent.keys(), dtype=np.int64, count=len(parent))
+        first = np.fromiter((p[0] for p in parent.values()), dtype=np.int64, count=len(parent))
+        ids = np.union1d(children, [p for ps in parent.values() for p in ps])
+        parent_rows = np.arange(len(ids))
+        parent_rows[np.searchsorted(ids, children)] = np.searchsorted(ids, first)
+        return cls(ids, parent_rows)
+
+    def rows_of(self, ids) -> np.ndarray:
+        """节点id对应的行号，不存在时为-1"""
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(self.ids) == 0:
+            return np.full(len(ids), -1)
+        rows = np.searchsorted(self.ids, ids)
+        rows[rows >= len(self.ids)] = 0
+        return np.where(self.ids[rows] == ids, rows, -1)
+
+    def common_depth(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        """a、b为行号数组，返回两两之间公共祖先（含自身）的个数；行号为-1时为0"""
+        a = np.asarray(a)
+        b = np.asarray(b)
+        valid = (a >= 0) & (b >= 0)
+        a = np.where(valid, a, 0)
+        b = np.where(valid, b, 0)
+        valid &= self.root[a] == self.root[b]
+        # 让a是较深的一个，先提升到与b同一深度
+        swap = self.depth[a] < self.depth[b]
+        a, b = np.where(swap, b, a), np.where(swap, a, b)
+        diff = self.depth[a] - self.depth[b]
+        for k, up in enumerate(self.up):
+            a = np.where((diff >> k) & 1, up[a], a)
+        for up in reversed(self.up):
+            up_a, up_b = up[a], up[b]
+            move = up_a != up_b
+            a = np.where(move, up_a, a)
+            b = np.where(move, up_b, b)
+        lca = np.where(a == b, a, self.up[0][a])
+        return np.where(valid, self.depth[lca] + 1, 0)
+
+
+class CommonAncestorScores:
+    """
+    实体对的 common_score，与原来返回的字典用法相同：
+    scores.get((i, j), 0)、scores[(i, j)]、(i, j) in scores，只对 i != j 的两个实体有定义
+    """
+
+    def __init__(self, index: AncestorIndex, entity_ids, parent: dict[int, list[int]]):
+        self.index = index
+        self.entity_ids = np.unique(np.asarray(entity_ids, dtype=np.int64))
+        # 每个实体的父节点行号，CSR形式
+        lists = [parent.get(id, []) for id in self.entity_ids.tolist()]
+        self.indptr = np.zeros(len(lists) + 1, dtype=np.int64)
+        np.cumsum([len(p) for p in lists], out=self.indptr[1:])
+        self.parent_rows = index.rows_of([p for ps in lists for p in ps])
+
+    def _entity_rows(self, ids) -> np.ndarray:
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(self.entity_ids) == 0:
+            return np.full(len(ids), -1)
+        rows = np.searchsorted(self.entity_ids, ids)
+        rows[rows >= len(self.entity_ids)] = 0
+        return np.where(self.entity_ids[rows] == ids, rows, -1)
+
+    def score_pairs(self, a_ids, b_ids) -> np.ndarray:
+        """批量计算实体对 (a_ids[k], b_ids[k]) 的得分，不是实体的id得分为0"""
+        ra = self._entity_rows(a_ids)
+        rb = self._entity_rows(b_ids)
+        known = (ra >= 0) & (rb >= 0)
+        ra, rb = ra[known], rb[known]
+        na = self.indptr[ra + 1] - self.indptr[ra]
+        nb = self.indptr[rb + 1] - self.indptr[rb]
+        combos = na * nb
+        # 展开每一对实体的所有父节点组合
+        pair = np.repeat(np.arange(len(ra)), combos)
+        offset = np.arange(len(pair)) - np.repeat(np.cumsum(combos) - combos, combos)
+        pa = self.parent_rows[self.indptr[ra][pair] + offset // nb[pair]]
+        pb = self.parent_rows[self.indptr[rb][pair] + offset % nb[pair]]
+        best = np.zeros(len(ra), dtype=np.int32)
+        np.maximum.at(best, pair, self.index.common_depth(pa, pb))
+        result = np.zeros(len(known), dtype=np.int32)
+        result[known] = best
+        return result
+
+    def _defined(self, pair) -> bool:
+        return pair[0] != pair[1] and bool((self._entity_rows(pair) >= 0).all())
+
+    def get(self, pair, default=None):
+        if not self._defined(pair):
+            return default
+        return int(self.score_pairs([pair[0]], [pair[1]])[0])
+
+    def __getitem__(self, pair) -> int:
+        if not self._defined(pair):
+            raise KeyError(pair)
+        return int(self.score_pairs([pair[0]], [pair[1]])[0])
+
+    def __contains__(self, pair) -> bool:
+        return self._defined(pair)
+
+    def __len__(self) -> int:
+        n = len(self.entity_ids)
+        return n * (n - 1)
+
+
+_scores: dict[str, tuple] = {}
+
+
+def load_parent_map(cache_path: str = graph_structure_path) -> dict[int, list[int]]:
+    """章节树上每个节点（章节和实体）的父章节id列表，来自has_subsection和has_entity"""
+    from ...src.utils.id_operation import graph_file_exists, load_graph_table
+
+    parent = {}
+    for name in ("has_entity", "has_subsection"):
+        path = os.path.join(cache_path, f"{name}.json")
+        if graph_file_exists(path):
+            table = load_graph_table(path, False)
+            for source_id, target_id in zip(table.source_id.tolist(), table.target_id.tolist()):
+                parent.setdefault(target_id, []).append(source_id)
+    return parent
+
+
+def get_common_ancestor_scores(cache_path: str = graph_structure_path) -> CommonAncestorScores:
+    """返回缓存的 CommonAncestorScores，章节树或实体被修改后重建"""
+    from ...src.utils.id_operation import graph_file_exists, load_graph_table
+
+    paths = [
+        os.path.join(cache_path, f"{name}.json")
+        for name in ("has_entity", "has_subsection", "entity_nodes")
+    ]
+    key = os.path.abspath(cache_path)
+    version = graph_version(paths)
+    cached = _scores.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    parent = load_parent_map(cache_path)
+    entity_ids = load_graph_table(paths[2], True).id if graph_file_exists(paths[2]) else []
+    scores = CommonAncestorScores(AncestorIndex.from_parent(parent), entity_ids, parent)
+    _scores[key] = (version, scores)
+    return scores
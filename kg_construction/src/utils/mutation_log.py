@@ -0,0 +1,138 @@
+"""图修改的预写日志（WAL）
+
+identical_predict / connection_predict 这类阶段要做成百上千次 LLM 判断，结果只在阶段结束时写入图文件。
+阶段进行中每得到一批判断就把对应的修改追加到 wal/<阶段名>.jsonl：
+- merge_nodes / distinct_nodes: 两个实体判断为等价 / 不等价
+- add_relation / reject_pair: 新增一条关系 / 判断两个实体之间没有关系
+只有这两个阶段写日志。生成描述、新增节点的阶段（聚合、增强生成等）每个请求的回复
+已经保存在请求级缓存中，重启后重新执行不会再次请求，因此不记录 add_node / update_description。
+
+每 wal_snapshot_every 条记录把阶段的当前状态写入 <阶段名>.snapshot.json 并清空日志。
+重启后先读取快照再重放日志，已经判断过的实体对不会再请求。日志记录了开始时的图指纹，
+图已经变化（例如重新构建）时日志作废。阶段的结果写回图文件后删除日志。
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+from ...src.utils.graph_session import active_session
+
+log = logging.getLogger(__name__)
+
+
+def graph_fingerprint(entities: list) -> str:
+    """由实体的 id 和标题计算的指纹"""
+    digest = hashlib.sha1()
+    for entity in entities:
+        digest.update(f"{entity.id}\0{entity.title}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class MutationLog:
+    """一个阶段的追加写日志 + 周期性快照"""
+
+    def __init__(self, folder: str, name: str, fingerprint: str, snapshot_every: int = 200):
+        """
+        folder: 日志目录
+        name: 阶段名，决定日志文件名
+        fingerprint: 阶段开始时的图指纹
+        snapshot_every: 每多少条记录做一次快照
+        """
+        os.makedirs(folder, exist_ok=True)
+        self.path = os.path.join(folder, f"{name}.jsonl")
+        self.snapshot_path = os.path.join(folder, f"{name}.snapshot.json")
+        self.fingerprint = fingerprint
+        self.snapshot_every = snapshot_every
+        self.pending = 0
+
+    def load(self) -> tuple[dict | None, list[dict]]:
+        """返回 (快照中的状态, 快照之后的日志记录)；与当前图不匹配时返回 (None, [])"""
+        state = None
+        if os.path.exists(self.snapshot_path):
+            try:
+                with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                snapshot = {}
+            if snapshot.get("fingerprint") != self.fingerprint:
+                log.info(f"discard stale mutation log {self.path}")
+                self.clear()
+                return None, []
+            state = snapshot["state"]
+        records = []
+        if os.path.exists(self.path):
+            valid = 0
+            with open(self.path, "rb") as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        break
+                    valid += len(line)
+            if valid != os.path.getsize(self.path):
+                # 崩溃时写了一半的最后一行，截掉后再继续追加
+                with open(self.path, "r+b") as f:
+                    f.truncate(valid)
+        if records and records[0].get("fingerprint") != self.fingerprint:
+            log.info(f"discard stale mutation log {self.path}")
+            self.clear()
+            return None, []
+        records = [record for record in records if record["op"] != "begin"]
+        self.pending = len(records)
+        if state is not None or records:
+            log.info(f"resume from mutation log {self.path}: {len(records)} records")
+        return state, records
+
+    def append_many(self, records: list[dict]):
+        """追加记录并落盘；record 为 {"op": ..., 其它字段}"""
+        if len(records) == 0:
+            return
+        lines = []
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            lines.append(json.dumps({"op": "begin", "fingerprint": self.fingerprint}))
+        lines.extend(json.dumps(record, ensure_ascii=False) for record in records)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.pending += len(records)
+
+    def append(self, op: str, **fields):
+        self.append_many([{"op": op, **fields}])
+
+    def should_snapshot(self) -> bool:
+        return self.pending >= self.snapshot_every
+
+    def snapshot(self, state: dict):
+        """写入当前状态并清空日志"""
+        tmp = f"{self.snapshot_path}.tmp{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": self.fingerprint, "state": state}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        with open(self.path, "w", encoding="utf-8"):
+            pass
+        self.pending = 0
+
+    def clear(self):
+        for path in (self.path, self.snapshot_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.pending = 0
+
+    def complete(self):
+        """阶段结果已经保存；处于图会话中时等会话写回磁盘后再删除日志"""
+        session = active_session()
+        if session is None:
+            self.clear()
+        else:
+            session.after_flush.append(self.clear)
+
+
+def open_mutation_log(name: str, entities: list) -> MutationLog:
+    from ...src.config import wal_path, wal_snapshot_every
+
+    return MutationLog(wal_path, name, graph_fingerprint(entities), wal_snapshot_every)
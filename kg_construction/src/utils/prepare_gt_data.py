@@ -1,4 +1,4 @@
-from src.utils.engine import initialize_with_title,initial_engine_with_str
+from src.utils.engine import initialize_with_title,initial_engine_with_str,embed_strings
 from src.utils.file_operation import save_json, load_json
 from src.utils.id_operation import graph_structure,get_parent
 from src.model.graph_structure import GraphStructureType
@@ -10,9 +10,11 @@ def prepare_gt_data(data_raw_path:str,save_path:str):
             ent['title']=ent['name']
     gt=[ent for ent in gt if ent['title']!=""]
     titles=[ent['title'] for ent in gt]
-    engine=initial_engine_with_str(titles,os.path.join(save_path,"engine.ann"),os.path.join(save_path,"table.json"))
+    initial_engine_with_str(titles,os.path.join(save_path,"engine.ann"),os.path.join(save_path,"table.json"))
+    # 写出嵌入模型的原始向量，而不是引擎中归一化/降维后的向量
+    embeddings=embed_strings(titles,os.path.join(save_path,"engine.json"))
     for i,ent in enumerate(gt):
-        ent['embedding']=engine.get_vector_by_id(i)
+        ent['embedding']=embeddings[i]
         ent['embedding']=[float(e) for e in ent['embedding']]
         ent['name']=ent['title']
     save_json(os.path.join(save_path,'nodes.json'),gt)
@@ -3,6 +3,7 @@ import json
 import os
 import asyncio
 from ...src.utils.id_operation import realloc_id
+from ...src.utils.graph_session import GraphSession
 
 class ProcessManager:
     def __init__(
@@ -30,6 +31,7 @@ class ProcessManager:
             self.state_path = state_path
         if not from_scratch:
             self.load_state()
+        self.session: GraphSession | None = None
 
     @staticmethod
     def get_default_manager():
@@ -62,6 +64,15 @@ class ProcessManager:
         return {"workflow": self.workflow, "processed": self.processed}
 
     def step(self):
+        """执行一个阶段。阶段内对图文件的读写都在内存中进行，阶段结束时一次性写回"""
+        from ...src.config import graph_structure_path
+
+        if self.session is None:
+            self.session = GraphSession(graph_structure_path)
+        with self.session.stage():
+            self._step()
+
+    def _step(self):
         from ...src.config import metadata_path
 
         onprocess_task = self.workflow[self.processed]
@@ -116,10 +127,11 @@ class ProcessManager:
             get_local_role(need_ask=True)
             self.processed += 1
         elif onprocess_task == "identical_predict":
+            from ...src.config import identical_threshold
             from ...src.workflow.augmentation.relation_predict import identical_predict
 
             identical_predict(
-                0.55,
+                identical_threshold,
                 engine_path=os.path.join(metadata_path, "engine.ann"),
                 table_path=os.path.join(metadata_path, "table.json"),
                 folder_path=metadata_path,
@@ -135,7 +147,7 @@ class ProcessManager:
 
             continue_predict()
             self.processed += 1
-        elif onprocess_task_name == "visualization_internal":
+        elif onprocess_task == "visualization_internal":
             from ...src.workflow.visualization.tree_visualize import tree_visualization
 
             asyncio.run(tree_visualization())
@@ -208,4 +220,13 @@ class ProcessManager:
             )
             self.step()
             self.save_state()
+        self.write_snapshot()
         print("All tasks completed.")
+
+    def write_snapshot(self):
+        """生成出题端读取的二进制快照(graph/snapshot.npz)"""
+        from ...src.config import graph_structure_path
+        from utils.graph_snapshot import write_snapshot
+
+        if os.path.exists(os.path.join(graph_structure_path, "all_node.json")):
+            write_snapshot(graph_structure_path)
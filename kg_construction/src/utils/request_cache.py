@@ -0,0 +1,143 @@
+"""按请求粒度缓存大模型的回复
+
+缓存键为 hash(model, system prompt, user input, temperature, response_format)，
+存储在 SQLite 中。输入列表中只要有一个元素变化，也只需要重新请求变化的那部分。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+def request_key(
+    model: str,
+    system_prompt: str,
+    user_input: str,
+    temperature: float,
+    response_format: dict | None,
+) -> str:
+    """计算单个请求的内容地址"""
+    payload = json.dumps(
+        [model, system_prompt, user_input, temperature, response_format],
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RequestCache:
+    """基于SQLite的持久化KV缓存，支持按条数和存活时间淘汰"""
+
+    def __init__(
+        self, path: str, max_entries: int | None = None, max_age: float | None = None
+    ):
+        """
+        path: 缓存数据库路径
+        max_entries: 最多保留的条数，超出时淘汰最久未访问的，None表示不限
+        max_age: 条目最长存活时间（秒），None表示不过期
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self.evict()
+
+    def get_many(self, keys: list[str]) -> dict[str, str]:
+        """返回命中的 key->response"""
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            # SQLite 单条语句的参数个数有限制，分批查询
+            for i in range(0, len(unique), 500):
+                batch = unique[i : i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, response FROM responses WHERE key IN ({placeholders})",
+                    batch,
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE responses SET accessed=? WHERE key=?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+        return found
+
+    def get(self, key: str) -> str | None:
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items: dict[str, str]):
+        if len(items) == 0:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO responses (key, response, created, accessed) "
+                "VALUES (?, ?, ?, ?)",
+                [(key, response, now, now) for key, response in items.items()],
+            )
+            self._conn.commit()
+        self.evict()
+
+    def put(self, key: str, response: str):
+        self.put_many({key: response})
+
+    def evict(self):
+        """按存活时间和条数上限淘汰条目"""
+        with self._lock:
+            if self.max_age is not None:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE created < ?",
+                    (time.time() - self.max_age,),
+                )
+            if self.max_entries is not None:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key NOT IN ("
+                    "SELECT key FROM responses ORDER BY accessed DESC LIMIT ?)",
+                    (self.max_entries,),
+                )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_caches: dict[str, RequestCache] = {}
+
+
+def get_request_cache() -> RequestCache:
+    """返回当前 request_cache_path 下共享的缓存实例"""
+    from ...src.config import (
+        request_cache_path,
+        request_cache_max_entries,
+        request_cache_max_age,
+    )
+
+    path = os.path.join(request_cache_path, "requests.sqlite")
+    if path not in _caches:
+        _caches[path] = RequestCache(
+            path, max_entries=request_cache_max_entries, max_age=request_cache_max_age
+        )
+    return _caches[path]
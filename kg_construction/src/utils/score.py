@@ -1,147 +1,169 @@
-from sklearn.metrics import max_error
-from ...src.utils.id_operation import graph_structure,GraphStructureType
 import numpy as np
-def get_aa_score()->dict[(int,int),float]:
-    """返回一个字典，键为两个实体id，值为两个实体之间的aa_score"""
-    """aa_score=∑1/log(degree(node))"""
-    entities = graph_structure(type=[GraphStructureType.entity_node], return_type="object")[0]
-    relations = graph_structure(type=[GraphStructureType.entity_related_relation], return_type="object")[0]
-    degree_map={ent.id:len(ent.to_relation+ent.from_relation)-1 for ent in entities}
-    adjoint_nodes={ent.id:set() for ent in entities}
-    for rel in relations:
-        adjoint_nodes[rel.source_id].add(rel.target_id)
-        adjoint_nodes[rel.target_id].add(rel.source_id)
-    aa_score={}
-    for ent1 in entities:
-        for ent2 in entities:
-            i=ent1.id
-            j=ent2.id
-            if i>=j:
-                continue
-            if j in adjoint_nodes[i]:
-                continue
-            common_nodes=adjoint_nodes[i]&adjoint_nodes[j]
-            if len(common_nodes)==0:
+import scipy.sparse as sp
+from ...src.utils.id_operation import graph_structure,GraphStructureType
+from ...src.utils.adjacency import AdjacencyIndex, get_adjacency_index
+from ...src.utils.lca import CommonAncestorScores, get_common_ancestor_scores
+
+
+class LinkScores:
+    """
+    实体对的链接预测得分，以稀疏矩阵保存，只包含不相邻、得分非0的实体对（两个方向都有）。
+    与原来返回的字典用法相同：scores.get((i, j), 0)、(i, j) in scores、scores[(i, j)]
+    """
+
+    def __init__(self, index: AdjacencyIndex, matrix: sp.csr_matrix):
+        self.index = index
+        self.matrix = matrix
+
+    def __len__(self) -> int:
+        return self.matrix.nnz
+
+    def _value(self, pair) -> float | None:
+        a, b = self.index.row_of(pair[0]), self.index.row_of(pair[1])
+        if a < 0 or b < 0:
+            return None
+        start, end = self.matrix.indptr[a], self.matrix.indptr[a + 1]
+        position = np.searchsorted(self.matrix.indices[start:end], b)
+        if position < end - start and self.matrix.indices[start + position] == b:
+            return float(self.matrix.data[start + position])
+        return None
+
+    def get(self, pair, default=None):
+        value = self._value(pair)
+        return default if value is None else value
+
+    def __getitem__(self, pair) -> float:
+        value = self._value(pair)
+        if value is None:
+            raise KeyError(pair)
+        return value
+
+    def __contains__(self, pair) -> bool:
+        return self._value(pair) is not None
+
+    def score_pairs(self, a_ids, b_ids) -> np.ndarray:
+        """批量取实体对 (a_ids[k], b_ids[k]) 的得分，不存在时为0"""
+        a, b = self.index.rows_of(a_ids), self.index.rows_of(b_ids)
+        known = (a >= 0) & (b >= 0)
+        result = np.zeros(len(a), dtype=np.float64)
+        if known.any():
+            result[known] = np.asarray(self.matrix[a[known], b[known]]).ravel()
+        return result
+
+    def top_k(self, k: int) -> dict[int, list[tuple[int, float]]]:
+        """每个实体得分最高的k个候选实体：实体id -> [(候选实体id, 得分)]，按得分降序"""
+        ids = self.index.ids.tolist()
+        result = {}
+        for row in range(self.matrix.shape[0]):
+            start, end = self.matrix.indptr[row], self.matrix.indptr[row + 1]
+            if start == end:
                 continue
-            score=0
-            for node in common_nodes:
-                score+=1/np.log(degree_map[node])
-            aa_score[(i,j)]=score
-            aa_score[(j,i)]=score
-    return aa_score
-
-def get_ra_score() -> dict[(int, int), float]:
-    """返回一个字典，键为两个实体id，值为两个实体之间的RA_score"""
+            data = self.matrix.data[start:end]
+            order = np.argsort(-data, kind="stable")[:k]
+            result[ids[row]] = [
+                (ids[col], float(score))
+                for col, score in zip(self.matrix.indices[start:end][order].tolist(), data[order].tolist())
+            ]
+        return result
+
+    def candidate_pairs(self, k: int) -> list[tuple[int, int, float]]:
+        """各实体top-k候选合并去重后的 (较小id, 较大id, 得分)，按得分降序"""
+        pairs = {}
+        for i, candidates in self.top_k(k).items():
+            for j, score in candidates:
+                pairs[(min(i, j), max(i, j))] = score
+        return sorted(((i, j, s) for (i, j), s in pairs.items()), key=lambda x: -x[2])
+
+
+def _common_neighbour_scores(weights: np.ndarray | None = None) -> LinkScores:
+    """A·W·A，W为共同邻居的权重（对角矩阵），去掉对角线和已经相邻的实体对"""
+    index = get_adjacency_index("entity")
+    adjacency = index.matrix.astype(np.float64)
+    if weights is None:
+        scores = adjacency @ adjacency
+    else:
+        scores = adjacency @ sp.diags(weights) @ adjacency
+    scores = sp.csr_matrix(scores)
+    scores = scores - sp.diags(scores.diagonal()) - scores.multiply(adjacency)
+    scores = sp.csr_matrix(scores)
+    scores.eliminate_zeros()
+    scores.sort_indices()
+    return LinkScores(index, scores)
+
+
+def get_aa_score() -> LinkScores:
+    """返回两个实体之间的aa_score，键为两个实体id"""
+    """aa_score=∑1/log(degree(node))"""
+    degree = get_adjacency_index("entity").degree.astype(np.float64)
+    # 作为两个不同实体的共同邻居时度数至少为2
+    valid = degree >= 2
+    log_degree = np.log(degree, out=np.zeros_like(degree), where=valid)
+    weights = np.divide(1.0, log_degree, out=np.zeros_like(degree), where=valid)
+    return _common_neighbour_scores(weights)
+
+
+def get_ra_score() -> LinkScores:
+    """返回两个实体之间的RA_score，键为两个实体id"""
     """RA_score=∑1/degree(node)"""
-    entities = graph_structure(type=[GraphStructureType.entity_node], return_type="object")[0]
-    relations = graph_structure(type=[GraphStructureType.entity_related_relation], return_type="object")[0]
-    
-    degree_map = {ent.id: len(ent.to_relation + ent.from_relation - 1) for ent in entities}
-    adjoint_nodes = {ent.id: set() for ent in entities}
-    for rel in relations:
-        adjoint_nodes[rel.source_id].add(rel.target_id)
-        adjoint_nodes[rel.target_id].add(rel.source_id)
-    
-    ra_score = {}
-    for ent1 in entities:
-        for ent2 in entities:
-            i = ent1.id
-            j = ent2.id
-            if i >= j:
-                continue
-            if j in adjoint_nodes[i]:
-                continue
-            common_nodes = adjoint_nodes[i] & adjoint_nodes[j]
-            if len(common_nodes) == 0:
-                continue
-            score = sum(1 / degree_map[node] for node in common_nodes)
-            ra_score[(i, j)] = score
-            ra_score[(j, i)] = score
-    
-    return ra_score
-def get_pa_score() -> dict[(int, int), float]:
-    """返回一个字典，键为两个实体id，值为两个实体之间的PA_score"""
+    degree = get_adjacency_index("entity").degree.astype(np.float64)
+    weights = np.divide(1.0, degree, out=np.zeros_like(degree), where=degree > 0)
+    return _common_neighbour_scores(weights)
+
+
+class PreferentialAttachmentScores(LinkScores):
+    """PA得分对所有不相邻的实体对都有定义，不保存矩阵，按度数即时计算"""
+
+    def __init__(self, index: AdjacencyIndex):
+        super().__init__(index, None)
+
+    def __len__(self) -> int:
+        n = len(self.index)
+        return n * (n - 1) - int(self.index.matrix.nnz - self.index.matrix.diagonal().sum())
+
+    def _value(self, pair) -> float | None:
+        a, b = self.index.row_of(pair[0]), self.index.row_of(pair[1])
+        if a < 0 or b < 0 or a == b or pair in self.index:
+            return None
+        return float(self.index.degree[a] * self.index.degree[b])
+
+    def score_pairs(self, a_ids, b_ids) -> np.ndarray:
+        a, b = self.index.rows_of(a_ids), self.index.rows_of(b_ids)
+        known = (a >= 0) & (b >= 0) & (a != b)
+        known[known] = np.asarray(self.index.matrix[a[known], b[known]]).ravel() == 0
+        result = np.zeros(len(a), dtype=np.float64)
+        result[known] = self.index.degree[a[known]] * self.index.degree[b[known]]
+        return result
+
+    def top_k(self, k: int) -> dict[int, list[tuple[int, float]]]:
+        ids = self.index.ids.tolist()
+        degree = self.index.degree
+        order = np.argsort(-degree, kind="stable").tolist()
+        result = {}
+        indptr, indices = self.index.matrix.indptr, self.index.matrix.indices
+        for row in range(len(ids)):
+            neighbours = set(indices[indptr[row] : indptr[row + 1]].tolist())
+            candidates = []
+            for col in order:
+                if len(candidates) == k:
+                    break
+                if col != row and col not in neighbours:
+                    candidates.append((ids[col], float(degree[row] * degree[col])))
+            result[ids[row]] = candidates
+        return result
+
+
+def get_pa_score() -> PreferentialAttachmentScores:
+    """返回两个实体之间的PA_score，键为两个实体id"""
     """PA_score=degree(node1)*degree(node2)"""
-    entities = graph_structure(type=[GraphStructureType.entity_node], return_type="object")[0]
-    relations = graph_structure(type=[GraphStructureType.entity_related_relation], return_type="object")[0]
-    
-    degree_map = {ent.id: len(ent.to_relation + ent.from_relation - 1) for ent in entities}
-    adjoint_nodes = {ent.id: set() for ent in entities}
-    for rel in relations:
-        adjoint_nodes[rel.source_id].add(rel.target_id)
-        adjoint_nodes[rel.target_id].add(rel.source_id)
-    
-    pa_score = {}
-    for ent1 in entities:
-        for ent2 in entities:
-            i = ent1.id
-            j = ent2.id
-            if i >= j:
-                continue
-            if j in adjoint_nodes[i]:
-                continue
-            score = degree_map[i] * degree_map[j]
-            pa_score[(i, j)] = score
-            pa_score[(j, i)] = score
-    
-    return pa_score
-def get_cn_score() -> dict[(int, int), float]:
-    """返回一个字典，键为两个实体id，值为两个实体之间的CN_score"""
+    return PreferentialAttachmentScores(get_adjacency_index("entity"))
+
+
+def get_cn_score() -> LinkScores:
+    """返回两个实体之间的CN_score，键为两个实体id"""
     """CN_score=|common_nodes|"""
-    entities = graph_structure(type=[GraphStructureType.entity_node], return_type="object")[0]
-    relations = graph_structure(type=[GraphStructureType.entity_related_relation], return_type="object")[0]
-    
-    adjoint_nodes = {ent.id: set() for ent in entities}
-    for rel in relations:
-        adjoint_nodes[rel.source_id].add(rel.target_id)
-        adjoint_nodes[rel.target_id].add(rel.source_id)
-    
-    cn_score = {}
-    for ent1 in entities:
-        for ent2 in entities:
-            i = ent1.id
-            j = ent2.id
-            if i >= j:
-                continue
-            if j in adjoint_nodes[i]:
-                continue
-            common_nodes = adjoint_nodes[i] & adjoint_nodes[j]
-            if len(common_nodes) == 0:
-                continue
-            cn_score[(i, j)] = len(common_nodes)
-            cn_score[(j, i)] = len(common_nodes)
-    return cn_score
-def get_common_score() -> dict[(int,int),int]:
-    """common_score=|common_parents|，描述的是两个实体最多共同祖先的多少"""
-    has_entity=graph_structure(type=[GraphStructureType.has_entity_relation],return_type='object')[0]
-    has_subsection=graph_structure(type=[GraphStructureType.section_belong_connection],return_type='object')[0]
-    entity_node=graph_structure(type=[GraphStructureType.entity_node],return_type='object')[0]
-    parent={}
-    for rel in has_entity+has_subsection:
-        parent[rel.target_id]=parent.get(rel.target_id,[])+[rel.source_id]
-    common_score={}
-    for ent1 in entity_node:
-        for ent2 in entity_node:
-            if ent1.id>=ent2.id:
-                continue    
-            max_common=0
-            for ii in parent[ent1.id]:
-                for jj in parent[ent2.id]:
-                    i=ii
-                    j=jj
-                    parents_1={i}
-                    while parent.get(i) is not None:
-                        i=parent[i][0]
-                        parents_1.add(i)
-                    parents_2={j}
-                    while parent.get(j) is not None:
-                        j=parent[j][0]
-                        parents_2.add(j)
-                    common=parents_1&parents_2
-                    max_common=max(max_common,len(common))
-            
-            common_score[(ent1.id,ent2.id)] = max_common
-            common_score[(ent2.id,ent1.id)] = max_common
-    
-    return common_score
-    
+    return _common_neighbour_scores()
+
+
+def get_common_score() -> CommonAncestorScores:
+    """common_score=|common_parents|，描述的是两个实体最多共同祖先的多少，见 lca.py"""
+    return get_common_ancestor_scores()
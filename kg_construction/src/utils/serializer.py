@@ -0,0 +1,149 @@
+"""JSON 序列化后端
+
+save_json/load_json 通过本模块读写文件：
+- 安装了 orjson 时使用 orjson，否则使用标准库 json（json_backend 可以强制指定）
+- 默认输出紧凑格式；json_pretty=True 时缩进输出，便于调试时阅读
+- 数据类直接编码：to_dict 与字段一致的类（如 Section）由 orjson 原生编码，
+  其余类（Entity/Relation 的 to_dict 不包含 finish_augment）逐个调用 to_dict，
+  不再先复制出整个字典列表
+
+python -m kg_construction.src.utils.serializer outputs/tree/graph 比较两种后端的读写耗时。
+"""
+
+import dataclasses
+import functools
+import json
+import os
+import time
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _settings() -> tuple[str, bool]:
+    from ...src.config import json_backend, json_pretty
+
+    backend = json_backend
+    if backend == "auto":
+        backend = "orjson" if orjson is not None else "json"
+    return backend, json_pretty
+
+
+@functools.lru_cache(maxsize=None)
+def _native(cls) -> bool:
+    """to_dict 输出的正好是全部字段时，可以直接按数据类编码"""
+    if not dataclasses.is_dataclass(cls) or not hasattr(cls, "to_dict"):
+        return False
+    try:
+        keys = cls().to_dict().keys()
+    except TypeError:
+        return False
+    return set(keys) == {f.name for f in dataclasses.fields(cls)}
+
+
+def _default(obj):
+    if hasattr(obj, "to_dict"):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(data, pretty: bool = False, backend: str = "orjson") -> bytes:
+    if backend == "orjson":
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        native = isinstance(data, list) and all(
+            _native(cls) for cls in {type(item) for item in data if dataclasses.is_dataclass(item)}
+        )
+        if not native:
+            option |= orjson.OPT_PASSTHROUGH_DATACLASS
+        return orjson.dumps(data, default=_default, option=option)
+    return json.dumps(
+        data, ensure_ascii=False, indent=4 if pretty else None, default=_default
+    ).encode("utf-8")
+
+
+def loads(raw: bytes, backend: str = "orjson"):
+    if backend == "orjson":
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def dump_file(file_path: str, data):
+    backend, pretty = _settings()
+    raw = dumps(data, pretty, backend)
+    with open(file_path, "wb") as f:
+        f.write(raw)
+
+
+def load_file(file_path: str):
+    backend, _ = _settings()
+    with open(file_path, "rb") as f:
+        return loads(f.read(), backend)
+
+
+def benchmark(graph_dir: str, repeat: int = 5) -> list[dict]:
+    """对graph_dir下的每个JSON文件比较各后端的读写耗时（秒，取repeat次的最小值）"""
+    from ...src.model import Entity, Relation, Section
+
+    backends = ["json"] + (["orjson"] if orjson is not None else [])
+    results = []
+    for name in sorted(os.listdir(graph_dir)):
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(graph_dir, name), "rb") as f:
+            raw = f.read()
+        records = json.loads(raw)
+        # 与save_json的典型调用一样传入数据类对象
+        if name.startswith("all_node") or "nodes" in name:
+            objects = [
+                Section(**r) if "is_elemental" in r else Entity(**r) for r in records
+            ]
+        elif isinstance(records, list):
+            objects = [Relation(**r) for r in records]
+        else:
+            objects = records
+        row = {"file": name, "bytes": len(raw)}
+
+        def best(fn) -> float:
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                fn()
+                times.append(time.perf_counter() - start)
+            return min(times)
+
+        # 原来的写法：先转换为字典列表，再缩进输出
+        row["save_legacy"] = best(
+            lambda: json.dumps(
+                [o.to_dict() if hasattr(o, "to_dict") else o for o in objects],
+                ensure_ascii=False,
+                indent=4,
+            )
+        )
+        row["load_legacy"] = best(lambda: json.loads(raw))
+        for backend in backends:
+            encoded = dumps(objects, False, backend)
+            row[f"save_{backend}"] = best(lambda: dumps(objects, False, backend))
+            row[f"load_{backend}"] = best(lambda: loads(encoded, backend))
+            row[f"bytes_{backend}"] = len(encoded)
+        results.append(row)
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="比较JSON序列化后端的读写耗时")
+    parser.add_argument("graph_dir", nargs="?", default="outputs/tree/graph")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    for row in benchmark(args.graph_dir, args.repeat):
+        print(
+            " ".join(
+                f"{key}={value * 1000:.2f}ms" if isinstance(value, float) else f"{key}={value}"
+                for key, value in row.items()
+            )
+        )
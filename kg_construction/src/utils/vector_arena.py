@@ -0,0 +1,294 @@
+"""共享向量区（vector arena）和逻辑子索引
+
+实体、章节、标题原来各自建立一个索引，各自保存 engine.ann + table.json，
+同一段文本在不同索引中会被重复保存（甚至重复嵌入）。这里所有向量只保存一次：
+- 向量区是一个 SearchEngine，外部id为槽位(slot)，槽位按文本的内容地址(embedding_key)去重，
+  嵌入经过 EmbeddingStore，已经嵌入过的文本不会再次请求
+- 子索引(ArenaView)只是 节点id -> 槽位 的对应关系，例如 "entity"、"section"、"title"、"textbook/<根章节id>"；
+  在子索引中搜索时用 IDSelector 过滤槽位，不需要另外建立索引
+- 跨类型的查询（例如离某个实体最近的章节）直接用一个子索引的向量在另一个子索引中搜索
+engine.py 中的 initialize_entity_engine/initialize_section_engine 重新初始化时从这里的子索引复制出引擎；
+外部数据集（评测、GT）的字符串引擎不放入向量区，仍然保存在调用者指定的目录中
+"""
+
+import os
+
+import faiss
+import numpy as np
+
+from ...src.config import graph_structure_path, vector_arena_path
+from ...src.utils.embedding_store import embedding_key, embedding_model_id
+from ...src.utils.engine import SearchEngine, build_index, clean_title
+from ...src.utils.file_operation import load_json, save_json
+
+
+class ArenaView:
+    """向量区上的一个子索引：升序的节点id及其对应的槽位，提供与SearchEngine相同的只读查询接口"""
+
+    def __init__(self, arena: "VectorArena", node_ids, slots):
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        order = np.argsort(node_ids, kind="stable")
+        self.arena = arena
+        self.ids = node_ids[order]
+        self.slots = np.asarray(slots, dtype=np.int64)[order]
+        # 多个节点的文本相同时共用一个槽位，搜索结果取其中id最小的节点
+        unique, first = np.unique(self.slots, return_index=True)
+        self._node_of = dict(zip(unique.tolist(), self.ids[first].tolist()))
+        self._table = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, node_id: int) -> bool:
+        return node_id in self.table
+
+    @property
+    def table(self) -> dict[int, int]:
+        """节点id -> 行号"""
+        if self._table is None:
+            self._table = {id: i for i, id in enumerate(self.ids.tolist())}
+        return self._table
+
+    def rows_of(self, node_ids) -> np.ndarray:
+        return np.array([self.table[i] for i in np.asarray(node_ids).tolist()], dtype=np.int64)
+
+    def slots_of(self, node_ids) -> np.ndarray:
+        return self.slots[self.rows_of(node_ids)]
+
+    def filter(self, node_ids) -> "ArenaView":
+        """只包含node_ids（其中属于本子索引的部分）的子索引"""
+        keep = np.isin(self.ids, np.asarray(list(node_ids), dtype=np.int64))
+        return ArenaView(self.arena, self.ids[keep], self.slots[keep])
+
+    def index_vectors(self) -> np.ndarray:
+        """全部向量（索引空间），第i行对应ids[i]"""
+        return self.arena.engine.index_matrix(self.slots)
+
+    def index_matrix(self, node_ids) -> np.ndarray:
+        return self.arena.engine.index_matrix(self.slots_of(node_ids))
+
+    def get_vector_by_id(self, node_id: int) -> np.ndarray:
+        """与SearchEngine.get_vector_by_id相同：逆变换回输入空间的近似"""
+        return self.arena.engine.get_vector_by_id(int(self.slots_of([node_id])[0]))
+
+    def get_vectors_by_ids(self, node_ids) -> np.ndarray:
+        return self.arena.engine.get_vectors_by_ids(self.slots_of(node_ids))
+
+    def to_engine(self) -> SearchEngine:
+        """以节点id为外部id的独立SearchEngine（可以增删改），复制向量区的索引空间向量，不重复变换"""
+        return self.arena.engine.with_vectors(self.ids, self.index_vectors())
+
+    def save_state(self, folder_path: str):
+        """保存为独立的 engine.ann + table.json，供按文件读取引擎的旧代码使用"""
+        self.to_engine().save_state(folder_path)
+
+    def get_distance(self, node_id1: int, node_id2: int) -> float:
+        return float(self.paired_distance([node_id1], [node_id2])[0])
+
+    def paired_distance(self, ids_a, ids_b, other: "ArenaView" = None) -> np.ndarray:
+        """逐对计算 ids_a[k] 与 ids_b[k]（属于other，默认为本子索引）之间的L2距离"""
+        other = self if other is None else other
+        return self.arena.engine.paired_distance(self.slots_of(ids_a), other.slots_of(ids_b))
+
+    def pairwise_distance(self, ids_a, ids_b=None, other: "ArenaView" = None) -> np.ndarray:
+        """ids_a × ids_b 的L2距离矩阵，ids_b默认为other（默认为本子索引）的全部节点"""
+        other = self if other is None else other
+        b = other.slots if ids_b is None else other.slots_of(ids_b)
+        return self.arena.engine.pairwise_distance(self.slots_of(ids_a), b)
+
+    def search_by_ids(self, node_ids, top_k: int = 10, target: "ArenaView" = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        用这些节点的向量在target（默认为本子索引，此时不包括本身）中搜索top_k个节点。
+        返回 (节点id, L2距离)，形状均为 len(node_ids) × top_k；结果不足时id为-1、距离为inf
+        """
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        exclude = node_ids if target is None else None
+        return (self if target is None else target)._search(self.index_matrix(node_ids), top_k, exclude)
+
+    def search_by_id(self, node_id: int, top_k: int = 10, target: "ArenaView" = None) -> list[int]:
+        labels, _ = self.search_by_ids([node_id], top_k, target)
+        return [i for i in labels[0].tolist() if i != -1]
+
+    def search_by_vector(self, vector: list[float], top_k: int = 10) -> list[int]:
+        """根据向量（输入空间）搜索相似top_k节点"""
+        labels, _ = self._search(self.arena.engine.transform([vector]), top_k)
+        return [i for i in labels[0].tolist() if i != -1]
+
+    def _search(self, queries: np.ndarray, top_k: int, exclude=None) -> tuple[np.ndarray, np.ndarray]:
+        extra = 0 if exclude is None else 1
+        found = self.arena.engine.search_in(queries, top_k + extra, np.unique(self.slots))
+        labels = np.full((len(queries), top_k), -1, dtype=np.int64)
+        distances = np.full((len(queries), top_k), np.inf, dtype=np.float32)
+        for row, slots in enumerate(found.tolist()):
+            nodes = [self._node_of[s] for s in slots if s != -1]
+            if exclude is not None:
+                nodes = [i for i in nodes if i != exclude[row]]
+            nodes = nodes[:top_k]
+            labels[row, : len(nodes)] = nodes
+        hit = labels >= 0
+        if hit.any():
+            query_rows = np.broadcast_to(np.arange(len(queries))[:, None], labels.shape)[hit]
+            distances[hit] = np.linalg.norm(queries[query_rows] - self.index_matrix(labels[hit]), axis=1)
+        return labels, distances
+
+
+class VectorArena:
+    """所有向量只保存一次的向量区，以及按名称注册的子索引"""
+
+    def __init__(self, engine: SearchEngine = None, keys: list[str] = None):
+        """
+        engine: 外部id为槽位的SearchEngine；keys: 槽位 -> 文本的内容地址
+        """
+        self.engine = engine
+        self.keys = list(keys or [])
+        self._slot_of = {key: slot for slot, key in enumerate(self.keys)}
+        self.views: dict[str, ArenaView] = {}
+        # 上次保存之后是否加入了向量或修改了子索引
+        self.dirty = False
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add_texts(self, texts: list[str]) -> np.ndarray:
+        """
+        返回每条文本的槽位；只有向量区中还没有的文本才会被嵌入并加入。
+        嵌入失败的文本不加入向量区（下次重试），此时在加入成功的部分后抛出RuntimeError
+        """
+        from ...src.utils.communication import embed_texts
+
+        model = embedding_model_id()
+        keys = [embedding_key(text, model) for text in texts]
+        new = {}
+        for key, text in zip(keys, texts):
+            if key not in self._slot_of and key not in new:
+                new[key] = text
+        if len(new) != 0:
+            vectors, ok = embed_texts(list(new.values()))
+            self.add_vectors([key for key, success in zip(new, ok.tolist()) if success], vectors[ok])
+            if not ok.all():
+                raise RuntimeError(f"{int((~ok).sum())}条文本嵌入失败，没有加入向量区")
+        return np.array([self._slot_of[key] for key in keys], dtype=np.int64)
+
+    def add_vectors(self, keys: list[str], vectors: np.ndarray):
+        """加入已经嵌入的向量，内容地址已经存在的跳过"""
+        new = [i for i, key in enumerate(keys) if key not in self._slot_of]
+        slots = np.arange(len(self.keys), len(self.keys) + len(new), dtype=np.int64)
+        for i in new:
+            self._slot_of[keys[i]] = len(self.keys)
+            self.keys.append(keys[i])
+        if len(new) == 0:
+            return
+        self.dirty = True
+        vectors = np.asarray(vectors, dtype=np.float32)[new]
+        if self.engine is None:
+            self.engine = SearchEngine(build_index(vectors, ids=slots))
+        else:
+            self.engine.insert_many(slots, vectors)
+
+    def register(self, name: str, node_ids, slots) -> ArenaView:
+        """注册（或替换）名为name的子索引"""
+        view = ArenaView(self, node_ids, slots)
+        old = self.views.get(name)
+        if old is None or not (np.array_equal(old.ids, view.ids) and np.array_equal(old.slots, view.slots)):
+            self.views[name] = view
+            self.dirty = True
+        return self.views[name]
+
+    def register_texts(self, name: str, node_ids, texts: list[str]) -> ArenaView:
+        return self.register(name, node_ids, self.add_texts(texts))
+
+    def view(self, name: str) -> ArenaView:
+        return self.views[name]
+
+    def __getitem__(self, name: str) -> ArenaView:
+        return self.views[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.views
+
+    def save_state(self, folder_path: str):
+        """向量区保存为 engine.ann，内容地址和所有子索引保存为 arena.json"""
+        os.makedirs(folder_path, exist_ok=True)
+        save_json(
+            os.path.join(folder_path, "arena.json"),
+            {
+                "keys": self.keys,
+                "views": {
+                    name: {"ids": view.ids.tolist(), "slots": view.slots.tolist()}
+                    for name, view in self.views.items()
+                },
+            },
+        )
+        if self.engine is not None:
+            faiss.write_index(self.engine.engine, os.path.join(folder_path, "engine.ann"))
+        self.dirty = False
+
+    @classmethod
+    def load_state(cls, folder_path: str) -> "VectorArena":
+        state = load_json(os.path.join(folder_path, "arena.json"))
+        engine_path = os.path.join(folder_path, "engine.ann")
+        engine = SearchEngine(faiss.read_index(engine_path)) if os.path.exists(engine_path) else None
+        arena = cls(engine, state["keys"])
+        for name, view in state["views"].items():
+            arena.register(name, view["ids"], view["slots"])
+        arena.dirty = False
+        return arena
+
+
+def load_vector_arena(folder_path: str = vector_arena_path) -> VectorArena:
+    """读取向量区，不存在时返回空的向量区"""
+    if os.path.exists(os.path.join(folder_path, "arena.json")):
+        return VectorArena.load_state(folder_path)
+    return VectorArena()
+
+
+def initialize_vector_arena(
+    folder_path: str = vector_arena_path, cache_path: str = graph_structure_path, rebuild: bool = False
+) -> VectorArena:
+    """
+    读取或建立向量区，注册以下子索引：
+    - "entity": 实体的标题和最后一个描述（与initialize_entity_engine相同的文本）
+    - "section": 章节的标题和概括
+    - "title": 实体和章节去掉编号后的标题（空标题不包括）
+    - "textbook/<根章节id>": 属于同一棵章节树（同一本教材）的实体和章节
+    rebuild时按当前的图重新注册子索引，已经嵌入过的文本直接复用（不再被引用的槽位保留在向量区中）；
+    只有加入了新向量或子索引有变化时才写回磁盘，图没有变化时重复调用不会重写向量区
+    """
+    from ...src.model.base_operator import EmbeddingEntityoperation, EmbeddingSectionoperation
+    from ...src.model.graph_structure import GraphStructureType
+    from ...src.utils.id_operation import graph_structure
+    from ...src.utils.lca import AncestorIndex, load_parent_map
+
+    if not rebuild and os.path.exists(os.path.join(folder_path, "arena.json")):
+        return VectorArena.load_state(folder_path)
+    arena = load_vector_arena(folder_path)
+    entities, sections = graph_structure(
+        type=[GraphStructureType.entity_node, GraphStructureType.section_node],
+        return_type="object",
+        cache_path=cache_path,
+    )
+    entity = arena.register_texts(
+        "entity", [e.id for e in entities], EmbeddingEntityoperation(entities, level=-1).user_input
+    )
+    section = arena.register_texts(
+        "section", [s.id for s in sections], EmbeddingSectionoperation(sections).user_input
+    )
+    titles = [(node.id, clean_title(node.title)) for node in entities + sections]
+    titles = [(id, title) for id, title in titles if title != ""]
+    arena.register_texts("title", [id for id, _ in titles], [title for _, title in titles])
+    # 教材按章节树的根划分，实体属于第一个父章节所在的树
+    index = AncestorIndex.from_parent(load_parent_map(cache_path))
+    node_ids = np.concatenate([entity.ids, section.ids])
+    slots = np.concatenate([entity.slots, section.slots])
+    rows = index.rows_of(node_ids)
+    roots = np.where(rows >= 0, index.ids[index.root[np.maximum(rows, 0)]], node_ids)
+    textbooks = {f"textbook/{root}" for root in np.unique(roots).tolist()}
+    for name in [name for name in arena.views if name.startswith("textbook/") and name not in textbooks]:
+        del arena.views[name]
+        arena.dirty = True
+    for root in np.unique(roots).tolist():
+        keep = roots == root
+        arena.register(f"textbook/{root}", node_ids[keep], slots[keep])
+    if arena.dirty:
+        arena.save_state(folder_path)
+    return arena
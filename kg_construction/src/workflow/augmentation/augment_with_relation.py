@@ -31,10 +31,9 @@ def augment_with_relation(new_relations:list,engine_folder:str=None):
     entities_group=[changed_entities[i:i+32] for i in range(0,len(changed_entities),32)]
     all_op = [EmbeddingEntityoperation(entities,level=-1) for entities in entities_group]
     response=execute_operator(all_op,cached_file_path=os.path.join(request_cache_path,"augmentation_embedding.json"))
-    vector_np = [result["embedding"] for result in response]
+    vector_np = response
     engine = initialize_entity_engine(entitis=changed_entities,engine_path=os.path.join(engine_folder,'engine.ann'),table_path=os.path.join(engine_folder,'table.json'))
-    for id,vec in zip([ent.id for ent in changed_entities],vector_np):
-        engine.change_entity(id,vec)
+    engine.update_many([ent.id for ent in changed_entities],vector_np)
     # 重新嵌入
     engine.save_state(engine_folder)
     all_entities=[entity_map[ent.id] for ent in entity_nodes]
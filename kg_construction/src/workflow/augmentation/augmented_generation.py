@@ -4,7 +4,7 @@ from ....src.model.relation import Relation
 from ....src.utils import communicate_with_agent
 from ....src.utils import save_json
 from ....src.utils.id_operation import graph_structure
-from ....src.config import request_cache_path, final_prompt_path,user_input,graph_structure_path
+from ....src.config import request_cache_path, final_prompt_path,user_input,graph_structure_path,offline_request_mode
 import logging
 def augment_entities(entity_nodes: list, prompt_template: str,relations:dict,entities:dict,is_first:bool):
     input_content=[]
@@ -28,11 +28,11 @@ def augment_entities(entity_nodes: list, prompt_template: str,relations:dict,ent
         input_content.append(full_user_input)
         need_aug.append(entity)
     if is_first:
-        responses=communicate_with_agent(system_prompt=prompt_template, user_input=input_content, need_json=False,cached_file_path=request_cache_path+"/entity_augmented_generation.json",)
+        responses=communicate_with_agent(system_prompt=prompt_template, user_input=input_content, need_json=False,cached_file_path=request_cache_path+"/entity_augmented_generation.json",mode=offline_request_mode)
         for i in range(len(need_aug)):
             need_aug[i].descriptions.append(responses[i])
     else:
-        responses=communicate_with_agent(system_prompt=prompt_template, user_input=input_content, need_json=False,cached_file_path=request_cache_path+"/entity_augmented_generation.json")
+        responses=communicate_with_agent(system_prompt=prompt_template, user_input=input_content, need_json=False,cached_file_path=request_cache_path+"/entity_augmented_generation.json",mode=offline_request_mode)
         for i in range(len(need_aug)):
             need_aug[i].descriptions.append(responses[i])
 def augment_relations(relation_edges: list[Relation], prompt_template: str,entities:dict,is_first:bool):
@@ -56,7 +56,7 @@ def augment_relations(relation_edges: list[Relation], prompt_template: str,entit
             full_user_input=user_input.replace("{text}", description)
             input_content.append(full_user_input)
             need_aug.append(relation)
-    responses=communicate_with_agent(system_prompt=prompt_template, user_input=input_content, need_json=False,cached_file_path=request_cache_path+"/relation_augmented_generation.json")
+    responses=communicate_with_agent(system_prompt=prompt_template, user_input=input_content, need_json=False,cached_file_path=request_cache_path+"/relation_augmented_generation.json",mode=offline_request_mode)
     for i in range(len(need_aug)):
         need_aug[i].descriptions.append(responses[i])
 
@@ -91,18 +91,15 @@ class UnionFind:
             
             equals.append(temp)
         return equals
-def get_merge_operation_result(result:list[int],new_entity_index:int,entity_nodes:List[Entity])->Entity:
-    """从list[int]中获取合并的实体"""
-    merged_entity=None
-    for ent in entity_nodes:
-        if ent.id==result[0]:
-            merged_entity=Entity(id=new_entity_index,title=ent.title,alias=ent.alias,descriptions=ent.descriptions,from_relation=ent.from_relation,to_relation=ent.to_relation)
-            break
+def get_merge_operation_result(result:list[int],new_entity_index:int,entities:Dict[int,Entity])->Entity:
+    """从list[int]中获取合并的实体，entities为 实体id -> 实体"""
+    ent=entities[result[0]]
+    merged_entity=Entity(id=new_entity_index,title=ent.title,alias=ent.alias,descriptions=ent.descriptions,from_relation=ent.from_relation,to_relation=ent.to_relation)
     for id in result[1:]:
-        merged_entity.alias.extend(entity_nodes[id].alias)
-        merged_entity.descriptions.extend(entity_nodes[id].descriptions)
-        merged_entity.from_relation.extend(entity_nodes[id].from_relation)
-        merged_entity.to_relation.extend(entity_nodes[id].to_relation)
+        merged_entity.alias.extend(entities[id].alias)
+        merged_entity.descriptions.extend(entities[id].descriptions)
+        merged_entity.from_relation.extend(entities[id].from_relation)
+        merged_entity.to_relation.extend(entities[id].to_relation)
     return merged_entity
 @dataclass
 class EntityMerger:
@@ -162,9 +159,9 @@ class EntityMerger:
             for other_id in ids[1:]:
                 self.uf.union(ids[0], other_id)
         
-        # 创建新的实体
-        
-        new_entity_index = self.entity_nodes[0].id
+        # 创建新的实体：合并后的实体沿用组内一个实体的id，
+        # 不假设实体id从某个值开始连续（realloc_id默认保持id不变，可能有空洞）
+        entity_by_id={entity.id:entity for entity in self.entity_nodes}
         if self.merge_type=="with-agent":
             equals=self.uf.getset()
             ops=[]
@@ -172,17 +169,16 @@ class EntityMerger:
             for equal in equals:
                 entities=[]
                 for id in equal:
-                    entities.append(self.entity_nodes[id])
+                    entities.append(entity_by_id[id])
                 check_merge=CheckMergeoperation(system_prompt_path="kg4edu/prompt/check_merge.txt",entities=entities)
                 ops.append(check_merge)
             results=execute_operator(ops)
             for result in results:
                 for res in result:
-                    merged_entity=get_merge_operation_result(res,new_entity_index)
+                    merged_entity=get_merge_operation_result(res,res[0],entity_by_id)
                     merged_entities.append(merged_entity)
                     for id in res:
-                        self.entity_id_map[id]=new_entity_index
-                    new_entity_index+=1
+                        self.entity_id_map[id]=res[0]
             merged_relations=self._process_relations()
             logger.info(f"Merged {len(self.entity_nodes)} entities into {len(merged_entities)} entities")
             logger.info("Entity merging process completed successfully")
@@ -195,7 +191,7 @@ class EntityMerger:
             if root not in self.root_to_entity:
                 # 创建新实体
                 merged_entity = Entity(
-                    id=new_entity_index,
+                    id=root,
                     title=entity.title,
                     alias=entity.alias.copy(),
                     descriptions=entity.descriptions.copy(),
@@ -203,8 +199,7 @@ class EntityMerger:
                     to_relation=entity.to_relation.copy(),
                 )
                 self.root_to_entity[root] = merged_entity
-                self.entity_id_map[root] = new_entity_index
-                new_entity_index += 1
+                self.entity_id_map[root] = root
             else:
                 # 合并到现有实体
                 self._merge_entity_properties(self.root_to_entity[root], entity)
@@ -10,11 +10,14 @@ from ....src.model.base_operator import (
 from ....src.model.relation import Relation
 from ....src.utils.communication import execute_operator
 from ....src.utils.file_operation import save_json, load_json
-from ....src.config import engine_cache_path, max_level
+from ....src.config import engine_cache_path, max_level, connection_batch_size
 from ....src.utils.score import get_aa_score, get_common_score
+from ....src.utils.candidates import candidate_pairs, component_bridges
 from ....src.config import request_cache_path, graph_structure_path
+from ....src.utils.mutation_log import open_mutation_log
 import os
 import logging
+import numpy as np
 import tqdm
 def get_parent(mp: dict[int, int], id: int):
     if mp[id] == id:
@@ -23,8 +26,32 @@ def get_parent(mp: dict[int, int], id: int):
     return mp[id]
 
 
-def from_dis_to_cos(dis) -> float:
-    return (2 - dis**2) / 2
+def _not_in(ent1: np.ndarray, ent2: np.ndarray, pairs: set) -> np.ndarray:
+    """(ent1[k], ent2[k]) 不在pairs中的位置"""
+    return np.array(
+        [pair not in pairs for pair in zip(ent1.tolist(), ent2.tolist())], dtype=bool
+    )
+
+
+def _similar_pairs(engine, entities, entity_map: dict, top_k: int) -> list[tuple[int, int, float]]:
+    """每个实体与其top_k个近邻（同为或同不为核心实体）组成的 (ent1, ent2, 余弦相似度)，按相似度降序排列"""
+    neighbors, _ = engine.search_by_ids([entity.id for entity in entities], top_k)
+    ent1, ent2 = [], []
+    for entity, row in zip(entities, neighbors.tolist()):
+        for neighbor in row:
+            if neighbor == -1 or entity_map[neighbor].is_core_entity != entity.is_core_entity:
+                continue
+            ent1.append(entity.id)
+            ent2.append(neighbor)
+    similarity = engine.paired_similarity(ent1, ent2) if ent1 else np.empty(0, dtype=np.float32)
+    order = np.argsort(-similarity, kind="stable")
+    return [(ent1[i], ent2[i], float(similarity[i])) for i in order.tolist()]
+
+
+def _top_priorities(ent1, ent2, score, limit: int = None) -> list[tuple[int, int, float]]:
+    """按得分降序排列的 (ent1, ent2, score)，只保留前limit个"""
+    order = np.argsort(-score, kind="stable")[:limit]
+    return list(zip(ent1[order].tolist(), ent2[order].tolist(), score[order].tolist()))
 
 
 def relation_predict():
@@ -42,24 +69,19 @@ def relation_predict():
     common_score = get_common_score()
     exists_rel = {(rel.source_id, rel.target_id) for rel in relations}
     entity_map = {entity.id: entity for entity in entities}
-    priorities = []
 
-    for ent1 in entities:
-        for ent2 in entities:
-            if ent1.id >= ent2.id:
-                continue
-            if (ent1.id, ent2.id) in exists_rel:
-                continue
-            score = aa_score.get((ent1.id, ent2.id), 0) * 0.3 + (
-                1 - 0.3
-            ) * from_dis_to_cos(engine.get_distance(ent1.id, ent2.id))
-            priorities.append((ent1.id, ent2.id, score))
-    priorities.sort(key=lambda x: x[2], reverse=True)
-    priorities = priorities[:len(entities)*0.5]
-    for p in priorities:
-        print(p)
-        print(engine.get_distance(p[0], p[1]))
-        print(common_score.get((p[0], p[1]), -1))
+    # 只在向量近邻和图上的邻居中选择候选实体对
+    ent1, ent2, _ = candidate_pairs(engine, entity_map.keys(), aa_score)
+    keep = _not_in(ent1, ent2, exists_rel)
+    ent1, ent2 = ent1[keep], ent2[keep]
+    score = aa_score.score_pairs(ent1, ent2) * 0.3 + (1 - 0.3) * engine.paired_similarity(ent1, ent2)
+    priorities = _top_priorities(ent1, ent2, score, len(entities) // 2)
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        for p in priorities:
+            logging.debug(
+                f"{p} distance={engine.get_distance(p[0], p[1])} "
+                f"common={common_score.get((p[0], p[1]), -1)}"
+            )
     ops = [
         RelationPredictoperation(entity_map[p[0]], entity_map[p[1]]) for p in priorities
     ]
@@ -137,35 +159,20 @@ def continue_predict(threshold: float = 7, dist: int = 1):
     common_score = get_common_score()
     exists_rel = {(rel.source_id, rel.target_id) for rel in relations}
     entity_map = {entity.id: entity for entity in entities}
-    priorities = []
-    cnt_common = {}
-    for ent1 in entities:
-        for ent2 in entities:
-            if ent1.id >= ent2.id:
-                continue
-            if (ent1.id, ent2.id) in exists_rel:
-                continue
-            if common_score.get((ent1.id, ent2.id), 0) >= max_level - dist:
-                continue
-            score = (
-                aa_score.get((ent1.id, ent2.id), 0) * 0.3
-                + (1 - 0.3 - 0.1)
-                * from_dis_to_cos(engine.get_distance(ent1.id, ent2.id))
-                + 0.1 * common_score.get((ent1.id, ent2.id), 0)
-            )
-            priorities.append((ent1.id, ent2.id, score))
-            cnt_common[common_score[(ent1.id, ent2.id)]] = (
-                cnt_common.get(common_score[(ent1.id, ent2.id)], 0) + 1
-            )
-    pre_common = {}
-    # 确定优先级
-    priorities.sort(key=lambda x: x[2], reverse=True)
-    # 保留前#entities个
-    priorities = priorities[: len(entities)//2]
-    for p in priorities:
-        pre_common[common_score[(p[0], p[1])]] = (
-            pre_common.get(common_score[(p[0], p[1])], 0) + 1
-        )
+    ent1, ent2, _ = candidate_pairs(engine, entity_map.keys(), aa_score)
+    common = common_score.score_pairs(ent1, ent2)
+    keep = _not_in(ent1, ent2, exists_rel) & (common < max_level - dist)
+    ent1, ent2, common = ent1[keep], ent2[keep], common[keep]
+    score = (
+        aa_score.score_pairs(ent1, ent2) * 0.3
+        + (1 - 0.3 - 0.1) * engine.paired_similarity(ent1, ent2)
+        + 0.1 * common
+    )
+    cnt_common = dict(zip(*(x.tolist() for x in np.unique(common, return_counts=True))))
+    # 确定优先级，保留前#entities/2个
+    order = np.argsort(-score, kind="stable")[: len(entities) // 2]
+    priorities = list(zip(ent1[order].tolist(), ent2[order].tolist(), score[order].tolist()))
+    pre_common = dict(zip(*(x.tolist() for x in np.unique(common[order], return_counts=True))))
     ops = [
         RelationPredictoperation(entity_map[p[0]], entity_map[p[1]]) for p in priorities
     ]
@@ -222,49 +229,106 @@ def connection_predict(threshold: float = 7):
     for rel in exists_rel:
         # 建立已有并查集
         injection[get_parent(injection, rel[0])] = get_parent(injection, rel[1])
+    # 从预写日志恢复上次中断前的结果
+    wal = open_mutation_log("connection_predict", entities)
+    rejected = set()
+
+    def apply(record: dict):
+        e1, e2 = record["ids"]
+        if record["op"] == "add_relation":
+            newrelations.append(Relation(**record["relation"]))
+            injection[get_parent(injection, e1)] = get_parent(injection, e2)
+        elif record["op"] == "reject_pair":
+            rejected.add((e1, e2))
+
+    def state() -> dict:
+        return {
+            "records": [
+                {"op": "add_relation", "ids": [rel.source_id, rel.target_id], "relation": rel.to_dict()}
+                for rel in newrelations
+            ]
+            + [{"op": "reject_pair", "ids": list(pair)} for pair in rejected]
+        }
+
+    snapshot, records = wal.load()
+    for record in (snapshot or {}).get("records", []) + records:
+        apply(record)
+    successcnt = len(newrelations)
     common_score = get_common_score()
-    priorities = []
-    for ent1 in entities:
-        for ent2 in entities:
-            if ent1.id >= ent2.id:
-                continue
-            if get_parent(injection, ent1.id) == get_parent(injection, ent2.id):
-                continue
-            score = from_dis_to_cos(
-                engine.get_distance(ent1.id, ent2.id)
-            ) + 0.2 * common_score.get((ent1.id, ent2.id), 0)
-            priorities.append((ent1.id, ent2.id, score))
+    ent1, ent2, distance = candidate_pairs(engine, entity_map.keys(), get_aa_score())
+    # 候选中没有跨分量实体对的分量，为其中每个实体补充分量外最近的实体
+    entity_ids = np.array(sorted(i for i in entity_map if i in engine))
+    labels = np.array([get_parent(injection, i) for i in entity_ids.tolist()])
+    component = dict(zip(entity_ids.tolist(), labels.tolist()))
+    cross = np.array([component[a] != component[b] for a, b in zip(ent1.tolist(), ent2.tolist())], dtype=bool)
+    bridged = {component[i] for i in ent1[cross].tolist() + ent2[cross].tolist()}
+    extra = component_bridges(engine, entity_ids, labels, ~np.isin(labels, list(bridged)))
+    ent1, ent2, _ = (
+        np.concatenate([x[cross], y]) for x, y in zip((ent1, ent2, distance), extra)
+    )
+    score = engine.paired_similarity(ent1, ent2) + 0.2 * common_score.score_pairs(ent1, ent2)
     # 确定优先级
-    priorities.sort(key=lambda x: x[2], reverse=True)
-    for ent1, ent2, score in priorities:
-        ent1 = entity_map[ent1]
-        ent2 = entity_map[ent2]
-        if ent1.id >= ent2.id:
-            continue
-        if get_parent(injection, ent1.id) == get_parent(injection, ent2.id):
-            continue
-        logging.info(f"ALL {allcnt}: SUCCESS {successcnt}")
-        allcnt += 1
-        op = RelationPredictoperation(entity_map[ent1.id], entity_map[ent2.id])
-        response = execute_operator([op])[0]
-        logging.info(f"Try to connect {entity_map[ent1.id].title} {entity_map[ent2.id].title}")
-        novelty = RelationPredictoperation.get_strength(response)
-        if novelty < threshold:
-            continue
-        relation = op.get_relation(get_relation_id(), response)
-        if relation == None:
-            continue
-        successcnt += 1
-        newrelations.append(relation)
-        injection[get_parent(injection, ent1.id)] = get_parent(injection, ent2.id)
+    priorities = _top_priorities(ent1, ent2, score)
+    # 新关系的id在内存中递增，不再每条都重新读取关系文件
+    next_id = max([get_relation_id()] + [rel.id for rel in newrelations]) + 1
+    rounds = 0
+    while True:
+        # 每一轮为尽可能多的分量对各选一条得分最高的候选边，选出的边在分量之间不成环
+        priorities = [
+            p
+            for p in priorities
+            if (p[0], p[1]) not in rejected
+            and get_parent(injection, p[0]) != get_parent(injection, p[1])
+        ]
+        tentative = {}
+        batch = []
+        for e1, e2, _ in priorities:
+            r1, r2 = get_parent(injection, e1), get_parent(injection, e2)
+            tentative.setdefault(r1, r1)
+            tentative.setdefault(r2, r2)
+            r1, r2 = get_parent(tentative, r1), get_parent(tentative, r2)
+            if r1 == r2:
+                continue
+            tentative[r1] = r2
+            batch.append((e1, e2))
+            if len(batch) == connection_batch_size:
+                break
+        if len(batch) == 0:
+            break
+        rounds += 1
+        ops = [RelationPredictoperation(entity_map[e1], entity_map[e2]) for e1, e2 in batch]
+        responses = execute_operator(ops, need_show_progress=False)
+        records = []
+        for (e1, e2), op, response in zip(batch, ops, responses):
+            novelty = RelationPredictoperation.get_strength(response)
+            relation = None
+            if novelty >= threshold:
+                relation = op.get_relation(next_id, response)
+            if relation == None:
+                record = {"op": "reject_pair", "ids": [e1, e2]}
+            else:
+                next_id += 1
+                successcnt += 1
+                record = {"op": "add_relation", "ids": [e1, e2], "relation": relation.to_dict()}
+            apply(record)
+            records.append(record)
+        allcnt += len(batch)
+        wal.append_many(records)
+        if wal.should_snapshot():
+            wal.snapshot(state())
+        logging.info(f"Round {rounds}: ALL {allcnt}: SUCCESS {successcnt}")
     relations = relations + newrelations
     save_json(os.path.join(graph_structure_path, "entity_related.json"), relations)
+    wal.complete()
 
 
 def identical_predict(
     threshold: float, engine_path: str, table_path: str, folder_path: str
 ):
-    """Target:补齐连边，使得为后续augmented做准备"""
+    """
+    Target:补齐连边，使得为后续augmented做准备
+    threshold: 实体对被检查的余弦相似度阈值（见config.identical_threshold）
+    """
     engine = initialize_entity_engine(engine_path=engine_path, table_path=table_path)
     entities = graph_structure(
         type=[GraphStructureType.entity_node], return_type="object"
@@ -283,22 +347,49 @@ def identical_predict(
     jection = {ent.id: ent.id for ent in entities}
     cnt_success = 0
     cnt_all = 0
-    all_pair = []
-    for entity in entities:
-        similarity = engine.search_by_id(entity.id, 20)
-        for sim in similarity:
-            if entity_map[sim].is_core_entity != entity.is_core_entity:
-                continue
-            all_pair.append((entity.id, sim, engine.get_distance(entity.id, sim)))
-    all_pair.sort(key=lambda x: x[2])
+    # 已经有结论的实体对 -> "merge_nodes"/"distinct_nodes"，恢复时由它得到计数，重复重放不会重复计数
+    decided = {}
+
+    def merge(e1: int, e2: int):
+        nonlocal not_equal_pairs
+        decided[(e1, e2)] = "merge_nodes"
+        idx = get_parent(jection, e1)
+        idy = get_parent(jection, e2)
+        jection[idx] = idy
+        not_equal_pairs = {
+            (jection[id1], jection[id2]) for id1, id2 in not_equal_pairs
+        }
+
+    def distinct(e1: int, e2: int):
+        decided.setdefault((e1, e2), "distinct_nodes")
+        idx = get_parent(jection, e1)
+        idy = get_parent(jection, e2)
+        not_equal_pairs.add((idx, idy))
+        not_equal_pairs.add((idy, idx))
+
+    # 从预写日志恢复上次中断前的判断结果
+    wal = open_mutation_log("identical_predict", entities)
+    snapshot, records = wal.load()
+    if snapshot is not None:
+        jection.update({k: v for k, v in snapshot["jection"]})
+        not_equal_pairs = {tuple(pair) for pair in snapshot["not_equal"]}
+        decided.update({(e1, e2): op for e1, e2, op in snapshot.get("decided", [])})
+    for record in records:
+        if record["op"] == "merge_nodes":
+            merge(*record["ids"])
+        elif record["op"] == "distinct_nodes":
+            distinct(*record["ids"])
+    cnt_success = sum(op == "merge_nodes" for op in decided.values())
+    cnt_all = len(decided)
+    all_pair = _similar_pairs(engine, entities, entity_map, 20)
     relation_cache = []
     batch_num = 20
-    predict_all = sum([1 if pair[2] < threshold else 0 for pair in all_pair])
+    predict_all = sum([1 if pair[2] >= threshold else 0 for pair in all_pair])
     tqdm_bar = tqdm.tqdm(total=predict_all)
-    for ent1, ent2, new_dis in all_pair:
+    for ent1, ent2, new_sim in all_pair:
         if (ent1, ent2) in exists_rel:
             continue
-        if new_dis > threshold:
+        if new_sim < threshold:
             break
         idx = get_parent(jection, ent1)
         idy = get_parent(jection, ent2)
@@ -309,20 +400,17 @@ def identical_predict(
         else:
             cnt_all += 1
             # 剪枝
-            dist.append(new_dis)
+            dist.append(new_sim)
             relation_cache.append((ent1, ent2))
             if len(relation_cache) == batch_num:
                 ops = []
                 asked_pairs = []
+                decisions = []
                 for e1, e2 in relation_cache:
                     if entity_map[e1].title == entity_map[e2].title:
                         cnt_success += 1
-                        idx = get_parent(jection, e1)
-                        idy = get_parent(jection, e2)
-                        jection[idx] = idy
-                        not_equal_pairs = {
-                            (jection[id1], jection[id2]) for id1, id2 in not_equal_pairs
-                        }
+                        merge(e1, e2)
+                        decisions.append({"op": "merge_nodes", "ids": [e1, e2]})
                     else:
                         ops.append(CheckMergeoperation(entity_map[e1], entity_map[e2]))
                         asked_pairs.append((e1, e2))
@@ -335,13 +423,20 @@ def identical_predict(
                     idy = get_parent(jection, e2)
                     if res == True and (idx, idy) not in not_equal_pairs:
                         cnt_success += 1
-                        jection[idx] = idy
-                        not_equal_pairs = {
-                            (jection[id1], jection[id2]) for id1, id2 in not_equal_pairs
-                        }
+                        merge(e1, e2)
+                        decisions.append({"op": "merge_nodes", "ids": [e1, e2]})
                     if res == False and idx != idy:
-                        not_equal_pairs.add((idx, idy))
-                        not_equal_pairs.add((idy, idx))
+                        distinct(e1, e2)
+                        decisions.append({"op": "distinct_nodes", "ids": [e1, e2]})
+                wal.append_many(decisions)
+                if wal.should_snapshot():
+                    wal.snapshot(
+                        {
+                            "jection": list(jection.items()),
+                            "not_equal": list(not_equal_pairs),
+                            "decided": [[e1, e2, op] for (e1, e2), op in decided.items()],
+                        }
+                    )
                 logging.info(
                     f"Success:Total {cnt_success} : {cnt_all} ratio :{cnt_success/cnt_all}"
                 )
@@ -374,9 +469,9 @@ def identical_predict(
     save_json(os.path.join(graph_structure_path, "has_entity.json"), relations_2)
     save_json(os.path.join(graph_structure_path, "entity_nodes.json"), merged_entities)
     node_id_map, _ = realloc_id()
-    engine.table = {node_id_map.get(k, k): v for k, v in engine.table.items()}
-    engine.reverse_table = {v: k for k, v in engine.table.items()}
+    engine.remap_ids(node_id_map)
     engine.save_state(folder_path=folder_path)
+    wal.complete()
 
 
 def test_search_with(strategy: str, engine_path: str, table_path: str):
@@ -387,15 +482,11 @@ def test_search_with(strategy: str, engine_path: str, table_path: str):
     )[0]
     if strategy == "abs-nearest":
         # 5个实体，找5个最近的实体
-        dist = []
-        for ent in entities:
-            sumdis = sum(
-                [
-                    engine.get_distance(ent.id, ner)
-                    for ner in engine.search_by_id(ent.id, 5)
-                ]
-            )
-            dist.append((ent.id, engine.search_by_id(ent.id, 5), sumdis))
+        nearest, distances = engine.search_by_ids([ent.id for ent in entities], 5)
+        dist = [
+            (ent.id, [i for i in near if i != -1], float(dis[np.isfinite(dis)].sum()))
+            for ent, near, dis in zip(entities, nearest.tolist(), distances)
+        ]
         dist.sort(key=lambda x: x[2])
         tosave = [[dis[0], dis[1]] for dis in dist]
         save_json("near_5.json", tosave)
@@ -414,16 +505,19 @@ def print_relation_dis(engine_path: str, table_path: str):
         type=[GraphStructureType.entity_node], return_type="object"
     )[0]
     entmap = {entity.id: entity for entity in entities}
-    diss = []
-    for relation in relations:
-        diss.append(
-            (
-                engine.get_distance(relation.source_id, relation.target_id),
-                relation.type,
-                entmap[relation.source_id].title,
-                entmap[relation.target_id].title,
-            )
+    distances = engine.paired_distance(
+        [relation.source_id for relation in relations],
+        [relation.target_id for relation in relations],
+    )
+    diss = [
+        (
+            distance,
+            relation.type,
+            entmap[relation.source_id].title,
+            entmap[relation.target_id].title,
         )
+        for distance, relation in zip(distances.tolist(), relations)
+    ]
     diss.sort()
     for dis in diss:
         print(dis)
@@ -432,10 +526,8 @@ def print_relation_dis(engine_path: str, table_path: str):
 def get_pair_dis(pair_file: str, engine_path: str, table_path: str):
     pair = load_json(pair_file)
     engine = initialize_entity_engine(engine_path=engine_path, table_path=table_path)
-    diss = []
-    for p in pair:
-        diss.append((engine.get_distance(p[0], p[1]), p[0], p[1]))
-    average_dis = average([dis[0] for dis in diss])
+    diss = engine.paired_distance([p[0] for p in pair], [p[1] for p in pair])
+    average_dis = average(diss)
     print(average_dis)
 
 
@@ -444,7 +536,7 @@ def identical_merge(
 ):
     """
     等价合并算法函数。
-    threshold: 实体对被检查的阈值
+    threshold: 实体对被检查的余弦相似度阈值（见config.identical_threshold）
     engine_path: 引擎ann路径
     table_path: 引擎表路径
     folder_path: 引擎文件夹路径
@@ -474,22 +566,16 @@ def identical_merge(
     jection = {ent.id: ent.id for ent in entities}
     cnt_success = 0
     cnt_all = 0
-    all_pair = []
-    for entity in entities:
-        similarity = engine.search_by_id(entity.id, 30)
-        for sim in similarity:
-            if entity_map[sim].is_core_entity != entity.is_core_entity:
-                continue
-            if (entity.id in subset and sim in subset) or (
-                entity.id not in subset and sim not in subset
-            ):
-                continue
-            all_pair.append((entity.id, sim, engine.get_distance(entity.id, sim)))
-    all_pair.sort(key=lambda x: x[2])
-    for ent1, ent2, new_dis in all_pair:
+    # 只检查新加入的实体与原有实体之间的实体对
+    all_pair = [
+        (ent1, ent2, sim)
+        for ent1, ent2, sim in _similar_pairs(engine, entities, entity_map, 30)
+        if (ent1 in subset) != (ent2 in subset)
+    ]
+    for ent1, ent2, new_sim in all_pair:
         if (ent1, ent2) in exists_rel:
             continue
-        if new_dis > threshold:
+        if new_sim < threshold:
             break
         else:
             idx = get_parent(jection, ent1)
@@ -500,7 +586,7 @@ def identical_merge(
             if (idx, idy) in not_equal_pairs:
                 continue
 
-            dist.append(new_dis)
+            dist.append(new_sim)
             relation = CheckMergeoperation(entity_map[ent1], entity_map[ent2])
             response = CheckMergeoperation.repair(execute_operator([relation])[0])
             cnt_all += 1
@@ -511,13 +597,13 @@ def identical_merge(
                     (jection[id1], jection[id2]) for id1, id2 in not_equal_pairs
                 }
                 print(
-                    f"Success:{new_dis} {entity_map[ent1].title} {entity_map[ent2].title}"
+                    f"Success:{new_sim} {entity_map[ent1].title} {entity_map[ent2].title}"
                 )
             else:
                 not_equal_pairs.add((idx, idy))
                 not_equal_pairs.add((idy, idx))
                 print(
-                    f"Fail:{new_dis} {entity_map[ent1].title} {entity_map[ent2].title}"
+                    f"Fail:{new_sim} {entity_map[ent1].title} {entity_map[ent2].title}"
                 )
             print(
                 f"Success:Total {cnt_success} : {cnt_all} ratio :{cnt_success/cnt_all}"
@@ -552,6 +638,5 @@ def identical_merge(
     save_json(os.path.join(graph_structure_path, "has_entity.json"), relations_2)
     save_json(os.path.join(graph_structure_path, "entity_nodes.json"), merged_entities)
     node_id_map, _ = realloc_id()
-    engine.table = {node_id_map.get(k, k): v for k, v in engine.table.items()}
-    engine.reverse_table = {v: k for k, v in engine.table.items()}
+    engine.remap_ids(node_id_map)
     engine.save_state(folder_path=folder_path)
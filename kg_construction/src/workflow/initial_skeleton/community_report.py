@@ -4,7 +4,7 @@ from ....src.model.section import Section
 from ....src.utils import save_json
 from ....src.config import request_cache_path, final_prompt_path,max_level,graph_structure_path
 from ....src.model.base_operator import RelationExtractionoperation,Summaryoperator
-from ....src.utils.communication import execute_operator
+from ....src.utils.communication import execute_operator, iter_execute_operator
 from ....src.utils.id_operation import graph_structure,GraphStructureType,get_sons
 def get_community_report(level:int,nodes:list[Section]):
     tackle_nodes=[node for node in nodes if node.level==level]
@@ -13,8 +13,9 @@ def get_community_report(level:int,nodes:list[Section]):
     id_to_sons=get_sons()
     if len(type_1_node)!=0:
         ops=[Summaryoperator(node) for node in type_1_node]
-        request_response=execute_operator(ops,cached_file_path=os.path.join(request_cache_path,f"community_summary_{level}.json"),need_read_from_cache=True)
-        for (node,response) in zip(type_1_node,request_response):
+        request_response=iter_execute_operator(ops,cached_file_path=os.path.join(request_cache_path,f"community_summary_{level}.json"),need_read_from_cache=True)
+        for (i,response) in request_response:
+            node=type_1_node[i]
             if response==None:
                 node.summary=node.raw_content
                 node.example=[]
@@ -24,8 +25,9 @@ def get_community_report(level:int,nodes:list[Section]):
     print(id_to_sons.keys())
     if len(type_2_node)!=0:
         ops=[Summaryoperator(node,id_to_sons[node.id]) for node in type_2_node]
-        request_response=execute_operator(ops,cached_file_path=os.path.join(request_cache_path,f"community_summary_{level}.json"),need_read_from_cache=True)
-        for (node,response) in zip(type_2_node,request_response):
+        request_response=iter_execute_operator(ops,cached_file_path=os.path.join(request_cache_path,f"community_summary_{level}.json"),need_read_from_cache=True)
+        for (i,response) in request_response:
+            node=type_2_node[i]
             if response==None:
                 node.summary=node.raw_content
                 continue
@@ -1,4 +1,4 @@
-from typing import Tuple, List, Dict, Optional, Union
+from typing import Tuple, List, Dict, Iterable, Iterator, Optional, Union
 import os
 import logging
 from dataclasses import dataclass, field
@@ -15,7 +15,7 @@ from ....src.config import (
 from ....src.utils.id_operation import graph_structure,deduplicate_relation, realloc_id
 from ....src.model import Entity, Relation, Chunk, Section
 from ....src.model.graph_structure import GraphStructureType
-from ....src.utils import save_json, jsonalize, communicate_with_agent
+from ....src.utils import save_json, jsonalize, communicate_with_agent, iter_communicate_with_agent
 
 @dataclass
 class ExtractionPaths:
@@ -218,74 +218,100 @@ def extract_entities_and_relations(
         
     return result
 
+def stream_extraction(
+    contents_input: List[str],
+    sync_system_prompt: Optional[str] = None,
+    async_system_prompt_1: Optional[str] = None,
+    async_system_prompt_2: Optional[str] = None
+) -> Iterator[Tuple[int, Dict]]:
+    """流式处理实体抽取，按完成顺序产出 (下标, 抽取结果)"""
+    logging.info("Streaming extraction with agent.")
+    if not is_async:
+        yield from iter_communicate_with_agent(
+            system_prompt=sync_system_prompt,
+            user_input=contents_input,
+            need_json=True,
+            cached_file_path=os.path.join(request_cache_path,"step_2_output.json"),
+            need_read_from_cache=True
+        )
+        return
+    # 第一步：抽取实体，第二步的输入依赖全部实体结果
+    step_1_output = communicate_with_agent(
+        system_prompt=async_system_prompt_1,
+        user_input=contents_input,
+        need_json=True,
+        cached_file_path=os.path.join(request_cache_path,"step_1_output.json"),
+        need_read_from_cache=True
+    )
+    # 第二步：抽取关系，每条结果到达后立即合并实体
+    step_2_input = [
+        f"关系来源的原文:\n{contents_input[i]}\n以下是用户提供的实体:\n{step_1_output[i]}"
+        for i in range(len(step_1_output))
+    ]
+    for i, resp in iter_communicate_with_agent(
+        system_prompt=async_system_prompt_2,
+        user_input=step_2_input,
+        need_json=True,
+        cached_file_path=request_cache_path + "/step_2_output.json",
+        need_read_from_cache=True
+    ):
+        if resp is None:
+            resp = {}
+        try:
+            resp["entities"] = jsonalize(step_1_output[i])["entities"]
+        except Exception as e:
+            logging.error(f"error data: {step_1_output[i]}")
+            resp["entities"]=[]
+        yield i, resp
+
 def process_extraction(
     contents_input: List[str],
     sync_system_prompt: Optional[str] = None,
     async_system_prompt_1: Optional[str] = None,
     async_system_prompt_2: Optional[str] = None
 ) -> List[Dict]:
-    """处理实体抽取"""
-    logging.info("Processing extraction with agent.")
-    try:
-        if is_async:
-            # 第一步：抽取实体
-            step_1_output = communicate_with_agent(
-                system_prompt=async_system_prompt_1,
-                user_input=contents_input,
-                need_json=True,
-                cached_file_path=os.path.join(request_cache_path,"step_1_output.json"),
-                need_read_from_cache=True
-            )
-            # 第二步：抽取关系
-            step_2_input = [
-                f"关系来源的原文:\n{contents_input[i]}\n以下是用户提供的实体:\n{step_1_output[i]}"
-                for i in range(len(step_1_output))
-            ]
-            
-            response_data = communicate_with_agent(
-                system_prompt=async_system_prompt_2,
-                user_input=step_2_input,
-                need_json=True,
-                cached_file_path=request_cache_path + "/step_2_output.json",
-                need_read_from_cache=True
-            )
-            
-            # 合并实体数据
-            
-            for i, resp in enumerate(response_data):
-                if resp is None:
-                    resp = {}
-                try:
-                    resp["entities"] = jsonalize(step_1_output[i])["entities"]
-                except Exception as e:
-                    logging.error(f"error data: {step_1_output[i]}")
-                    resp["entities"]=[]
-            
-            return response_data
-        else:
-            return communicate_with_agent(
-                system_prompt=sync_system_prompt,
-                user_input=contents_input,
-                need_json=True,
-                cached_file_path=os.path.join(request_cache_path,"step_2_output.json"),
-                need_read_from_cache=True
-            )
-    except Exception as e:
-        logging.error(f"Failed to process extraction: {e}")
-        raise
+    """处理实体抽取，返回与contents_input一一对应的结果列表"""
+    response_data = [None] * len(contents_input)
+    for i, resp in stream_extraction(
+        contents_input, sync_system_prompt, async_system_prompt_1, async_system_prompt_2
+    ):
+        response_data[i] = resp
+    return response_data
+
+def in_input_order(response_data: Iterable[Tuple[int, Dict]]) -> Iterator[Tuple[int, Dict]]:
+    """把按完成顺序到达的 (下标, 结果) 重新按下标顺序产出：
+    先到达的结果暂存，直到它之前的结果都已处理，这样实体和关系的id与请求完成的先后无关"""
+    pending = {}
+    next_index = 0
+    for i, data in response_data:
+        pending[i] = data
+        while next_index in pending:
+            yield next_index, pending.pop(next_index)
+            next_index += 1
+    # 没有返回的下标之后的结果
+    for i in sorted(pending):
+        yield i, pending[i]
 
 def process_chunk_data(
     section_or_chunks: List[Union[Chunk, Section]],
-    response_data: List[Dict],
+    response_data: Union[List[Dict], Iterable[Tuple[int, Dict]]],
     id_counter: int,
     relation_id_counter: int
 ) -> Tuple[List[Entity], List[Relation]]:
-    """处理分块数据并生成实体和关系"""
+    """处理分块数据并生成实体和关系
+    response_data可以是与section_or_chunks一一对应的列表，
+    也可以是stream_extraction产出的 (下标, 结果) 迭代器，按下标顺序处理（见in_input_order），
+    因此分配的id与列表输入时相同，每次运行一致
+    """
     logging.info("Processing chunk data.")
     entity_nodes = []
     relation_edges = []
+    if isinstance(response_data, list):
+        response_data = enumerate(response_data)
+    else:
+        response_data = in_input_order(response_data)
     
-    for i, data in enumerate(response_data):
+    for i, data in response_data:
         # 提取实体和关系
         extraction_result = extract_entities_and_relations(
             data, id_counter, relation_id_counter
@@ -333,8 +359,8 @@ def entity_extraction():
         section_or_chunks, contents_input, id_counter, relation_id_counter = prepare_input_data(
         )
         
-        # 执行实体抽取
-        response_data = process_extraction(
+        # 执行实体抽取，结果到达即处理
+        response_data = stream_extraction(
             contents_input, sync_system_prompt, async_system_prompt_1, async_system_prompt_2
         )
         
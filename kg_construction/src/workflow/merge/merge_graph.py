@@ -11,7 +11,7 @@ from src.utils.id_operation import (
 from src.model.graph_structure import GraphStructureType
 from src.workflow.augmentation.relation_predict import identical_merge
 from src.utils.file_operation import save_json
-from src.config import engine_cache_path
+from src.config import engine_cache_path, identical_threshold
 from src.config import graph_structure_path, engine_cache_path
 import os
 
@@ -51,11 +51,12 @@ def merge_graph_with_unstructured(
     new_entities = []
     nodes_id_map = {}
     # 直接插入新的点
+    engine_old.insert_many(
+        range(nodes_id_begin + 1, nodes_id_begin + 1 + len(new_entity)),
+        engine_new.get_vectors_by_ids([ent.id for ent in new_entity]),
+    )
     for new_ent in new_entity:
         nodes_id_begin += 1
-        engine_old.insert_entity(
-            nodes_id_begin, engine_new.get_vector_by_id(new_ent.id)
-        )
         nodes_id_map[new_ent.id] = nodes_id_begin
         new_ent.id = nodes_id_begin
         new_ent.to_relation = []
@@ -84,18 +85,13 @@ def merge_graph_with_unstructured(
     save_relation(all_relations_prev + new_relations, entities_set)
     node_id_map, _ = realloc_id()
     # 更新引擎
-    engine_old.table = {
-        node_id_map[key]: value
-        for key, value in engine_old.table.items()
-        if key in node_id_map
-    }
-    engine_old.reverse_table = {value: key for key, value in engine_old.table.items()}
+    engine_old.remap_ids(node_id_map)
     engine_old.save_state(engine_cache_path)
     # 执行合并操作
     new_entity_set = set([ent.id for ent in new_entities])
 
     identical_merge(
-        0.55,
+        identical_threshold,
         engine_path=os.path.join(engine_cache_path, "engine.ann"),
         table_path=os.path.join(engine_cache_path, "table.json"),
         folder_path=engine_cache_path,
@@ -168,11 +164,12 @@ def merge_graph_with_structured(
         table_path=os.path.join(incremental_engine_folder, "table.json"),
     )
     new_entities = []
+    engine_old.insert_many(
+        range(nodes_id_begin + 1, nodes_id_begin + 1 + len(new_entity)),
+        engine_new.get_vectors_by_ids([ent.id for ent in new_entity]),
+    )
     for new_ent in new_entity:
         nodes_id_begin += 1
-        engine_old.insert_entity(
-            nodes_id_begin, engine_new.get_vector_by_id(new_ent.id)
-        )
         nodes_id_map[new_ent.id] = nodes_id_begin
         new_ent.id = nodes_id_begin
         new_ent.to_relation = []
@@ -211,17 +208,12 @@ def merge_graph_with_structured(
     entities_set = set([ent.id for ent in prev_entity + new_entities])
     save_relation(all_relations_prev + new_relations, entities_set)
     node_id_map, _ = realloc_id()
-    engine_old.table = {
-        node_id_map[key]: value
-        for key, value in engine_old.table.items()
-        if key in node_id_map
-    }
-    engine_old.reverse_table = {value: key for key, value in engine_old.table.items()}
+    engine_old.remap_ids(node_id_map)
     engine_old.save_state(engine_cache_path)
     # 执行合并操作
     new_entity_set = set([ent.id for ent in new_entities])
     identical_merge(
-        0.55,
+        identical_threshold,
         engine_path=os.path.join(engine_cache_path, "engine.ann"),
         table_path=os.path.join(engine_cache_path, "table.json"),
         folder_path=engine_cache_path,
@@ -0,0 +1,33 @@
+"""测试使用 outputs/tree 中的小图的副本
+
+config 在导入时读取 meta_path，这里在导入任何 kg_construction 模块之前指向临时目录；
+graph_dir 在每个测试前把图恢复为原始内容。
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+FIXTURE = os.path.join(ROOT, "outputs", "tree")
+META_PATH = tempfile.mkdtemp(prefix="kg_test_")
+
+sys.path.insert(0, ROOT)
+os.environ["meta_path"] = META_PATH
+
+
+def restore_graph() -> str:
+    """把META_PATH恢复为原始的图（同时清空预写日志和引擎），返回图目录"""
+    shutil.rmtree(META_PATH, ignore_errors=True)
+    # 不保留原文件的mtime，保证按 (mtime, size) 缓存的索引会重建
+    shutil.copytree(FIXTURE, META_PATH, copy_function=shutil.copy)
+    os.makedirs(os.path.join(META_PATH, "engine"))
+    return os.path.join(META_PATH, "graph")
+
+
+@pytest.fixture
+def graph_dir():
+    return restore_graph()
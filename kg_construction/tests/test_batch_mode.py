@@ -0,0 +1,59 @@
+"""execute_operator(mode="batch") 与 utils/mock_server.py 的批处理接口联调"""
+
+import pytest
+from openai import OpenAI
+
+from kg_construction.src.utils import communication
+from kg_construction.src.model.base_operator import KGoperator
+from kg_construction.src.utils.communication import execute_operator
+from utils import mock_server
+
+
+class EchoOperator(KGoperator):
+    def __init__(self, prompt_path: str, user_input: str):
+        self.prompt_path = prompt_path
+        self.user_input = user_input
+        self.return_type = "raw"
+        self.default = "默认回复"
+
+
+@pytest.fixture
+def batch_server(monkeypatch, tmp_path):
+    server = mock_server.serve()
+    client = OpenAI(api_key="mock", base_url=f"http://127.0.0.1:{server.server_port}/v1")
+    monkeypatch.setattr(communication, "get_batch_client", lambda: (client, "/v1/chat/completions"))
+    monkeypatch.setattr(communication, "request_cache_enabled", False)
+    monkeypatch.setattr(communication, "request_cache_path", str(tmp_path))
+    monkeypatch.setattr(communication, "batch_poll_interval", 0.01)
+    monkeypatch.setattr(communication, "batch_poll_max_interval", 0.01)
+    monkeypatch.setattr(communication, "batch_timeout", 5)
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def ops(tmp_path):
+    prompt_path = tmp_path / "prompt.txt"
+    prompt_path.write_text("你是一个助手", encoding="utf-8")
+    return [EchoOperator(str(prompt_path), f"第{i}个请求") for i in range(5)]
+
+
+def test_completed_batch(batch_server, ops):
+    result = execute_operator(ops, mode="batch")
+    assert result == [f"mock response for: {op.user_input}" for op in ops]
+
+
+def test_failed_requests_use_default(batch_server, ops):
+    batch_server.RequestHandlerClass.throttle = 1.0
+    result = execute_operator(ops, mode="batch")
+    assert result == [op.default_response() for op in ops]
+
+
+def test_expired_batch_uses_default(monkeypatch, batch_server, ops):
+    def expire(self, batch):
+        batch["status"] = "expired"
+        return batch
+
+    monkeypatch.setattr(batch_server.RequestHandlerClass, "advance_batch", expire)
+    result = execute_operator(ops, mode="batch")
+    assert result == [op.default_response() for op in ops]
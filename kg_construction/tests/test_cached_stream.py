@@ -0,0 +1,58 @@
+"""iter_cached_conservation 与 astream_cached_conservation 共用同一套缓存逻辑"""
+
+import asyncio
+
+import pytest
+
+from kg_construction.src import config
+from kg_construction.src.utils import communication
+
+
+def _reply(user: str) -> str:
+    # "失败"结尾的请求模拟失败，返回空字符串
+    return "" if user.endswith("失败") else f"回复:{user}"
+
+
+@pytest.fixture
+def fake_stream(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "request_cache_path", str(tmp_path))
+    asked = []
+
+    def stream(system_prompt, user_input, need_json, show_progress=False):
+        asked.extend(user_input)
+        # 按与输入相反的顺序完成
+        for j in reversed(range(len(user_input))):
+            yield j, _reply(user_input[j])
+
+    async def astream(system_prompt, user_input, need_json):
+        for item in stream(system_prompt, user_input, need_json):
+            yield item
+
+    monkeypatch.setattr(communication, "stream_conservation", stream)
+    monkeypatch.setattr(communication, "astream_conservation", astream)
+    return asked
+
+
+def _collect_async(*args) -> list:
+    async def run():
+        return [item async for item in communication.astream_cached_conservation(*args)]
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_cached_stream(fake_stream, use_async):
+    def collect(inputs):
+        args = (["提示词"] * len(inputs), inputs, [False] * len(inputs))
+        if use_async:
+            return _collect_async(*args)
+        return list(communication.iter_cached_conservation(*args))
+
+    first = ["a", "b失败", "c"]
+    assert sorted(collect(first)) == [(i, _reply(user)) for i, user in enumerate(first)]
+    # 命中缓存的先按顺序产出，失败的请求没有写入缓存，再次请求
+    fake_stream.clear()
+    assert collect(["c", "d", "a", "b失败"]) == [
+        (0, "回复:c"), (2, "回复:a"), (3, ""), (1, "回复:d"),
+    ]
+    assert fake_stream == ["d", "b失败"]
@@ -0,0 +1,56 @@
+import os
+
+import networkx as nx
+import numpy as np
+
+from kg_construction.src.utils.engine import SearchEngine, build_index
+from kg_construction.src.utils.file_operation import load_json
+from kg_construction.src.utils.id_operation import graph_structure
+from kg_construction.src.model.graph_structure import GraphStructureType
+from kg_construction.src.workflow.augmentation import relation_predict as rp
+
+
+def test_connection_predict_rounds(monkeypatch, graph_dir):
+    entities = graph_structure(type=[GraphStructureType.entity_node], return_type="object")[0]
+    relations = graph_structure(type=[GraphStructureType.entity_related_relation], return_type="object")[0]
+    ids = [entity.id for entity in entities]
+    vectors = np.random.default_rng(0).standard_normal((len(ids), 16)).astype(np.float32)
+    monkeypatch.setattr(rp, "initialize_entity_engine", lambda **kw: SearchEngine(build_index(vectors, ids=ids)))
+    monkeypatch.setattr(rp, "connection_batch_size", 8)
+
+    graph = nx.Graph()
+    graph.add_nodes_from(ids)
+    graph.add_edges_from((rel.source_id, rel.target_id) for rel in relations)
+    asked = set()
+    rounds = []
+
+    def fake_execute(ops, **kw):
+        # 同一轮中的边加入当前的图后不成环，任何实体对不会被请求两次
+        tentative = graph.copy()
+        for op in ops:
+            pair = frozenset((op.src_entity.id, op.tar_entity.id))
+            assert pair not in asked
+            asked.add(pair)
+            assert not nx.has_path(tentative, op.src_entity.id, op.tar_entity.id)
+            tentative.add_edge(op.src_entity.id, op.tar_entity.id)
+        rounds.append(len(ops))
+        responses = []
+        for op in ops:
+            accept = (op.src_entity.id * op.tar_entity.id) % 3 != 0
+            if accept:
+                graph.add_edge(op.src_entity.id, op.tar_entity.id)
+            responses.append({"is_relevant": accept, "strength": 8, "type": "related", "description": "d"})
+        return responses
+
+    monkeypatch.setattr(rp, "execute_operator", fake_execute)
+    rp.connection_predict()
+
+    assert len(rounds) > 1 and max(rounds) <= 8
+    assert nx.is_connected(graph)
+    saved = load_json(os.path.join(graph_dir, "entity_related.json"))
+    relation_ids = [rel["id"] for rel in saved]
+    assert len(relation_ids) == len(set(relation_ids))
+    # 保存的关系就是原有的关系加上被接受的实体对，没有重复的边
+    edges = [frozenset((rel["source_id"], rel["target_id"])) for rel in saved]
+    assert len(edges) == len(set(edges))
+    assert set(edges) == {frozenset(edge) for edge in graph.edges}
@@ -0,0 +1,46 @@
+import json
+import os
+
+from kg_construction.src.utils import graph_store
+from kg_construction.src.utils.file_operation import save_json
+from kg_construction.src.utils.graph_store import load_records, load_table
+
+GRAPH_FILES = [
+    "section_nodes", "entity_nodes", "has_subsection", "section_related", "has_entity", "entity_related",
+]
+
+
+def _json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_columnar_records_round_trip(graph_dir):
+    for name in GRAPH_FILES:
+        path = os.path.join(graph_dir, f"{name}.json")
+        records = _json(path)
+        assert load_records(path) == records, name
+        if load_table(path).has("id"):
+            assert load_table(path).column("id").tolist() == [r["id"] for r in records]
+        # 磁盘上的列式副本（不经过内存缓存）与JSON一致
+        graph_store._tables.clear()
+        assert load_records(path) == records, name
+    assert os.path.isdir(os.path.join(graph_dir, graph_store.COLUMNAR_DIR, "entity_nodes"))
+
+
+def test_columnar_copy_follows_json_changes(graph_dir):
+    path = os.path.join(graph_dir, "entity_related.json")
+    relations = _json(path)
+    table = load_table(path)
+    assert table.edge_pairs() == {(r["source_id"], r["target_id"]) for r in relations} | {
+        (r["target_id"], r["source_id"]) for r in relations
+    }
+    relations = relations[1:]
+    relations[0]["descriptions"] = relations[0]["descriptions"] + ["新的描述"]
+    save_json(path, relations)
+    assert load_records(path) == relations
+    assert len(load_table(path)) == len(relations)
+
+    # 记录可以随意修改，不影响之后读取的结果
+    load_records(path)[0]["descriptions"].append("x")
+    assert load_records(path) == relations
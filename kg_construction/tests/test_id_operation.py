@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+from kg_construction.src.utils.file_operation import load_json, save_json
+from kg_construction.src.utils.id_operation import RELATION_FILES, realloc_id
+
+
+def _load(graph_dir, name):
+    return load_json(os.path.join(graph_dir, f"{name}.json"))
+
+
+def _delete_entities(graph_dir, entity_ids: set):
+    """删除实体以及所有连到这些实体的关系"""
+    entities = [e for e in _load(graph_dir, "entity_nodes") if e["id"] not in entity_ids]
+    save_json(os.path.join(graph_dir, "entity_nodes.json"), entities)
+    for name in RELATION_FILES:
+        relations = [
+            r for r in _load(graph_dir, name)
+            if r["source_id"] not in entity_ids and r["target_id"] not in entity_ids
+        ]
+        save_json(os.path.join(graph_dir, f"{name}.json"), relations)
+
+
+def _graph(graph_dir):
+    nodes = _load(graph_dir, "section_nodes") + _load(graph_dir, "entity_nodes")
+    relations = [r for name in RELATION_FILES for r in _load(graph_dir, name)]
+    return nodes, relations
+
+
+def test_realloc_id_keeps_ids_stable(graph_dir):
+    entities = _load(graph_dir, "entity_nodes")
+    removed = {entities[5]["id"]}
+    _delete_entities(graph_dir, removed)
+    nodes_before, relations_before = _graph(graph_dir)
+
+    node_map, rel_map = realloc_id()
+    assert all(old == new for old, new in node_map.items())
+    assert all(old == new for old, new in rel_map.items())
+    nodes, relations = _graph(graph_dir)
+    assert [n["id"] for n in nodes] == [n["id"] for n in nodes_before]
+    assert [r["id"] for r in relations] == [r["id"] for r in relations_before]
+    # 节点中指向已删除关系的id被去掉
+    rel_ids = {r["id"] for r in relations}
+    assert all(i in rel_ids for n in nodes for i in n["to_relation"] + n["from_relation"])
+
+
+def test_realloc_id_compacts_above_threshold(graph_dir):
+    entities = _load(graph_dir, "entity_nodes")
+    removed = {e["id"] for e in entities[::2]}
+    _delete_entities(graph_dir, removed)
+    titles_before = {n["id"]: n["title"] for n in _graph(graph_dir)[0]}
+    ends_before = {r["id"]: (r["source_id"], r["target_id"]) for r in _graph(graph_dir)[1]}
+
+    node_map, rel_map = realloc_id()
+    nodes, relations = _graph(graph_dir)
+    assert sorted(n["id"] for n in nodes) == list(range(len(nodes)))
+    assert sorted(r["id"] for r in relations) == list(range(len(relations)))
+    assert {node_map[old]: title for old, title in titles_before.items()} == {n["id"]: n["title"] for n in nodes}
+    assert {
+        rel_map[old]: (node_map[s], node_map[t]) for old, (s, t) in ends_before.items()
+    } == {r["id"]: (r["source_id"], r["target_id"]) for r in relations}
+
+
+def test_realloc_id_rejects_duplicate_ids(graph_dir):
+    entities = _load(graph_dir, "entity_nodes")
+    entities[1]["id"] = entities[0]["id"]
+    save_json(os.path.join(graph_dir, "entity_nodes.json"), entities)
+    with pytest.raises(ValueError):
+        realloc_id()
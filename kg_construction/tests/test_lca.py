@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from kg_construction.src.utils.lca import AncestorIndex, CommonAncestorScores
+
+
+def _random_forest(rng) -> tuple[dict[int, list[int]], list[int]]:
+    """几棵独立的章节树，实体挂在一个或多个章节下（可以跨树）；返回 (父节点表, 实体id)"""
+    parent = {}
+    sections = []
+    for _ in range(int(rng.integers(1, 4))):
+        root = len(sections)
+        sections.append(root)
+        for _ in range(int(rng.integers(0, 12))):
+            child = len(sections)
+            parent[child] = [int(rng.choice(sections[root:]))]
+            sections.append(child)
+    entities = list(range(len(sections), len(sections) + int(rng.integers(2, 15))))
+    for entity in entities:
+        k = int(rng.integers(1, min(3, len(sections)) + 1))
+        parent[entity] = [int(p) for p in rng.choice(sections, k, replace=False)]
+    return parent, entities
+
+
+def _baseline(parent: dict[int, list[int]], e1: int, e2: int) -> int:
+    """原来的get_common_score：每一种父节点组合都沿第一个父节点走到根，取祖先链交集的最大值"""
+    max_common = 0
+    for ii in parent[e1]:
+        for jj in parent[e2]:
+            i, j = ii, jj
+            parents_1 = {i}
+            while parent.get(i) is not None:
+                i = parent[i][0]
+                parents_1.add(i)
+            parents_2 = {j}
+            while parent.get(j) is not None:
+                j = parent[j][0]
+                parents_2.add(j)
+            max_common = max(max_common, len(parents_1 & parents_2))
+    return max_common
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_common_ancestor_scores_match_baseline(seed):
+    parent, entities = _random_forest(np.random.default_rng(seed))
+    scores = CommonAncestorScores(AncestorIndex.from_parent(parent), entities, parent)
+    pairs = [(a, b) for a in entities for b in entities if a != b]
+    expected = [_baseline(parent, a, b) for a, b in pairs]
+    assert scores.score_pairs([a for a, _ in pairs], [b for _, b in pairs]).tolist() == expected
+    for (a, b), value in zip(pairs, expected):
+        assert scores[(a, b)] == value and scores.get((a, b), -1) == value
+    assert len(scores) == len(pairs)
+    assert (entities[0], entities[0]) not in scores and scores.get((entities[0], -5), 0) == 0
+
+
+def test_ancestor_index_rejects_cycles():
+    with pytest.raises(ValueError):
+        AncestorIndex.from_parent({1: [2], 2: [1]})
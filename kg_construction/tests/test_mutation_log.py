@@ -0,0 +1,108 @@
+import logging
+import os
+
+import numpy as np
+import pytest
+from conftest import restore_graph
+
+from kg_construction.src import config
+from kg_construction.src.utils.file_operation import load_json
+from kg_construction.src.utils.engine import SearchEngine, build_index
+from kg_construction.src.utils.id_operation import graph_structure
+from kg_construction.src.utils.mutation_log import MutationLog
+from kg_construction.src.model.graph_structure import GraphStructureType
+from kg_construction.src.workflow.augmentation import relation_predict as rp
+
+
+def test_resume_after_partial_write(tmp_path):
+    wal = MutationLog(str(tmp_path), "stage", "fp")
+    wal.append("merge_nodes", ids=[1, 2])
+    wal.append("distinct_nodes", ids=[3, 4])
+    # 崩溃时最后一行只写了一半
+    with open(wal.path, "ab") as f:
+        f.write(b'{"op": "merge_no')
+
+    wal = MutationLog(str(tmp_path), "stage", "fp")
+    state, records = wal.load()
+    assert state is None
+    assert [r["ids"] for r in records] == [[1, 2], [3, 4]]
+    wal.append("merge_nodes", ids=[5, 6])
+    _, records = MutationLog(str(tmp_path), "stage", "fp").load()
+    assert [r["ids"] for r in records] == [[1, 2], [3, 4], [5, 6]]
+
+
+def test_snapshot_and_fingerprint(tmp_path):
+    wal = MutationLog(str(tmp_path), "stage", "fp", snapshot_every=2)
+    wal.append_many([{"op": "merge_nodes", "ids": [1, 2]}, {"op": "merge_nodes", "ids": [3, 4]}])
+    assert wal.should_snapshot()
+    wal.snapshot({"value": 1})
+    wal.append("distinct_nodes", ids=[5, 6])
+
+    state, records = MutationLog(str(tmp_path), "stage", "fp").load()
+    assert state == {"value": 1}
+    assert [r["ids"] for r in records] == [[5, 6]]
+
+    # 图变化后日志和快照一起作废
+    state, records = MutationLog(str(tmp_path), "stage", "other").load()
+    assert (state, records) == (None, [])
+    assert not os.path.exists(wal.path) and not os.path.exists(wal.snapshot_path)
+
+
+class _Interrupted(Exception):
+    pass
+
+
+def _run_identical_predict(monkeypatch, caplog, fail_after=None):
+    """用确定的假回复运行identical_predict，返回 (每批请求的实体对, 最后一条统计日志)"""
+    entities = graph_structure(type=[GraphStructureType.entity_node], return_type="object")[0]
+    ids = [entity.id for entity in entities]
+    vectors = np.random.default_rng(0).standard_normal((len(ids), 16)).astype(np.float32)
+    monkeypatch.setattr(rp, "initialize_entity_engine", lambda **kw: SearchEngine(build_index(vectors, ids=ids)))
+    batches = []
+
+    def fake_execute(ops, **kw):
+        if fail_after is not None and len(batches) >= fail_after:
+            raise _Interrupted()
+        batches.append([(op.id1, op.id2) for op in ops])
+        return [{"is_identical": (op.id1 + op.id2) % 7 == 0} for op in ops]
+
+    monkeypatch.setattr(rp, "execute_operator", fake_execute)
+    caplog.clear()
+    with caplog.at_level(logging.INFO):
+        rp.identical_predict(-1.0, "", "", config.engine_cache_path)
+    totals = [r.getMessage() for r in caplog.records if r.getMessage().startswith("Success:Total")]
+    return batches, totals[-1]
+
+
+def _entity_titles(graph_dir):
+    return sorted(entity["title"] for entity in load_json(os.path.join(graph_dir, "entity_nodes.json")))
+
+
+def test_identical_predict_resume(monkeypatch, caplog, graph_dir):
+    expected_batches, expected_total = _run_identical_predict(monkeypatch, caplog)
+    expected_titles = _entity_titles(graph_dir)
+    assert len(expected_batches) >= 3
+
+    # 第2批之后做快照，并模拟快照已经写入、日志还没清空时崩溃：已经进入快照的记录会被再次重放
+    graph_dir = restore_graph()
+    monkeypatch.setattr(config, "wal_snapshot_every", 30)
+    snapshot = MutationLog.snapshot
+
+    def snapshot_without_truncate(self, state):
+        with open(self.path, "rb") as f:
+            content = f.read()
+        snapshot(self, state)
+        with open(self.path, "wb") as f:
+            f.write(content)
+
+    monkeypatch.setattr(MutationLog, "snapshot", snapshot_without_truncate)
+    with pytest.raises(_Interrupted):
+        _run_identical_predict(monkeypatch, caplog, fail_after=2)
+    assert os.path.exists(MutationLog(config.wal_path, "identical_predict", "").snapshot_path)
+    monkeypatch.setattr(MutationLog, "snapshot", snapshot)
+    batches, total = _run_identical_predict(monkeypatch, caplog)
+
+    # 中断前已经有结论的实体对不会再次请求，计数不会重复，结果与不中断时相同
+    assert batches == expected_batches[2:]
+    assert total == expected_total
+    assert _entity_titles(graph_dir) == expected_titles
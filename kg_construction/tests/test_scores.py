@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from kg_construction.src.utils import score
+from kg_construction.src.utils.adjacency import AdjacencyIndex
+
+
+def _random_index(rng) -> AdjacencyIndex:
+    n = int(rng.integers(2, 30))
+    ids = np.sort(rng.choice(1000, n, replace=False))
+    m = int(rng.integers(0, n * 3))
+    sources, targets = rng.choice(ids, m), rng.choice(ids, m)
+    keep = sources != targets
+    return AdjacencyIndex.from_edges(ids, sources[keep], targets[keep])
+
+
+def _brute_force(index: AdjacencyIndex) -> dict[str, dict]:
+    """与原来的双重循环相同的定义：只包括不相邻的两个不同实体，AA/CN/RA只包括有共同邻居的实体对"""
+    ids = index.ids.tolist()
+    neighbours = {i: set(index.neighbors(i).tolist()) for i in ids}
+    degree = {i: len(neighbours[i]) for i in ids}
+    result = {"aa": {}, "cn": {}, "ra": {}, "pa": {}}
+    for i in ids:
+        for j in ids:
+            if i == j or j in neighbours[i]:
+                continue
+            result["pa"][(i, j)] = degree[i] * degree[j]
+            common = neighbours[i] & neighbours[j]
+            if len(common) == 0:
+                continue
+            result["aa"][(i, j)] = sum(1 / np.log(degree[k]) for k in common)
+            result["cn"][(i, j)] = len(common)
+            result["ra"][(i, j)] = sum(1 / degree[k] for k in common)
+    return result
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_link_scores_match_brute_force(monkeypatch, seed):
+    index = _random_index(np.random.default_rng(seed))
+    monkeypatch.setattr(score, "get_adjacency_index", lambda kind: index)
+    expected = _brute_force(index)
+    ids = index.ids.tolist()
+    a = np.repeat(ids, len(ids))
+    b = np.tile(ids, len(ids))
+    # 度数为0/1的实体不应产生log的除零警告
+    with np.errstate(all="raise"):
+        scores = {
+            "aa": score.get_aa_score(),
+            "cn": score.get_cn_score(),
+            "ra": score.get_ra_score(),
+            "pa": score.get_pa_score(),
+        }
+    for name, scores in scores.items():
+        assert len(scores) == len(expected[name]), name
+        dense = np.array([expected[name].get(pair, 0) for pair in zip(a.tolist(), b.tolist())])
+        np.testing.assert_allclose(scores.score_pairs(a, b), dense, err_msg=name)
+        for pair, value in expected[name].items():
+            assert pair in scores and scores[pair] == pytest.approx(value)
+        for pair in zip(a.tolist(), b.tolist()):
+            if pair not in expected[name]:
+                assert scores.get(pair, -1) == -1
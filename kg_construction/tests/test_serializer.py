@@ -0,0 +1,40 @@
+import pytest
+
+from kg_construction.src import config
+from kg_construction.src.model.graph_structure import GraphStructureType
+from kg_construction.src.utils.file_operation import load_json, save_json
+from kg_construction.src.utils.id_operation import graph_structure
+
+
+@pytest.mark.parametrize("backend", ["json", "orjson"])
+@pytest.mark.parametrize("pretty", [False, True])
+def test_save_and_load_round_trip(monkeypatch, tmp_path, graph_dir, backend, pretty):
+    monkeypatch.setattr(config, "json_backend", backend)
+    monkeypatch.setattr(config, "json_pretty", pretty)
+    sections, entities, relations = graph_structure(
+        type=[
+            GraphStructureType.section_node,
+            GraphStructureType.entity_node,
+            GraphStructureType.entity_related_relation,
+        ],
+        return_type="object",
+    )
+    # 数据类对象直接编码，结果与 to_dict 相同
+    for name, objects in [("sections", sections), ("entities", entities), ("relations", relations)]:
+        path = str(tmp_path / f"{name}.json")
+        save_json(path, objects)
+        assert load_json(path) == [obj.to_dict() for obj in objects], name
+    data = {"1": [1.5, "中文", None, True], "nested": {"a": []}}
+    save_json(str(tmp_path / "dict.json"), data)
+    assert load_json(str(tmp_path / "dict.json")) == data
+    with open(tmp_path / "dict.json", "rb") as f:
+        assert (b"\n" in f.read()) == pretty
+
+
+def test_backends_are_interchangeable(monkeypatch, tmp_path, graph_dir):
+    entities = graph_structure(type=[GraphStructureType.entity_node], return_type="object")[0]
+    path = str(tmp_path / "entities.json")
+    monkeypatch.setattr(config, "json_backend", "orjson")
+    save_json(path, entities)
+    monkeypatch.setattr(config, "json_backend", "json")
+    assert load_json(path) == [entity.to_dict() for entity in entities]
@@ -0,0 +1,93 @@
+import hashlib
+import os
+
+import numpy as np
+import pytest
+
+from kg_construction.src import config
+from kg_construction.src.model.base_operator import Embeddingstroperation
+from kg_construction.src.model.graph_structure import GraphStructureType
+from kg_construction.src.utils import communication
+from kg_construction.src.utils import engine as engine_module
+from kg_construction.src.utils.id_operation import graph_structure
+from kg_construction.src.utils.vector_arena import VectorArena, initialize_vector_arena, load_vector_arena
+
+
+def _fake_embedding(monkeypatch, fail=()):
+    """确定的假嵌入，fail中的文本请求失败；返回每次请求的文本"""
+    requested = []
+
+    def fake_embedding_array(texts, show_progress=False):
+        requested.extend(texts)
+        vectors = np.zeros((len(texts), 16), dtype=np.float32)
+        ok = np.array([text not in fail for text in texts], dtype=bool)
+        for i, text in enumerate(texts):
+            if ok[i]:
+                seed = int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16)
+                vectors[i] = np.random.default_rng(seed).standard_normal(16)
+        return vectors, ok
+
+    monkeypatch.setattr(communication, "multi_embedding_array", fake_embedding_array)
+    monkeypatch.setattr(communication, "embedding_store_enabled", False)
+    return requested
+
+
+def test_engines_are_copied_from_the_arena(monkeypatch, graph_dir):
+    requested = _fake_embedding(monkeypatch)
+    entities, sections = graph_structure(
+        type=[GraphStructureType.entity_node, GraphStructureType.section_node], return_type="object"
+    )
+    engine_folder = os.path.join(graph_dir, "..", "engine")
+    engine = engine_module.initialize_entity_engine(
+        engine_path=os.path.join(engine_folder, "engine.ann"),
+        table_path=os.path.join(engine_folder, "table.json"),
+    )
+    section = engine_module.initialize_section_engine(sections=sections[:3])
+    assert isinstance(engine, engine_module.SearchEngine) and isinstance(section, engine_module.SearchEngine)
+    assert sorted(section.ids.tolist()) == sorted(s.id for s in sections[:3])
+
+    # 引擎复制向量区的索引空间向量，距离一致，新插入的向量只经过一次变换
+    view = load_vector_arena().view("entity")
+    ids = [entity.id for entity in entities]
+    np.testing.assert_allclose(
+        engine.paired_distance(ids[:-1], ids[1:]), view.paired_distance(ids[:-1], ids[1:]), atol=1e-5
+    )
+    vector = np.random.default_rng(0).standard_normal(16)
+    engine.insert_many([10**6], [vector])
+    np.testing.assert_allclose(engine.index_matrix([10**6])[0], vector / np.linalg.norm(vector), atol=1e-5)
+
+    # 图没有变化时不再嵌入，也不重写向量区
+    arena_file = os.path.join(config.vector_arena_path, "arena.json")
+    mtime = os.stat(arena_file).st_mtime_ns
+    count = len(requested)
+    assert not initialize_vector_arena(rebuild=True).dirty
+    assert len(requested) == count and os.stat(arena_file).st_mtime_ns == mtime
+
+
+def test_string_engine_stays_in_its_folder(monkeypatch, tmp_path, graph_dir):
+    _fake_embedding(monkeypatch)
+    engine = engine_module.initial_engine_with_str(
+        ["a", "b", "c"], str(tmp_path / "engine.ann"), str(tmp_path / "table.json")
+    )
+    assert isinstance(engine, engine_module.SearchEngine) and engine.search_by_id(0, 2) != []
+    engine.save_state(str(tmp_path))
+    assert os.path.exists(tmp_path / "engine.ann")
+    assert not os.path.exists(os.path.join(config.vector_arena_path, "arena.json"))
+
+
+def test_failed_embeddings_are_not_stored(monkeypatch):
+    _fake_embedding(monkeypatch, fail={"b"})
+    arena = VectorArena()
+    with pytest.raises(RuntimeError):
+        arena.add_texts(["a", "b"])
+    assert len(arena) == 1
+
+    requested = _fake_embedding(monkeypatch)
+    slots = arena.add_texts(["a", "b"])
+    assert requested == ["b"] and slots.tolist() == [0, 1]
+
+
+def test_failed_rows_use_the_configured_dimension(monkeypatch):
+    _fake_embedding(monkeypatch, fail={"b"})
+    result = communication.execute_operator([Embeddingstroperation(["a", "b"])])
+    assert result.shape == (2, 16) and not result[1].any()
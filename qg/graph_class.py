@@ -38,12 +38,14 @@ from utils.api import (
     multi_embedding,
     multiroundConversation,
 )
+from utils.graph_snapshot import load_snapshot, write_snapshot
 import multiprocessing as mp
 
 class KnowledgeGraph:
     def __init__(self):
         """初始化知识图谱结构"""
         self.graph = nx.DiGraph()  # 使用有向图
+        self.snapshot = None
         self.question_templates = {
             'definition': "请解释{concept}的核心概念",
             'relation': "{source}和{target}之间的关系主要体现在哪些方面？",
@@ -51,47 +53,45 @@ class KnowledgeGraph:
         }
 
     def load_knowledge_graph(self, graph_file_path: str = './demo_kg/graph'):
-        """加载知识图谱（带进度显示）"""
+        """加载知识图谱：优先读取二进制快照，networkx 图在第一次访问 self.graph 时才构建"""
         print("🔍 开始加载知识图谱...")
         start_time = time.time()
-        
-        nodes_path = graph_file_path + "/all_node.json"
-        edges_path = graph_file_path + "/all_relations.json"
-        
-        # 加载节点
-        print(f"📂 正在加载节点文件: {nodes_path}")
-        with open(nodes_path, 'r', encoding='utf-8') as f:
-            nodes = json.load(f)
-        print(f"✅ 已加载 {len(nodes)} 个节点")
-        
-        # 加载边
-        print(f"📂 正在加载边文件: {edges_path}")
-        with open(edges_path, 'r', encoding='utf-8') as f:
-            edges = json.load(f)
-        print(f"✅ 已加载 {len(edges)} 条边")
-        
-        # 处理节点（带进度条）
-        print("\n🛠️ 正在构建知识节点...")
-        id_to_name = {}
-        for node in tqdm(nodes, desc="处理节点"):
-            id_to_name[node['id']] = node['title']
-            description = node['summary'] if 'summary' in node else node['descriptions'][-1]
-            self.graph.add_node(node['title'], description=description)
-        
-        # 处理边（带进度条）
-        print("\n🛠️ 正在构建知识关系...")
-        for edge in tqdm(edges, desc="处理边"):
-            source = id_to_name[edge['source_id']]
-            target = id_to_name[edge['target_id']]
-            if 'has' in edge['type']:
-                edge['type'] = '关联' 
-            rel_type = edge['type'] + edge['descriptions'][-1] if edge['descriptions'] else edge['type']
-            
-            self.graph.add_edge(source, target, short=edge['type'], type=rel_type,weight=edge.get('weight', 1.0))
-        
-        print(f"\n🎉 知识图谱加载完成! 共 {len(nodes)} 节点, {len(edges)} 边, 耗时 {time.time()-start_time:.2f} 秒")
-
 
+        snapshot = load_snapshot(graph_file_path)
+        if snapshot is None:
+            # 没有快照或快照已过期时解析 JSON，并保存快照供下次使用
+            print(f"📂 正在解析图文件: {graph_file_path}")
+            snapshot = write_snapshot(graph_file_path)
+        self.snapshot = snapshot
+        self._graph = None
+
+        print(f"🎉 知识图谱加载完成! 共 {len(snapshot)} 节点, {len(snapshot.indices)} 边, 耗时 {time.time()-start_time:.2f} 秒")
+
+    @property
+    def graph(self) -> nx.DiGraph:
+        if self._graph is None:
+            self._graph = self.snapshot.to_networkx()
+        return self._graph
+
+    @graph.setter
+    def graph(self, graph: nx.DiGraph):
+        self._graph = graph
+
+    def __contains__(self, concept: str) -> bool:
+        if self._graph is None:
+            return self.snapshot.index_of(concept) is not None
+        return concept in self._graph
+
+    def concepts(self) -> List[str]:
+        """所有知识点，不需要构建 networkx 图"""
+        if self._graph is None:
+            return list(self.snapshot.concepts())
+        return list(self._graph.nodes)
+
+    def neighbors(self, concept: str) -> List[str]:
+        if self._graph is None:
+            return self.snapshot.neighbors(concept)
+        return list(self._graph.neighbors(concept))
 
     def visualize(self, output_path: str = "knowledge_graph.png", max_nodes: int = 200):
         """
@@ -185,6 +185,9 @@ class KnowledgeGraph:
 
     def get_node_description(self, concept: str) -> str:
         """获取节点描述"""
+        if self._graph is None:
+            description = self.snapshot.description(concept)
+            return '无描述' if description is None else description
         return self.graph.nodes.get(concept, {}).get('description', '无描述')
 
     def get_relation_info(self, source: str, target: str) -> Dict:
@@ -390,10 +393,10 @@ class KnowledgeQuestionGenerator(SparkAPI):
 
     def generate_by_concept(self, concept: str, q_type: str = 'mcq',level: str = 'easy') -> List[str]:
         """基于特定知识点生成问题（适配当前数据结构）"""
-        if concept not in self.kg.graph:
+        if concept not in self.kg:
             raise ValueError(f"未知知识点: {concept}")
         
-        node_data = self.kg.graph.nodes[concept]
+        node_data = {'description': self.kg.get_node_description(concept)}
         print("-------before------")
         print("node_data: ",node_data)
         params = {
@@ -404,7 +407,7 @@ class KnowledgeQuestionGenerator(SparkAPI):
         print("1111111111111111")
         if q_type == 'mcq':
             print("-----mcq----------")
-            neighbors = list(self.kg.graph.neighbors(concept))
+            neighbors = self.kg.neighbors(concept)
             focus = 'relation' if neighbors else 'definition'
             params.update({
                 'focus': self.question_types['mcq']['focus_map'].get(focus, '基础认知')
@@ -424,7 +427,7 @@ class KnowledgeQuestionGenerator(SparkAPI):
 
     def _infer_difficulty(self, concept: str) -> str:
         """基于连接数推断难度"""
-        degree = len(list(self.kg.graph.neighbors(concept)))
+        degree = len(self.kg.neighbors(concept))
         print(f"🔍 推断知识点 '{concept}' 的难度，连接数: {degree}")
         if degree == 0:
             return "简单"
@@ -435,7 +438,7 @@ class KnowledgeQuestionGenerator(SparkAPI):
 
     def _infer_aspect(self, concept: str) -> str:
         """从描述中提取关键考察方面"""
-        desc = self.kg.graph.nodes[concept]['description']
+        desc = self.kg.get_node_description(concept)
         print("desc:",desc)
         if len(desc) < 20:
             return "核心定义"
@@ -508,7 +511,7 @@ class KnowledgeQuestionGenerator(SparkAPI):
     def _generate_all_concept_questions(self,level: str="easy") -> Dict[str, List[str]]:
         """生成所有知识点的问题（带进度条）"""
         results = {}
-        concepts = list(self.kg.graph.nodes)
+        concepts = self.kg.concepts()
         print(f"  需要处理 {len(concepts)} 个知识点")
         cnt=0
         for concept in tqdm(concepts, desc="生成概念问题"):
@@ -709,7 +712,7 @@ class KnowledgeQuestionGenerator(SparkAPI):
         from PyQt5.QtWidgets import QInputDialog, QMessageBox
 
         # 选择知识点
-        concepts = list(self.kg.graph.nodes)
+        concepts = self.kg.concepts()
         concept, ok = QInputDialog.getItem(parent_widget, "选择知识点", "请选择一个知识点：", concepts, 0, False)
         if not ok:
             return
@@ -745,7 +748,7 @@ class KnowledgeQuestionGenerator(SparkAPI):
 
     def _select_concept(self) -> str:
         """让用户选择知识点"""
-        concepts = list(self.kg.graph.nodes)
+        concepts = self.kg.concepts()
         print("\n📖 可选知识点列表:")
         for i, concept in enumerate(concepts[:10], 1):  # 只显示前10个
             print(f"{i}. {concept}")
@@ -122,7 +122,7 @@ class QAGenerationThread(QThread):
 
             kg = KnowledgeGraph()
             kg.load_knowledge_graph(self.graph_path)
-            self.log_signal.emit(f"✅ 知识图谱加载完成，共 {len(kg.graph.nodes)} 个节点")
+            self.log_signal.emit(f"✅ 知识图谱加载完成，共 {len(kg.concepts())} 个节点")
 
             generator = KnowledgeQuestionGenerator(
                 kg,
@@ -428,7 +428,7 @@ class MainWindow(QWidget):
         try:
             kg = KnowledgeGraph()
             kg.load_knowledge_graph(self.graph_path)
-            concepts = list(kg.graph.nodes)
+            concepts = kg.concepts()
             self.concept_combo.clear()
             self.concept_combo.addItems(concepts)
             self.concept_combo.setEnabled(True)
@@ -1,6 +1,4 @@
-from multiprocessing import Pool, Manager
-from typing import List, Dict
-from tqdm import tqdm
+from typing import AsyncIterator, Iterator, List, Dict, Tuple
 import sys
 from pathlib import Path
 
@@ -12,9 +10,6 @@ project_root = current_dir.parent    # EduSpark/ 目录
 sys.path.append(str(project_root))
 from config import (
     model_name,
-    max_thread_num,
-    extra_models,
-    json_feature,
     APISecret,
     APIKEY,
     APPID,
@@ -22,30 +17,18 @@ from config import (
 from openai import OpenAI
 from zhipuai import ZhipuAI
 import logging
+import numpy as np
 from utils.edusp import get_embp_embedding, parser_Message
-from config import qa_temp
+from utils.llm_pool import get_client_pool, get_provider_settings
+from utils.rate_limit import call_with_limit, estimate_tokens
 #TODO 完成tree-kg所需要的embedding格式函数
 
 def get_default_client_sync():
-    from config import silicon_api_key, glm_api_key, model_provider, spark_api_key
-
-    if model_provider == "spark":
-        return OpenAI(
-            api_key=spark_api_key,
-            base_url="https://spark-api-open.xf-yun.com/v1/",
-        )
-    elif model_provider == "silicon":
-        return OpenAI(
-            api_key=silicon_api_key,
-            base_url="https://api.siliconflow.cn/v1",
-        )
-    elif model_provider == "chatglm":
-        return ZhipuAI(api_key=glm_api_key)
-    elif model_provider == "openai":
-        return OpenAI(
-            api_key=silicon_api_key,
-            base_url="https://api.openai.com/v1",
-        )
+    provider, base_url, api_key = get_provider_settings()
+    if provider == "chatglm":
+        return ZhipuAI(api_key=api_key, base_url=base_url)
+    elif base_url is not None:
+        return OpenAI(api_key=api_key, base_url=base_url)
     else:
         return None
 
@@ -62,110 +45,20 @@ def get_embedding_client_sync():
         return ZhipuAI(api_key=glm_api_key)
 
 
-def worker_conservation(args):
-    conversations, counter, total, lock = args
-    client = get_default_client_sync()
-    results = []
-    for i, (conversation, need_json) in enumerate(conversations):
-        done = False
-        for model in [model_name] + extra_models:
-            try:
-                if need_json and json_feature.get(model, False):
-                    result = client.chat.completions.create(
-                        model=model_name,
-                        messages=conversation,
-                        stream=False,
-                        temperature=qa_temp,
-                        response_format={"type": "json_object"},
-                    )
-                else:
-                    result = client.chat.completions.create(
-                        model=model_name,
-                        messages=conversation,
-                        stream=False,
-                        temperature=qa_temp,
-                    )
-                results.append(result.choices[0].message.content)
-                done = True
-                break
-            except Exception as e:
-                # 这里防止没有 code 属性报错
-                code = getattr(e, "code", None)
-                logging.error(f"API 请求失败状态码: {code}")
-                logging.error(f"Error: {e}")
-                if code == 503:
-                    logging.error("API 请求过多，尝试下一个模型")
-                continue
-        if not done:
-            logging.error("所有模型都请求失败")
-            results.append("")
-        # 更新进度计数
-        if counter is not None:
-            with lock:
-                counter.value += 1
-
-    return results
-
-
-def multi_process_api_conservation(
-    conversations: List[List[Dict[str, str]]],
-    num_processes: int = max_thread_num,
+def async_api_conservation(
+    conversations: List[Tuple[List[Dict[str, str]], bool]],
     show_progress: bool = False,
 ) -> List[str]:
-    chunk_size = max(len(conversations) // num_processes, 1)
-    conversations_chunks = [
-        conversations[i : i + chunk_size]
-        for i in range(0, len(conversations), chunk_size)
-    ]
+    """在共享的异步请求池中执行所有对话，返回结果与输入一一对应"""
+    return get_client_pool().conversations(conversations, show_progress)
 
-    manager = Manager()
-    counter = manager.Value("i", 0) if show_progress else None
-    lock = manager.Lock() if show_progress else None
-    total = len(conversations)
 
-    pool = Pool(processes=num_processes)
-
-    # 把计数器传给worker
-    args = [(chunk, counter, total, lock) for chunk in conversations_chunks]
-
-    results_async = [pool.apply_async(worker_conservation, (arg,)) for arg in args]
-    import time
-
-    if show_progress:
-        with tqdm(total=total) as pbar:
-            last_val = 0
-            while True:
-                current_val = counter.value
-                delta = current_val - last_val
-                if delta > 0:
-                    pbar.update(delta)
-                    last_val = current_val
-                if current_val >= total:
-                    break
-                time.sleep(2)
-
-    pool.close()
-    pool.join()
-
-    final_results = []
-    for r in results_async:
-        final_results.extend(r.get())
-
-    return final_results
-
-
-def multi_conservation(
+def build_conversations(
     system_prompt: List[str],
     user_input: List[str],
     need_json: List[bool] | bool = False,
-    show_progress: bool = False,
-) -> List[str]:
-    """多并行单轮对话请求
-    :param system_prompt: 系统提示词, List[str]
-    :param user_input: 用户输入, List[str],与system_prompt一一对应
-    :param need_json: 是否需要json格式的返回, List[bool] or bool
-    :param show_progress: 是否显示进度条, bool
-    """
+) -> List[Tuple[List[Dict[str, str]], bool]]:
+    """把系统提示词和用户输入组装成请求池使用的单轮对话"""
     if isinstance(need_json, bool):
         need_json = [need_json] * len(system_prompt)
     conversations = []
@@ -179,87 +72,78 @@ def multi_conservation(
                 nj,
             )
         )
-    results = multi_process_api_conservation(
-        conversations, num_processes=max_thread_num, show_progress=show_progress
-    )
+    return conversations
+
+
+def multi_conservation(
+    system_prompt: List[str],
+    user_input: List[str],
+    need_json: List[bool] | bool = False,
+    show_progress: bool = False,
+) -> List[str]:
+    """多并行单轮对话请求
+    :param system_prompt: 系统提示词, List[str]
+    :param user_input: 用户输入, List[str],与system_prompt一一对应
+    :param need_json: 是否需要json格式的返回, List[bool] or bool
+    :param show_progress: 是否显示进度条, bool
+    """
+    conversations = build_conversations(system_prompt, user_input, need_json)
+    results = async_api_conservation(conversations, show_progress=show_progress)
     logging.info(f"{len(results)} Task Finished!")
     return results
 
 
-def worker_embedding(args):
-    texts, counter, total, lock = args
-    results = []
-    print(len(texts), "texts")
-    for text in texts:
-        try:
-            results.append(single_embedding(text))
-        except Exception as e:
-            code = getattr(e, "code", None)
-            logging.error(f"API 请求失败状态码: {code}")
-            logging.error(f"请求文本: {text}")
-            if code == 503:
-                logging.error("API 请求过多，尝试下一个模型")
-            continue
-        # 更新进度计数
-        if counter is not None:
-            with lock:
-                counter.value += 1
+def stream_conservation(
+    system_prompt: List[str],
+    user_input: List[str],
+    need_json: List[bool] | bool = False,
+    show_progress: bool = False,
+) -> Iterator[Tuple[int, str]]:
+    """与multi_conservation相同，但按完成顺序产出 (下标, 结果)"""
+    conversations = build_conversations(system_prompt, user_input, need_json)
+    return get_client_pool().iter_conversations(conversations, show_progress)
 
-    return results
+
+def astream_conservation(
+    system_prompt: List[str],
+    user_input: List[str],
+    need_json: List[bool] | bool = False,
+) -> AsyncIterator[Tuple[int, str]]:
+    """stream_conservation 的异步生成器版本"""
+    conversations = build_conversations(system_prompt, user_input, need_json)
+    return get_client_pool().astream_conversations(conversations)
 
 
-def multi_process_api_embedding(
-    texts: List[str],
-    num_processes: int = max_thread_num,
-    show_progress: bool = False,
-) -> List[List[float]]:
-    chunk_size = max(len(texts) // num_processes, 1)
-    texts_chunks = [texts[i : i + chunk_size] for i in range(0, len(texts), chunk_size)]
-
-    manager = Manager()
-    counter = manager.Value("i", 0) if show_progress else None
-    lock = manager.Lock() if show_progress else None
-    total = len(texts)
-
-    pool = Pool(processes=num_processes)
-    args = [(chunk, counter, total, lock) for chunk in texts_chunks]
-    results_async = [pool.apply_async(worker_embedding, (arg,)) for arg in args]
-
-    if show_progress:
-        with tqdm(total=total) as pbar:
-            last_val = 0
-            import time
-
-            while True:
-                current_val = counter.value
-                delta = current_val - last_val
-                if delta > 0:
-                    pbar.update(delta)
-                    last_val = current_val
-                if current_val >= total:
-                    break
-                time.sleep(1)
-    pool.close()
-    pool.join()
-
-    results1 = []
-    for r in results_async:
-        results1.extend(r.get())
-
-    result2 = []
-    for result in results1:
-        result2.extend(result)
-
-    return result2
+def flatten_texts(texts: List[str | List[str]]) -> List[str]:
+    flat_texts = []
+    for text in texts:
+        if isinstance(text, list):
+            flat_texts.extend(text)
+        else:
+            flat_texts.append(text)
+    return flat_texts
+
+
+def multi_embedding_array(
+    texts: List[str | List[str]], show_progress: bool = False
+) -> Tuple[np.ndarray, np.ndarray]:
+    """多并行文本嵌入请求，结果直接写入一个连续的float32矩阵
+    :param texts: 文本列表，元素也可以是一组文本（会被展开）
+    :param show_progress: 是否显示进度条, bool
+    返回 (矩阵[展开后的文本数, embedding_dim], 是否成功的bool掩码)，失败的行为全0
+    """
+    return get_client_pool().embedding_matrix(flatten_texts(texts), show_progress)
 
 
 def multi_embedding(
-    texts: List[str], show_progress: bool = False
-) -> List[List[float]]:
-    results = multi_process_api_embedding(
-        texts, num_processes=max_thread_num, show_progress=show_progress
-    )
-    return results
+    texts: List[str | List[str]], show_progress: bool = False
+) -> List[List[float] | None]:
+    """多并行文本嵌入请求
+    :param texts: 文本列表，元素也可以是一组文本（会被展开）
+    :param show_progress: 是否显示进度条, bool
+    返回与展开后的文本一一对应的向量，请求失败的位置为None
+    """
+    return get_client_pool().embeddings(flatten_texts(texts), show_progress)
 
 
 def single_conversation(
@@ -286,9 +170,7 @@ def single_conversation(
             need_json,
         )
     ]
-    results = multi_process_api_conservation(
-        conversations, num_processes=1, show_progress=show_progress
-    )
+    results = async_api_conservation(conversations, show_progress=show_progress)
     return results[0] if results else ""
 
 
@@ -297,8 +179,6 @@ def single_embedding(text: str) -> List[float]:
     单次文本嵌入请求
     :param text: 文本内容,str
     """
-    print("开始单次文本嵌入请求")
-    print(f"文本内容: {text}")
     conversation = {'messages': [{'content': text, 'role': 'user'}]}
     result = get_embp_embedding(conversation, APPID, APIKEY, APISecret)
     return parser_Message(result)
@@ -321,12 +201,17 @@ class multiroundConversation:
 
     def get_response(self, need_json: bool = False) -> str:
         response = (
-            self.client.chat.completions.create(
-                model=model_name,
-                messages=self.conversation,
-                stream=False,
-                temperature=0.7,
-                response_format={"type": "json_object"} if need_json else None,
+            call_with_limit(
+                get_provider_settings()[0],
+                model_name,
+                estimate_tokens(self.conversation),
+                lambda: self.client.chat.completions.create(
+                    model=model_name,
+                    messages=self.conversation,
+                    stream=False,
+                    temperature=0.7,
+                    response_format={"type": "json_object"} if need_json else None,
+                ),
             )
             .choices[0]
             .message.content
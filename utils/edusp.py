@@ -11,9 +11,11 @@ import hmac
 from urllib.parse import urlencode
 import pickle
 import json
+import logging
+import threading
 import chardet
 import numpy as np
-from config import APIKEY,APISecret,APPID
+from config import APIKEY,APISecret,APPID,embedding_url
 
 ## 本demo中调用embedding服务,对应两个方法：
 #   方法区分通过body中的domain参数值控制的
@@ -21,6 +23,14 @@ from config import APIKEY,APISecret,APPID
 #       para：将知识库内容转换为向量数组
 
 
+# 同步请求共用的连接池
+_session = requests.Session()
+# 鉴权url缓存，讯飞允许请求时间与服务器相差300秒，签名在auth_url_ttl秒内复用
+auth_url_ttl = 60
+_auth_urls = {}
+_auth_lock = threading.Lock()
+
+
 class AssembleHeaderException(Exception):
     def __init__(self, msg):
         self.message = msg
@@ -82,10 +92,19 @@ def assemble_ws_auth_url(requset_url, method="GET", api_key="", api_secret=""):
     return requset_url + "?" + urlencode(values)
 
 
-def get_Body(appid,text,style):
-    org_content = json.dumps(text).encode('utf-8')
-    print(org_content)
+def get_auth_url(requset_url, method="GET", api_key="", api_secret=""):
+    """与assemble_ws_auth_url相同，但在有效期内复用已生成的签名"""
+    key = (requset_url, method, api_key, api_secret)
+    now = time.time()
+    with _auth_lock:
+        cached = _auth_urls.get(key)
+        if cached is None or now - cached[0] > auth_url_ttl:
+            cached = (now, assemble_ws_auth_url(requset_url, method, api_key, api_secret))
+            _auth_urls[key] = cached
+    return cached[1]
+
 
+def get_Body(appid,text,style):
     body= {
     "header": {
         "app_id": appid,
@@ -113,50 +132,33 @@ def get_Body(appid,text,style):
 
 # 发起请求并返回结果
 def get_embq_embedding(text,appid,apikey,apisecret):
-    host = 'https://emb-cn-huabei-1.xf-yun.com/'
-    url = assemble_ws_auth_url(host,method='POST',api_key=apikey,api_secret=apisecret)
+    host = embedding_url
+    url = get_auth_url(host,method='POST',api_key=apikey,api_secret=apisecret)
     content = get_Body(appid,text,"query")
-    print(time.time())
-    response = requests.post(url,json=content,headers={'content-type': "application/json"}).text
-    print(time.time())
+    response = _session.post(url,json=content,headers={'content-type': "application/json"}).text
     return response
 
 
 def get_embp_embedding(text,appid,apikey,apisecret):
-    host = 'https://emb-cn-huabei-1.xf-yun.com/'
-    url = assemble_ws_auth_url(host,method='POST',api_key=apikey,api_secret=apisecret)
+    host = embedding_url
+    url = get_auth_url(host,method='POST',api_key=apikey,api_secret=apisecret)
     content = get_Body(appid,text,"para")
-    print(time.time())
-    response = requests.post(url,json=content,headers={'content-type': "application/json"}).text
-    print(time.time())
+    response = _session.post(url,json=content,headers={'content-type': "application/json"}).text
     return response
 
+def decode_feature(text_base):
+    """把base64编码的小端float32向量解码为numpy数组（只读，不复制）"""
+    return np.frombuffer(base64.b64decode(text_base), dtype="<f4")
+
+
 # 解析结果并输出
 def parser_Message(message):
     data = json.loads(message)
-    # print("data" + str(message))
     code = data['header']['code']
     if code != 0:
-        print(f'请求错误: {code}, {data}')
+        logging.error(f'请求错误: {code}, {data}')
     else:
-        sid = data['header']['sid']
-        # print("本次会话的id为：" + sid)
-        text_base = data["payload"]["feature"]["text"]
-        # 使用base64.b64decode()函数将text_base解码为字节串text_data
-        text_data = base64.b64decode(text_base)
-        # 创建一个np.float32类型的数据类型对象dt，表示32位浮点数。
-        dt = np.dtype(np.float32)
-        # 使用newbyteorder()方法将dt的字节序设置为小端（"<"）
-        dt = dt.newbyteorder("<")
-        # 使用np.frombuffer()函数将text_data转换为浮点数数组text，数据类型为dt。
-        text = np.frombuffer(text_data, dtype=dt)
-
-        # # 打印向量维度
-        # print(len(text))
-
-        # print("返回的向量化数组为:")
-        # print(text)
-        return text
+        return decode_feature(data["payload"]["feature"]["text"])
 
 
 if __name__ == '__main__':
@@ -0,0 +1,218 @@
+"""知识图谱的二进制快照
+
+KG 构建结束时由 all_node.json / all_relations.json 生成 graph/snapshot.npz，出题端直接读取：
+- 节点按标题去重（与 networkx 图中的节点一致），标题和描述存为 UTF-8 字符串表（字节 + 偏移量）
+- 边按源节点排序存为 CSR 数组（indptr/indices），同一源节点的边保持原来的顺序
+- 边的简短类型取值很少，存为类型表下标；完整类型（类型 + 描述）存为字符串表
+- 记录两个 JSON 文件的 (mtime, size)，JSON 被改写后快照失效
+
+读取时只映射数组，需要 networkx 图时再一次性批量构建。
+"""
+
+import json
+import logging
+import os
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+SNAPSHOT_NAME = "snapshot.npz"
+NODE_FILE = "all_node.json"
+EDGE_FILE = "all_relations.json"
+
+
+class StringTable:
+    """UTF-8 字节串 + 偏移量表示的字符串数组，按需解码"""
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings: list[str]) -> "StringTable":
+        encoded = [s.encode("utf-8") for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(data, offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self.data[self.offsets[i] : self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    def tolist(self) -> list[str]:
+        blob, bounds = self.data.tobytes(), self.offsets.tolist()
+        return [blob[bounds[i] : bounds[i + 1]].decode("utf-8") for i in range(len(self))]
+
+
+def _source_version(graph_dir: str) -> np.ndarray:
+    version = []
+    for name in (NODE_FILE, EDGE_FILE):
+        stat = os.stat(os.path.join(graph_dir, name))
+        version += [stat.st_mtime_ns, stat.st_size]
+    return np.array(version, dtype=np.int64)
+
+
+class GraphSnapshot:
+    """只读的图快照，提供出题端需要的查询，networkx 图按需构建"""
+
+    def __init__(self, arrays: dict):
+        self.titles = StringTable(arrays["title_data"], arrays["title_offsets"])
+        self.descriptions = StringTable(arrays["desc_data"], arrays["desc_offsets"])
+        self.indptr = arrays["indptr"]
+        self.indices = arrays["indices"]
+        self.short_types = StringTable(arrays["short_data"], arrays["short_offsets"])
+        self.edge_short = arrays["edge_short"]
+        self.edge_types = StringTable(arrays["type_data"], arrays["type_offsets"])
+        self.weights = arrays["weights"]
+        self._title_list: list[str] | None = None
+        self._index: dict[str, int] | None = None
+
+    @classmethod
+    def from_records(cls, nodes: list[dict], edges: list[dict]) -> "GraphSnapshot":
+        """与原来逐条 add_node/add_edge 构建的图保持相同的语义"""
+        id_to_title, title_index, descriptions = {}, {}, []
+        for node in nodes:
+            title = node["title"]
+            id_to_title[node["id"]] = title
+            description = node["summary"] if "summary" in node else node["descriptions"][-1]
+            if title in title_index:
+                descriptions[title_index[title]] = description
+            else:
+                title_index[title] = len(descriptions)
+                descriptions.append(description)
+        sources, targets, short, types, weights = [], [], [], [], []
+        short_index = {}
+        for edge in edges:
+            sources.append(title_index[id_to_title[edge["source_id"]]])
+            targets.append(title_index[id_to_title[edge["target_id"]]])
+            edge_type = "关联" if "has" in edge["type"] else edge["type"]
+            short.append(short_index.setdefault(edge_type, len(short_index)))
+            types.append(
+                edge_type + edge["descriptions"][-1] if edge.get("descriptions") else edge_type
+            )
+            weights.append(float(edge.get("weight", 1.0)))
+        sources = np.array(sources, dtype=np.int64)
+        order = np.argsort(sources, kind="stable")
+        indptr = np.zeros(len(title_index) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(title_index)), out=indptr[1:])
+        arrays = {"indptr": indptr}
+        arrays["indices"] = np.array(targets, dtype=np.int64)[order]
+        arrays["edge_short"] = np.array(short, dtype=np.int32)[order]
+        arrays["weights"] = np.array(weights, dtype=np.float64)[order]
+        for prefix, strings in [
+            ("title", list(title_index)),
+            ("desc", descriptions),
+            ("short", list(short_index)),
+            ("type", [types[i] for i in order.tolist()]),
+        ]:
+            table = StringTable.from_strings(strings)
+            arrays[f"{prefix}_data"] = table.data
+            arrays[f"{prefix}_offsets"] = table.offsets
+        return cls(arrays)
+
+    def arrays(self) -> dict:
+        arrays = {
+            "indptr": self.indptr,
+            "indices": self.indices,
+            "edge_short": self.edge_short,
+            "weights": self.weights,
+        }
+        for prefix, table in [
+            ("title", self.titles),
+            ("desc", self.descriptions),
+            ("short", self.short_types),
+            ("type", self.edge_types),
+        ]:
+            arrays[f"{prefix}_data"] = table.data
+            arrays[f"{prefix}_offsets"] = table.offsets
+        return arrays
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def concepts(self) -> list[str]:
+        if self._title_list is None:
+            self._title_list = self.titles.tolist()
+        return self._title_list
+
+    def index_of(self, title: str) -> int | None:
+        if self._index is None:
+            self._index = {title: i for i, title in enumerate(self.concepts())}
+        return self._index.get(title)
+
+    def description(self, title: str) -> str | None:
+        i = self.index_of(title)
+        return None if i is None else self.descriptions[i]
+
+    def neighbors(self, title: str) -> list[str]:
+        """出边指向的节点，顺序与 networkx 中相同（重复的边只保留一次）"""
+        i = self.index_of(title)
+        if i is None:
+            return []
+        concepts = self.concepts()
+        targets = self.indices[self.indptr[i] : self.indptr[i + 1]].tolist()
+        return list(dict.fromkeys(concepts[t] for t in targets))
+
+    def to_networkx(self):
+        import networkx as nx
+
+        concepts = self.concepts()
+        graph = nx.DiGraph()
+        graph.add_nodes_from(
+            (title, {"description": description})
+            for title, description in zip(concepts, self.descriptions.tolist())
+        )
+        short_types = self.short_types.tolist()
+        sources = np.repeat(np.arange(len(concepts)), np.diff(self.indptr)).tolist()
+        graph.add_edges_from(
+            (concepts[s], concepts[t], {"short": short_types[k], "type": rel_type, "weight": w})
+            for s, t, k, rel_type, w in zip(
+                sources,
+                self.indices.tolist(),
+                self.edge_short.tolist(),
+                self.edge_types.tolist(),
+                self.weights.tolist(),
+            )
+        )
+        return graph
+
+
+def write_snapshot(graph_dir: str) -> GraphSnapshot:
+    """由 graph_dir 下的 JSON 文件生成快照并保存（先写临时文件再替换）"""
+    version = _source_version(graph_dir)
+    with open(os.path.join(graph_dir, NODE_FILE), "r", encoding="utf-8") as f:
+        nodes = json.load(f)
+    with open(os.path.join(graph_dir, EDGE_FILE), "r", encoding="utf-8") as f:
+        edges = json.load(f)
+    snapshot = GraphSnapshot.from_records(nodes, edges)
+    path = os.path.join(graph_dir, SNAPSHOT_NAME)
+    tmp = f"{path}.tmp{os.getpid()}.npz"
+    try:
+        np.savez(tmp, version=version, **snapshot.arrays())
+        os.replace(tmp, path)
+    except OSError as e:
+        log.warning(f"failed to save graph snapshot {path}: {e}")
+    return snapshot
+
+
+def load_snapshot(graph_dir: str) -> GraphSnapshot | None:
+    """读取与 JSON 文件一致的快照，不存在或已过期时返回 None"""
+    path = os.path.join(graph_dir, SNAPSHOT_NAME)
+    try:
+        with np.load(path) as npz:
+            if not np.array_equal(npz["version"], _source_version(graph_dir)):
+                return None
+            return GraphSnapshot({name: npz[name] for name in npz.files})
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def load_or_build_snapshot(graph_dir: str) -> GraphSnapshot:
+    snapshot = load_snapshot(graph_dir)
+    if snapshot is None:
+        snapshot = write_snapshot(graph_dir)
+    return snapshot
@@ -0,0 +1,417 @@
+"""基于 asyncio 的大模型请求池
+
+所有请求都在同一个进程内的后台事件循环中执行：
+- HTTP 连接（httpx.AsyncClient）在多次调用之间复用，不再每次 fork 进程、重建客户端
+- 对话请求按(服务商, 模型)限流并自适应调整并发（见 utils/rate_limit.py），
+  嵌入请求有独立的并发上限
+- 嵌入结果直接解码进一个连续的 float32 矩阵；OpenAI 兼容接口一次请求多条文本
+- 同步代码通过 ``ClientPool.run`` 提交协程并阻塞等待结果
+- 批量对话按系统提示词分组、按前缀排序后发送（见 utils/prefix_schedule.py）
+
+通过环境变量 ``model_base_url`` / ``embedding_url`` 可以把请求指向本地的
+mock 服务（见 utils/mock_server.py），用于离线压测。
+"""
+
+import asyncio
+import atexit
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+import numpy as np
+from openai import AsyncOpenAI, APIConnectionError, APITimeoutError
+from tqdm import tqdm
+
+from config import (
+    model_name,
+    max_thread_num,
+    max_embedding_concurrency,
+    throttle_retries,
+    prefix_scheduling,
+    prompt_cache_min_prefix,
+    extra_models,
+    json_feature,
+    qa_temp,
+    model_base_url,
+    embedding_url,
+    embedding_provider,
+    embedding_model,
+    embedding_batch_size,
+    embedding_dim,
+    APISecret,
+    APIKEY,
+    APPID,
+)
+from utils.edusp import decode_feature, get_auth_url, get_Body, parser_Message
+from utils.prefix_schedule import estimate_prefix_savings, plan_prefix_order
+from utils.rate_limit import (
+    backoff_delay,
+    estimate_tokens,
+    get_limiter,
+    is_throttle_error,
+)
+
+provider_base_urls = {
+    "spark": "https://spark-api-open.xf-yun.com/v1/",
+    "silicon": "https://api.siliconflow.cn/v1",
+    "openai": "https://api.openai.com/v1",
+}
+
+
+def get_provider_settings() -> Tuple[str, Optional[str], str]:
+    """返回 (provider, base_url, api_key)。chatglm 使用 ZhipuAI SDK，base_url 为 None"""
+    from config import silicon_api_key, glm_api_key, model_provider, spark_api_key
+
+    if model_provider == "chatglm":
+        return model_provider, model_base_url or None, glm_api_key
+    api_key = spark_api_key if model_provider == "spark" else silicon_api_key
+    return (
+        model_provider,
+        model_base_url or provider_base_urls.get(model_provider),
+        api_key,
+    )
+
+
+Conversation = Tuple[List[Dict[str, str]], bool]
+
+
+class ClientPool:
+    """进程内共享的异步请求池"""
+
+    def __init__(
+        self,
+        max_concurrency: int = max_thread_num,
+        max_embedding_concurrency: int = max_embedding_concurrency,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_embedding_concurrency = max_embedding_concurrency
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._loop = None
+        self._thread = None
+        self._http = None
+        self._client = None
+        self._provider = None
+        self._embedding_semaphore = None
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            # fork 出来的子进程不能复用父进程的事件循环线程
+            if self._pid != os.getpid():
+                self._reset()
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name="llm-pool", daemon=True
+                )
+                self._thread.start()
+        return self._loop
+
+    def run(self, coro):
+        """在后台事件循环中执行协程，阻塞直到返回"""
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    def _setup(self):
+        """在事件循环内部惰性创建连接池、客户端与信号量"""
+        if self._http is not None:
+            return
+        size = max(self.max_concurrency, self.max_embedding_concurrency)
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=size, max_keepalive_connections=size),
+            timeout=httpx.Timeout(120.0),
+        )
+        provider, base_url, api_key = get_provider_settings()
+        self._provider = provider
+        if provider == "chatglm":
+            from zhipuai import ZhipuAI
+
+            self._client = ZhipuAI(api_key=api_key, base_url=base_url, max_retries=0)
+        elif base_url is not None:
+            # 重试交给限流器处理，才能根据429/503调整并发
+            self._client = AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=self._http,
+                max_retries=0,
+            )
+        self._embedding_semaphore = asyncio.Semaphore(self.max_embedding_concurrency)
+
+    async def _create_completion(self, **kwargs):
+        if isinstance(self._client, AsyncOpenAI):
+            return await self._client.chat.completions.create(**kwargs)
+        # ZhipuAI 只有同步接口，放到线程池中执行
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, lambda: self._client.chat.completions.create(**kwargs)
+        )
+
+    async def chat(self, conversation: List[Dict[str, str]], need_json: bool) -> str:
+        self._setup()
+        tokens = estimate_tokens(conversation)
+        for model in [model_name] + extra_models:
+            limiter = get_limiter(self._provider, model)
+            kwargs = dict(
+                model=model,
+                messages=conversation,
+                stream=False,
+                temperature=qa_temp,
+            )
+            if need_json and json_feature.get(model, False):
+                kwargs["response_format"] = {"type": "json_object"}
+            for attempt in range(throttle_retries + 1):
+                try:
+                    async with limiter.slot(tokens):
+                        start = time.monotonic()
+                        result = await self._create_completion(**kwargs)
+                        limiter.on_success(time.monotonic() - start)
+                    return result.choices[0].message.content
+                except Exception as e:
+                    # 这里防止没有 code 属性报错
+                    code = getattr(e, "code", None) or getattr(e, "status_code", None)
+                    logging.error(f"API 请求失败状态码: {code}")
+                    logging.error(f"Error: {e}")
+                    throttled = is_throttle_error(e)
+                    if throttled:
+                        limiter.on_throttle()
+                    if attempt < throttle_retries and (
+                        throttled or isinstance(e, (APIConnectionError, APITimeoutError))
+                    ):
+                        # 限流或网络抖动时退避后重试同一个模型，避免降级
+                        await asyncio.sleep(backoff_delay(attempt))
+                        continue
+                    break
+            logging.error(f"模型 {model} 请求失败，尝试下一个模型")
+        logging.error("所有模型都请求失败")
+        return ""
+
+    async def _chat_after(
+        self,
+        conversation: List[Dict[str, str]],
+        need_json: bool,
+        ready: Optional[asyncio.Event],
+        done: Optional[asyncio.Event],
+    ) -> str:
+        """等待同组的领头请求完成后再发送，领头请求完成时设置done"""
+        if ready is not None:
+            await ready.wait()
+        try:
+            return await self.chat(conversation, need_json)
+        finally:
+            if done is not None:
+                done.set()
+
+    def _schedule(self, conversations: List[Conversation]) -> List[Tuple[int, object]]:
+        """返回按发送顺序排列的 (原始下标, 协程)"""
+        if not prefix_scheduling or len(conversations) < 2:
+            return [
+                (i, self.chat(conv, need_json))
+                for i, (conv, need_json) in enumerate(conversations)
+            ]
+        order, leader_of = plan_prefix_order(conversations)
+        saving = estimate_prefix_savings(conversations, order, prompt_cache_min_prefix)
+        baseline = estimate_prefix_savings(
+            conversations, list(range(len(conversations))), prompt_cache_min_prefix
+        )
+        logging.info(
+            f"prefix cache: 预计可复用 {saving['reused_chars']}/{saving['total_chars']} 字符"
+            f" ({saving['ratio']:.1%})，原始顺序 {baseline['ratio']:.1%}"
+        )
+        events = {leader: asyncio.Event() for leader in set(leader_of.values())}
+        scheduled = []
+        for i in order:
+            conv, need_json = conversations[i]
+            ready = events[leader_of[i]] if i in leader_of else None
+            scheduled.append((i, self._chat_after(conv, need_json, ready, events.get(i))))
+        return scheduled
+
+    async def embed(self, text: str) -> Optional[np.ndarray]:
+        """讯飞接口，一次请求只能嵌入一条文本"""
+        self._setup()
+        url = get_auth_url(
+            embedding_url, method="POST", api_key=APIKEY, api_secret=APISecret
+        )
+        body = get_Body(APPID, {"messages": [{"content": text, "role": "user"}]}, "para")
+        try:
+            async with self._embedding_semaphore:
+                response = await self._http.post(url, json=body)
+            return parser_Message(response.text)
+        except Exception as e:
+            code = getattr(e, "code", None)
+            logging.error(f"API 请求失败状态码: {code}")
+            logging.error(f"请求文本: {text}")
+            return None
+
+    async def embed_batch(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """OpenAI 兼容的 /embeddings 接口，一次请求嵌入多条文本"""
+        self._setup()
+        try:
+            async with self._embedding_semaphore:
+                if isinstance(self._client, AsyncOpenAI):
+                    # base64 格式可以直接解码为 float32，省去解析浮点数列表
+                    response = await self._client.embeddings.create(
+                        model=embedding_model, input=texts, encoding_format="base64"
+                    )
+                else:
+                    loop = asyncio.get_running_loop()
+                    response = await loop.run_in_executor(
+                        None,
+                        lambda: self._client.embeddings.create(
+                            model=embedding_model, input=texts
+                        ),
+                    )
+        except Exception as e:
+            code = getattr(e, "code", None) or getattr(e, "status_code", None)
+            logging.error(f"API 请求失败状态码: {code}")
+            logging.error(f"Error: {e}")
+            return [None] * len(texts)
+        vectors = [None] * len(texts)
+        for item in response.data:
+            embedding = item.embedding
+            if isinstance(embedding, str):
+                vectors[item.index] = decode_feature(embedding)
+            else:
+                vectors[item.index] = np.asarray(embedding, dtype=np.float32)
+        return vectors
+
+    @staticmethod
+    async def _gather(coros: list, show_progress: bool) -> list:
+        if not show_progress:
+            return await asyncio.gather(*coros)
+        pbar = tqdm(total=len(coros))
+
+        async def track(coro):
+            try:
+                return await coro
+            finally:
+                pbar.update(1)
+
+        try:
+            return await asyncio.gather(*[track(coro) for coro in coros])
+        finally:
+            pbar.close()
+
+    def conversations(
+        self, conversations: List[Conversation], show_progress: bool = False
+    ) -> List[str]:
+        """并发执行单轮对话，结果顺序与输入一致"""
+        scheduled = self._schedule(conversations)
+        responses = self.run(
+            self._gather([coro for _, coro in scheduled], show_progress)
+        )
+        results = [""] * len(conversations)
+        for (i, _), response in zip(scheduled, responses):
+            results[i] = response
+        return results
+
+    def _submit(
+        self, conversations: List[Conversation]
+    ) -> List[concurrent.futures.Future]:
+        """按调度顺序提交，返回与输入一一对应的future"""
+        loop = self._ensure_loop()
+        futures = [None] * len(conversations)
+        for i, coro in self._schedule(conversations):
+            futures[i] = asyncio.run_coroutine_threadsafe(coro, loop)
+        return futures
+
+    def iter_conversations(
+        self, conversations: List[Conversation], show_progress: bool = False
+    ) -> Iterator[Tuple[int, str]]:
+        """按完成顺序产出 (下标, 结果)，调用方不必等整批结束"""
+        futures = {future: i for i, future in enumerate(self._submit(conversations))}
+        pbar = tqdm(total=len(futures), disable=not show_progress)
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                pbar.update(1)
+                yield futures[future], future.result()
+        finally:
+            # 调用方提前退出时取消还没开始的请求
+            for future in futures:
+                future.cancel()
+            pbar.close()
+
+    async def astream_conversations(
+        self, conversations: List[Conversation]
+    ) -> AsyncIterator[Tuple[int, str]]:
+        """iter_conversations 的异步版本，可以在调用方自己的事件循环中使用"""
+        futures = [asyncio.wrap_future(future) for future in self._submit(conversations)]
+
+        async def indexed(i, future):
+            return i, await future
+
+        try:
+            for next_done in asyncio.as_completed(
+                [indexed(i, future) for i, future in enumerate(futures)]
+            ):
+                yield await next_done
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def embedding_matrix(
+        self, texts: List[str], show_progress: bool = False
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        并发执行文本嵌入，返回 (float32矩阵[len(texts), embedding_dim], 是否成功的掩码)。
+        失败的行为全0
+        """
+        if embedding_provider == "xfyun":
+            coros = [self.embed(text) for text in texts]
+        else:
+            coros = [
+                self.embed_batch(texts[i : i + embedding_batch_size])
+                for i in range(0, len(texts), embedding_batch_size)
+            ]
+        results = self.run(self._gather(coros, show_progress))
+        if embedding_provider != "xfyun":
+            results = [vector for batch in results for vector in batch]
+        matrix = np.zeros((len(texts), embedding_dim), dtype=np.float32)
+        ok = np.zeros(len(texts), dtype=bool)
+        for i, vector in enumerate(results):
+            if vector is None:
+                continue
+            if vector.shape != (embedding_dim,):
+                logging.error(f"向量维度 {vector.shape} 与 embedding_dim={embedding_dim} 不一致")
+                continue
+            matrix[i] = vector
+            ok[i] = True
+        return matrix, ok
+
+    def embeddings(
+        self, texts: List[str], show_progress: bool = False
+    ) -> List[Optional[List[float]]]:
+        """并发执行文本嵌入，失败的位置为 None"""
+        matrix, ok = self.embedding_matrix(texts, show_progress)
+        return [row.tolist() if good else None for row, good in zip(matrix, ok)]
+
+    async def _aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+
+    def close(self):
+        if self._loop is None or self._pid != os.getpid():
+            return
+        try:
+            self.run(self._aclose())
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._reset()
+
+
+_default_pool: Optional[ClientPool] = None
+
+
+def get_client_pool() -> ClientPool:
+    """返回进程内共享的请求池"""
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = ClientPool()
+        atexit.register(_default_pool.close)
+    return _default_pool
@@ -0,0 +1,278 @@
+"""本地 mock 大模型服务
+
+提供与 OpenAI 兼容的 ``/v1/chat/completions``、``/v1/embeddings`` 接口，
+批处理接口（``/files``、``/batches``，OpenAI 与智谱的格式相同），
+以及讯飞 embedding 接口（POST ``/``）的最小实现，用于离线调试和压测。
+
+压测用法（在项目根目录执行）：
+    python -m utils.mock_server --requests 2000 --latency 0.05
+
+``--throttle 0.1`` 让10%的对话请求返回429，用于观察限流器的自适应并发。
+"""
+
+import argparse
+import base64
+import hashlib
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+EMBEDDING_DIM = 2048
+
+
+def mock_vector(text: str, dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """根据文本内容生成确定性的向量"""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:4], "little")
+    return np.random.default_rng(seed).standard_normal(dim).astype("<f4")
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # 支持 keep-alive，便于观察连接复用
+    latency = 0.0
+    throttle = 0.0
+    # 批处理接口的内存存储，所有 mock 服务共享
+    files: dict = {}
+    batches: dict = {}
+    ids = itertools.count()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length)
+
+    def _send_bytes(self, payload: bytes, content_type: str, status: int = 200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_json(self, data: dict, status: int = 200):
+        payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self._send_bytes(payload, "application/json", status)
+
+    def do_GET(self):
+        path = self.path.split("?")[0].rstrip("/")
+        parts = path.split("/")
+        if "batches" in parts[:-1]:
+            batch = self.batches.get(parts[-1])
+            if batch is None:
+                self._send_json({"error": {"message": "batch not found"}}, 404)
+                return
+            self._send_json(self.advance_batch(batch))
+        elif path.endswith("/content") and parts[-2] in self.files:
+            self._send_bytes(self.files[parts[-2]], "application/octet-stream")
+        else:
+            self._send_json({"error": {"message": f"unknown path {path}"}}, 404)
+
+    def do_POST(self):
+        raw = self._read_body()
+        path = self.path.split("?")[0]
+        if path.endswith("/files"):
+            self._send_json(self.upload_file(raw))
+            return
+        body = json.loads(raw or b"{}")
+        if path.endswith("/batches"):
+            self._send_json(self.create_batch(body))
+            return
+        if self.latency:
+            time.sleep(self.latency)
+        if path.endswith("/chat/completions"):
+            if random.random() < self.throttle:
+                self._send_json({"error": {"message": "rate limited"}}, 429)
+                return
+            self._send_json(self.chat_completion(body))
+        elif path.endswith("/embeddings"):
+            self._send_json(self.embeddings(body))
+        elif path == "/":
+            self._send_json(self.xf_embedding(body))
+        else:
+            self._send_json({"error": {"message": f"unknown path {path}"}}, 404)
+
+    def upload_file(self, raw: bytes) -> dict:
+        header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode()
+        message = BytesParser(policy=HTTP).parsebytes(header + raw)
+        content, filename = b"", "upload.jsonl"
+        for part in message.iter_parts():
+            if part.get_param("name", header="content-disposition") == "file":
+                content = part.get_payload(decode=True)
+                filename = part.get_filename() or filename
+        file_id = f"file-{next(self.ids)}"
+        self.files[file_id] = content
+        return {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": "batch",
+            "status": "processed",
+        }
+
+    def create_batch(self, body: dict) -> dict:
+        batch_id = f"batch-{next(self.ids)}"
+        self.batches[batch_id] = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": body.get("endpoint"),
+            "input_file_id": body["input_file_id"],
+            "completion_window": body.get("completion_window") or "24h",
+            "status": "validating",
+            "created_at": int(time.time()),
+            "output_file_id": None,
+            "error_file_id": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        return self.batches[batch_id]
+
+    def advance_batch(self, batch: dict) -> dict:
+        """每查询一次推进一步：validating -> in_progress -> completed"""
+        if batch["status"] == "validating":
+            batch["status"] = "in_progress"
+        elif batch["status"] == "in_progress":
+            lines, completed, failed = [], 0, 0
+            for line in self.files[batch["input_file_id"]].decode("utf-8").splitlines():
+                if line.strip() == "":
+                    continue
+                request = json.loads(line)
+                # throttle 同样作为批处理中单个请求失败的概率
+                if random.random() < self.throttle:
+                    response = {"status_code": 500, "body": {"error": "mock failure"}}
+                    failed += 1
+                else:
+                    response = {"status_code": 200, "body": self.chat_completion(request["body"])}
+                    completed += 1
+                lines.append(
+                    json.dumps(
+                        {"custom_id": request["custom_id"], "response": response},
+                        ensure_ascii=False,
+                    )
+                )
+            output_id = f"file-{next(self.ids)}"
+            self.files[output_id] = ("\n".join(lines) + "\n").encode("utf-8")
+            batch.update(
+                status="completed",
+                output_file_id=output_id,
+                request_counts={"total": completed + failed, "completed": completed, "failed": failed},
+            )
+        return batch
+
+    @staticmethod
+    def chat_completion(body: dict) -> dict:
+        user = body["messages"][-1]["content"]
+        if body.get("response_format", {}).get("type") == "json_object":
+            content = json.dumps({"echo": user[:32]}, ensure_ascii=False)
+        else:
+            content = f"mock response for: {user[:32]}"
+        return {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    @staticmethod
+    def embeddings(body: dict) -> dict:
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        if body.get("encoding_format") == "base64":
+            encode = lambda text: base64.b64encode(mock_vector(text).tobytes()).decode()
+        else:
+            encode = lambda text: mock_vector(text).tolist()
+        return {
+            "object": "list",
+            "model": body.get("model", "mock"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": encode(text)}
+                for i, text in enumerate(inputs)
+            ],
+        }
+
+    @staticmethod
+    def xf_embedding(body: dict) -> dict:
+        text = base64.b64decode(body["payload"]["messages"]["text"]).decode("utf-8")
+        vector = mock_vector(text)
+        return {
+            "header": {"code": 0, "message": "success", "sid": "mock"},
+            "payload": {
+                "feature": {"text": base64.b64encode(vector.tobytes()).decode()}
+            },
+        }
+
+
+def serve(
+    host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, throttle: float = 0.0
+):
+    """在后台线程启动 mock 服务，返回 server，``server.server_port`` 为实际端口"""
+    handler = type(
+        "Handler", (MockHandler,), {"latency": latency, "throttle": throttle}
+    )
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def benchmark(num_requests: int, latency: float, throttle: float = 0.0):
+    server = serve(latency=latency, throttle=throttle)
+    base = f"http://127.0.0.1:{server.server_port}"
+    # 必须在导入 config 之前设置
+    os.environ["model_base_url"] = base + "/v1"
+    os.environ["embedding_url"] = base + "/"
+    for key in ["spark_api_key", "silicon_api_key"]:
+        os.environ[key] = os.environ.get(key) or "mock"
+    from utils.api import multi_conservation, multi_embedding_array
+
+    prompts = ["你是一个助手"] * num_requests
+    inputs = [f"第{i}个请求" for i in range(num_requests)]
+    start = time.time()
+    results = multi_conservation(prompts, inputs, need_json=False)
+    cost = time.time() - start
+    print(f"chat: {len(results)} requests in {cost:.2f}s, {len(results)/cost:.1f} req/s")
+    failed = sum(1 for res in results if res == "")
+    from config import model_name
+    from utils.llm_pool import get_provider_settings
+    from utils.rate_limit import get_limiter
+
+    stats = get_limiter(get_provider_settings()[0], model_name).stats()
+    print(f"chat: {failed} failed, limiter {stats}")
+
+    texts = inputs[: max(num_requests // 10, 1)]
+    start = time.time()
+    vectors, ok = multi_embedding_array(texts)
+    cost = time.time() - start
+    print(f"embedding: {int(ok.sum())}/{len(texts)} texts in {cost:.2f}s, {len(texts)/cost:.1f} texts/s")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible server")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--throttle", type=float, default=0.0, help="返回429的概率")
+    parser.add_argument("--serve", action="store_true", help="只启动服务，不压测")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    if args.serve:
+        server = serve(port=args.port, latency=args.latency, throttle=args.throttle)
+        print(f"mock server listening on http://127.0.0.1:{server.server_port}")
+        threading.Event().wait()
+    else:
+        benchmark(args.requests, args.latency, args.throttle)
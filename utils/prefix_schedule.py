@@ -0,0 +1,68 @@
+"""按提示词前缀安排请求顺序，提高服务商 prompt cache（KV cache）的命中率
+
+同一个算子的请求共用很长的系统提示词（如 community_report_2.txt），只有用户输入不同。
+服务商按请求的公共前缀缓存 KV，因此：
+- 系统提示词相同的请求放在一起，组内按用户输入排序，使相邻请求的公共前缀最长
+- 每组先发出一个“领头”请求，它完成（前缀已被缓存）后再并发发出组内其余请求
+
+节省量按相邻请求的最长公共前缀估算，只统计不短于 min_prefix 个字符的前缀，
+中文大约一个字一个token。
+"""
+
+import os
+from typing import Dict, List, Tuple
+
+Conversation = Tuple[List[Dict[str, str]], bool]
+
+
+def prompt_text(conversation: Conversation) -> str:
+    messages, _ = conversation
+    return "\n".join(message.get("content") or "" for message in messages)
+
+
+def system_prompt_of(conversation: Conversation) -> str:
+    messages, _ = conversation
+    # 只有一条消息时没有单独的系统提示词，都归为一组
+    return (messages[0].get("content") or "") if len(messages) > 1 else ""
+
+
+def plan_prefix_order(
+    conversations: List[Conversation],
+) -> Tuple[List[int], Dict[int, int]]:
+    """
+    返回 (发送顺序, 非领头请求 -> 所在组领头请求的下标)。
+    组按首次出现的顺序排列；单个请求的组没有领头关系。
+    """
+    groups: Dict[Tuple[str, bool], List[int]] = {}
+    for i, conversation in enumerate(conversations):
+        key = (system_prompt_of(conversation), conversation[1])
+        groups.setdefault(key, []).append(i)
+    order, leader_of = [], {}
+    for members in groups.values():
+        members.sort(key=lambda i: prompt_text(conversations[i]))
+        order.extend(members)
+        for i in members[1:]:
+            leader_of[i] = members[0]
+    return order, leader_of
+
+
+def common_prefix_length(a: str, b: str) -> int:
+    return len(os.path.commonprefix([a, b]))
+
+
+def estimate_prefix_savings(
+    conversations: List[Conversation], order: List[int], min_prefix: int = 1024
+) -> dict:
+    """估计按order发送时可被缓存复用的前缀字符数"""
+    texts = [prompt_text(conversation) for conversation in conversations]
+    total = sum(len(text) for text in texts)
+    reused = 0
+    for previous, current in zip(order, order[1:]):
+        prefix = common_prefix_length(texts[previous], texts[current])
+        if prefix >= min_prefix:
+            reused += prefix
+    return {
+        "total_chars": total,
+        "reused_chars": reused,
+        "ratio": reused / total if total else 0.0,
+    }
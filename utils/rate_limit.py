@@ -0,0 +1,199 @@
+"""按服务商/模型限流
+
+- TokenBucket: 令牌桶，分别限制每分钟请求数(rpm)和每分钟token数(tpm)
+- ModelLimiter: 令牌桶 + AIMD自适应并发。收到429/503时并发减半，延迟明显升高时
+  小幅下调，连续成功时并发逐步加一，上限为 max_thread_num
+
+异步请求池通过 ``async with limiter.slot(tokens)`` 使用；同步调用方
+（get_default_client_sync 的使用者）通过 ``call_with_limit`` 接入同一个限流器。
+"""
+
+import asyncio
+import contextlib
+import os
+import random
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from config import max_thread_num, rate_limits, default_rate_limit, throttle_retries
+
+THROTTLE_CODES = {429, 503}
+
+
+def estimate_tokens(messages: List[Dict[str, str]]) -> int:
+    """粗略估计请求的token数，中文大约一个字一个token"""
+    return sum(len(message.get("content") or "") for message in messages)
+
+
+def is_throttle_error(e: Exception) -> bool:
+    code = getattr(e, "status_code", None) or getattr(e, "code", None)
+    try:
+        return int(code) in THROTTLE_CODES
+    except (TypeError, ValueError):
+        return False
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 30.0) -> float:
+    """带抖动的指数退避"""
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+class TokenBucket:
+    def __init__(self, per_minute: Optional[float]):
+        """per_minute为None表示不限制"""
+        self.per_minute = per_minute
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, amount: float) -> float:
+        """预留amount个令牌，返回需要等待的秒数"""
+        if self.per_minute is None:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            rate = self.per_minute / 60.0
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * rate)
+            self.updated = now
+            # 单个请求超过桶容量时按容量计，避免永远等待
+            self.tokens -= min(amount, self.capacity)
+            return 0.0 if self.tokens >= 0 else -self.tokens / rate
+
+    def acquire_sync(self, amount: float = 1):
+        wait = self._reserve(amount)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire(self, amount: float = 1):
+        wait = self._reserve(amount)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class ModelLimiter:
+    """单个(服务商, 模型)的限流器"""
+
+    def __init__(
+        self,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        max_concurrency: int = max_thread_num,
+        min_concurrency: int = 1,
+    ):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.successes = 0
+        self.throttled = 0
+        self.base_latency: Optional[float] = None
+        self.last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._condition: Optional[asyncio.Condition] = None
+
+    # ---------- AIMD ----------
+    def _decrease(self, factor: float):
+        now = time.monotonic()
+        # 同一批并发请求同时失败时只减一次
+        if now - self.last_decrease < 1.0:
+            return
+        self.last_decrease = now
+        self.limit = max(self.min_concurrency, self.limit * factor)
+
+    def on_success(self, latency: float):
+        with self._lock:
+            self.successes += 1
+            if self.base_latency is None or latency < self.base_latency:
+                self.base_latency = latency
+            if latency > 3 * self.base_latency and latency > 5.0:
+                # 延迟明显升高，视为拥塞
+                self._decrease(0.9)
+            else:
+                # 每个窗口（约limit个成功请求）加一
+                self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+
+    def on_throttle(self):
+        with self._lock:
+            self.throttled += 1
+            self._decrease(0.5)
+
+    # ---------- 同步接口 ----------
+    def acquire_sync(self, tokens: int = 0):
+        """同步调用方在请求前调用，只做速率限制"""
+        self.requests.acquire_sync(1)
+        if tokens:
+            self.tokens.acquire_sync(tokens)
+
+    # ---------- 异步接口 ----------
+    @contextlib.asynccontextmanager
+    async def slot(self, tokens: int = 0):
+        """获取一个并发位置并完成速率限制"""
+        # 只在请求池的事件循环中使用；并发上限提高后由释放时的notify_all唤醒等待者
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        try:
+            await self.requests.acquire(1)
+            if tokens:
+                await self.tokens.acquire(tokens)
+            yield
+        finally:
+            async with self._condition:
+                self.in_flight -= 1
+                self._condition.notify_all()
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "successes": self.successes,
+            "throttled": self.throttled,
+        }
+
+
+_limiters: Dict[Tuple[str, str], ModelLimiter] = {}
+_registry_lock = threading.Lock()
+_registry_pid = os.getpid()
+
+
+def get_limiter(provider: str, model: str) -> ModelLimiter:
+    """返回(provider, model)对应的限流器，配置见config.rate_limits"""
+    global _registry_pid
+    key = (provider, model)
+    with _registry_lock:
+        # 子进程中的事件循环不同，不能复用父进程的限流器
+        if _registry_pid != os.getpid():
+            _limiters.clear()
+            _registry_pid = os.getpid()
+        if key not in _limiters:
+            setting = rate_limits.get(model, default_rate_limit)
+            _limiters[key] = ModelLimiter(
+                rpm=setting.get("rpm"),
+                tpm=setting.get("tpm"),
+                max_concurrency=max_thread_num,
+            )
+        return _limiters[key]
+
+
+def call_with_limit(provider: str, model: str, tokens: int, fn):
+    """同步调用fn()，请求前限速，遇到429/503时退避重试"""
+    limiter = get_limiter(provider, model)
+    for attempt in range(throttle_retries + 1):
+        limiter.acquire_sync(tokens)
+        start = time.monotonic()
+        try:
+            result = fn()
+        except Exception as e:
+            if not is_throttle_error(e) or attempt == throttle_retries:
+                raise
+            limiter.on_throttle()
+            time.sleep(backoff_delay(attempt))
+            continue
+        limiter.on_success(time.monotonic() - start)
+        return result